@@ -1,16 +1,18 @@
 from app import db
 from datetime import datetime
+from money import MoneyType
 
 class Achat(db.Model):
     __tablename__ = 'achats'
     
     id = db.Column(db.Integer, primary_key=True)
     produit_id = db.Column(db.Integer, db.ForeignKey('produits.id'), nullable=False)
+    magasin_id = db.Column(db.Integer, db.ForeignKey('magasins.id'), index=True)  # None: magasin par défaut
     quantite = db.Column(db.Integer, nullable=False)
-    prix_unitaire = db.Column(db.Float, nullable=False)  # Prix d'achat en Ariary (MGA)
-    montant_total = db.Column(db.Float, nullable=False)  # Montant total en Ariary
+    prix_unitaire = db.Column(MoneyType, nullable=False)  # Prix d'achat en Ariary (MGA)
+    montant_total = db.Column(MoneyType, nullable=False)  # Montant total en Ariary
     fournisseur = db.Column(db.String(100))
-    date_achat = db.Column(db.DateTime, default=datetime.utcnow)
+    date_achat = db.Column(db.DateTime, default=datetime.utcnow, index=True)  # Clé de partition
     statut = db.Column(db.String(20), default='completed')  # completed, cancelled, pending
     notes = db.Column(db.Text)
     numero_facture = db.Column(db.String(50))
@@ -34,6 +36,7 @@ class Achat(db.Model):
             'fournisseur': self.fournisseur,
             'date_achat': self.date_achat.isoformat() if self.date_achat else None,
             'statut': self.statut,
+            'magasin_id': self.magasin_id,
             'notes': self.notes,
             'numero_facture': self.numero_facture
         }
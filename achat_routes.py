@@ -1,4 +1,4 @@
-from flask import Blueprint, render_template, request, redirect, url_for, flash, jsonify
+from flask import Blueprint, render_template, request, redirect, url_for, flash, jsonify, abort
 from flask_login import login_required
 from models.achat import Achat
 from models.produit import Produit
@@ -6,6 +6,9 @@ from services.achat_service import AchatService
 from app import db
 from datetime import datetime
 from utils.helpers import format_currency, get_date_range
+from cache import conditional_get
+from partitions import source, find
+from db_routing import current_store
 
 achat_bp = Blueprint('achat', __name__, url_prefix='/achats')
 
@@ -18,22 +21,23 @@ def list_achats():
         period = request.args.get('period', 'month', type=str)
         fournisseur = request.args.get('fournisseur', type=str)
         
-        # Construire la requête
-        query = Achat.query
+        # Construire la requête (archives comprises si la période les couvre)
+        date_debut, date_fin = get_date_range(period)
+        source_achats = source(Achat, date_debut, date_fin)
+        query = db.session.query(source_achats)
         
         # Filtrer par période
-        date_debut, date_fin = get_date_range(period)
         if date_debut and date_fin:
             query = query.filter(
-                Achat.date_achat >= datetime.combine(date_debut, datetime.min.time()),
-                Achat.date_achat <= datetime.combine(date_fin, datetime.max.time())
+                source_achats.date_achat >= datetime.combine(date_debut, datetime.min.time()),
+                source_achats.date_achat <= datetime.combine(date_fin, datetime.max.time())
             )
         
         # Filtrer par fournisseur
         if fournisseur:
-            query = query.filter(Achat.fournisseur.contains(fournisseur))
+            query = query.filter(source_achats.fournisseur.contains(fournisseur))
         
-        achats = query.order_by(db.desc(Achat.date_achat)).paginate(
+        achats = query.order_by(db.desc(source_achats.date_achat)).paginate(
             page=page, per_page=20, error_out=False
         )
         
@@ -93,7 +97,8 @@ def nouvel_achat():
             prix_unitaire=prix_unitaire,
             fournisseur=fournisseur if fournisseur else None,
             notes=notes if notes else None,
-            numero_facture=numero_facture if numero_facture else None
+            numero_facture=numero_facture if numero_facture else None,
+            magasin_id=current_store()
         )
         
         if achat:
@@ -115,7 +120,7 @@ def annuler_achat(id):
     try:
         reason = request.form.get('reason', '').strip()
         
-        success, message = AchatService.cancel_achat(id, reason)
+        success, message = AchatService.cancel_achat(id, reason, magasin_id=current_store())
         
         if success:
             flash(message, "success")
@@ -132,7 +137,7 @@ def annuler_achat(id):
 def detail_achat(id):
     """Retourne les détails d'un achat en JSON"""
     try:
-        achat = Achat.query.get_or_404(id)
+        achat = find(Achat, id) or abort(404)
         
         return jsonify({
             'achat': achat.to_dict(),
@@ -177,36 +182,22 @@ def statistiques_achats():
 
 @achat_bp.route('/api/daily-purchases')
 @login_required
+@conditional_get(tables=('achats',))
 def api_daily_purchases():
     """API pour les achats quotidiens (pour les graphiques)"""
     try:
         days = request.args.get('days', 7, type=int)
         daily_purchases = AchatService.calculate_daily_purchases(days)
         
-        # Transformer pour Chart.js
+        # Séries en colonnes (le style des graphiques est dans les gabarits)
         labels = list(daily_purchases.keys())
-        data_montant = [daily_purchases[date]['montant'] for date in labels]
-        data_transactions = [daily_purchases[date]['transactions'] for date in labels]
         
         return jsonify({
             'labels': labels,
-            'datasets': [
-                {
-                    'label': 'Montant (MGA)',
-                    'data': data_montant,
-                    'borderColor': 'rgb(255, 159, 64)',
-                    'backgroundColor': 'rgba(255, 159, 64, 0.2)',
-                    'tension': 0.1
-                },
-                {
-                    'label': 'Nombre de transactions',
-                    'data': data_transactions,
-                    'borderColor': 'rgb(153, 102, 255)',
-                    'backgroundColor': 'rgba(153, 102, 255, 0.2)',
-                    'tension': 0.1,
-                    'yAxisID': 'y1'
-                }
-            ]
+            'series': {
+                'montant': [daily_purchases[date]['montant'] for date in labels],
+                'transactions': [daily_purchases[date]['transactions'] for date in labels]
+            }
         })
         
     except Exception as e:
@@ -1,14 +1,25 @@
 from models.achat import Achat
 from models.produit import Produit
+from services.lot_service import LotService
+from services.magasin_service import MagasinService
 from app import db
+from db_routing import read_only, in_store, use_store, current_store
+from db_sqlite import serialized_write
+from cache import cached
+from partitions import source
+import metrics
+from events import publish, PurchaseCreated, PurchaseCancelled, ProductRepriced
+from money import Money
 from datetime import datetime, timedelta
 
 class AchatService:
     """Service pour la gestion des achats"""
     
     @staticmethod
+    @serialized_write
+    @in_store
     def create_achat(produit_id, quantite, prix_unitaire, fournisseur=None, notes=None, numero_facture=None):
-        """Crée un nouvel achat"""
+        """Crée un nouvel achat dans le magasin `magasin_id` (magasin par défaut si absent)"""
         produit = Produit.query.get(produit_id)
         
         if not produit:
@@ -17,6 +28,7 @@ class AchatService:
         # Créer l'achat
         achat = Achat()
         achat.produit_id = produit_id
+        achat.magasin_id = current_store()
         achat.quantite = quantite
         achat.prix_unitaire = prix_unitaire
         achat.fournisseur = fournisseur
@@ -29,19 +41,40 @@ class AchatService:
         try:
             # Sauvegarder l'achat
             db.session.add(achat)
+            stock = MagasinService.stock_row(produit)
             
-            # Mettre à jour le stock et le prix d'achat
+            # Ouvrir la couche de stock FIFO de cet achat (lots du magasin)
+            if LotService.fifo_active():
+                db.session.flush()
+                LotService.open_lot(achat, produit, stock.quantite)
+            
+            # Mettre à jour le stock du magasin, le stock global et le prix d'achat
+            stock.quantite += quantite
             produit.stock_actuel += quantite
+            ancien_prix_achat = produit.prix_achat
             
-            # Mettre à jour le prix d'achat moyen pondéré
+            # Mettre à jour le prix d'achat moyen pondéré (arrondi à l'Ariary)
             if produit.stock_actuel > quantite:  # Il y avait déjà du stock
-                ancienne_valeur = (produit.stock_actuel - quantite) * produit.prix_achat
-                nouvelle_valeur = quantite * prix_unitaire
+                ancienne_valeur = (produit.stock_actuel - quantite) * Money(produit.prix_achat)
+                nouvelle_valeur = quantite * achat.prix_unitaire
                 valeur_totale = ancienne_valeur + nouvelle_valeur
-                produit.prix_achat = valeur_totale / produit.stock_actuel
+                produit.prix_achat = valeur_totale.divide(produit.stock_actuel)
             else:  # Premier stock
-                produit.prix_achat = prix_unitaire
+                produit.prix_achat = achat.prix_unitaire
             
+            metrics.count_on_commit('achats_total')
+            db.session.flush()
+            publish(PurchaseCreated(
+                date=achat.date_achat, achat_id=achat.id, produit_id=produit.id, quantite=quantite,
+                montant_total=int(achat.montant_total), stock_restant=produit.stock_actuel,
+                seuil_alerte=produit.seuil_alerte, fournisseur=fournisseur, magasin_id=achat.magasin_id
+            ))
+            if produit.prix_achat != ancien_prix_achat:
+                publish(ProductRepriced(
+                    date=achat.date_achat, produit_id=produit.id,
+                    ancien_prix_achat=int(ancien_prix_achat), nouveau_prix_achat=int(produit.prix_achat),
+                    ancien_prix_vente=int(produit.prix_vente), nouveau_prix_vente=int(produit.prix_vente)
+                ))
             db.session.commit()
             return achat, "Achat créé avec succès"
             
@@ -52,33 +85,39 @@ class AchatService:
     @staticmethod
     def get_achats_by_period(date_debut=None, date_fin=None):
         """Retourne les achats pour une période donnée"""
-        query = Achat.query
+        achats = source(Achat, date_debut, date_fin)
+        query = db.session.query(achats)
         
         if date_debut:
-            query = query.filter(Achat.date_achat >= date_debut)
+            query = query.filter(achats.date_achat >= date_debut)
         if date_fin:
-            query = query.filter(Achat.date_achat <= date_fin)
+            query = query.filter(achats.date_achat <= date_fin)
         
-        return query.order_by(db.desc(Achat.date_achat)).all()
+        return query.order_by(db.desc(achats.date_achat)).all()
     
     @staticmethod
     def get_achats_by_product(produit_id):
         """Retourne les achats d'un produit"""
-        return Achat.query.filter_by(produit_id=produit_id).order_by(db.desc(Achat.date_achat)).all()
+        achats = source(Achat)
+        return db.session.query(achats).filter(achats.produit_id == produit_id).order_by(db.desc(achats.date_achat)).all()
     
     @staticmethod
     def get_achats_by_supplier(fournisseur):
         """Retourne les achats d'un fournisseur"""
-        return Achat.query.filter_by(fournisseur=fournisseur).order_by(db.desc(Achat.date_achat)).all()
+        achats = source(Achat)
+        return db.session.query(achats).filter(achats.fournisseur == fournisseur).order_by(db.desc(achats.date_achat)).all()
     
     @staticmethod
+    @cached(tables=('achats',))
+    @read_only
     def calculate_daily_purchases(days=7):
         """Calcule les achats quotidiens sur les derniers jours"""
         date_debut = datetime.utcnow() - timedelta(days=days)
+        source_achats = source(Achat, date_debut)
         
-        achats = Achat.query.filter(
-            Achat.date_achat >= date_debut,
-            Achat.statut == 'completed'
+        achats = db.session.query(source_achats).filter(
+            source_achats.date_achat >= date_debut,
+            source_achats.statut == 'completed'
         ).all()
         
         purchases_by_day = {}
@@ -96,21 +135,24 @@ class AchatService:
         return purchases_by_day
     
     @staticmethod
+    @cached(tables=('achats',))
+    @read_only
     def get_top_suppliers(limit=10, days=30):
         """Retourne les principaux fournisseurs"""
         date_debut = datetime.utcnow() - timedelta(days=days)
+        achats = source(Achat, date_debut)
         
         # Agrégation des achats par fournisseur
         results = db.session.query(
-            Achat.fournisseur,
-            db.func.sum(Achat.montant_total).label('total_montant'),
-            db.func.sum(Achat.quantite).label('total_quantite'),
-            db.func.count(Achat.id).label('nombre_achats')
+            achats.fournisseur,
+            db.func.sum(achats.montant_total).label('total_montant'),
+            db.func.sum(achats.quantite).label('total_quantite'),
+            db.func.count(achats.id).label('nombre_achats')
         ).filter(
-            Achat.date_achat >= date_debut,
-            Achat.statut == 'completed',
-            Achat.fournisseur.isnot(None)
-        ).group_by(Achat.fournisseur).order_by(db.desc('total_montant')).limit(limit).all()
+            achats.date_achat >= date_debut,
+            achats.statut == 'completed',
+            achats.fournisseur.isnot(None)
+        ).group_by(achats.fournisseur).order_by(db.desc('total_montant')).limit(limit).all()
         
         return [
             {
@@ -123,14 +165,17 @@ class AchatService:
         ]
     
     @staticmethod
+    @cached(tables=('achats', 'produits'))
+    @read_only
     def get_purchases_summary(date_debut=None, date_fin=None):
         """Retourne un résumé des achats"""
-        query = Achat.query.filter_by(statut='completed')
+        source_achats = source(Achat, date_debut, date_fin)
+        query = db.session.query(source_achats).filter(source_achats.statut == 'completed')
         
         if date_debut:
-            query = query.filter(Achat.date_achat >= date_debut)
+            query = query.filter(source_achats.date_achat >= date_debut)
         if date_fin:
-            query = query.filter(Achat.date_achat <= date_fin)
+            query = query.filter(source_achats.date_achat <= date_fin)
         
         achats = query.all()
         
@@ -153,28 +198,49 @@ class AchatService:
         }
     
     @staticmethod
-    def cancel_achat(achat_id, reason=None):
-        """Annule un achat et ajuste le stock"""
-        achat = Achat.query.get(achat_id)
+    @serialized_write
+    def cancel_achat(achat_id, reason=None, magasin_id=None):
+        """Annule un achat et ajuste le stock de son magasin
+        
+        `magasin_id` n'est requis que pour l'achat d'un magasin qui a sa propre base.
+        """
+        with use_store(magasin_id):
+            achat = Achat.query.get(achat_id)
         if not achat:
             return False, "Achat non trouvé"
         
         if achat.statut == 'cancelled':
             return False, "Achat déjà annulé"
         
+        with use_store(achat.magasin_id or MagasinService.default_store_id()):
+            return AchatService._annuler_achat(achat, reason)
+    
+    @staticmethod
+    def _annuler_achat(achat, reason):
+        """Annulation dans le contexte du magasin de l'achat"""
         try:
             # Ajuster le stock
             produit = achat.produit_rel
-            if produit.stock_actuel >= achat.quantite:
-                produit.stock_actuel -= achat.quantite
-            else:
-                return False, "Impossible d'annuler: stock insuffisant"
+            if MagasinService.get_stock(produit) < achat.quantite:
+                return False, "Impossible d'annuler: stock insuffisant dans ce magasin"
+            
+            # Retirer le lot FIFO et réaffecter les ventes qui l'avaient consommé
+            stock = MagasinService.stock_row(produit)
+            LotService.cancel_lot(achat, produit, stock.quantite)
+            stock.quantite -= achat.quantite
+            produit.stock_actuel -= achat.quantite
             
             # Marquer comme annulé
             achat.statut = 'cancelled'
             if reason:
                 achat.notes = f"Annulé: {reason}. {achat.notes or ''}"
             
+            publish(PurchaseCancelled(
+                date=datetime.utcnow(), achat_id=achat.id, produit_id=produit.id,
+                quantite=achat.quantite, montant_total=int(achat.montant_total),
+                stock_restant=produit.stock_actuel, seuil_alerte=produit.seuil_alerte, motif=reason,
+                magasin_id=achat.magasin_id
+            ))
             db.session.commit()
             return True, "Achat annulé avec succès"
             
@@ -1,5 +1,7 @@
 from models.produit import Produit
+from models.vente import Vente
 from services.stock_service import StockService
+from events import subscribe, SaleCreated
 from datetime import datetime, timedelta
 import logging
 
@@ -22,10 +24,14 @@ class AlerteService:
                 'produit_nom': produit.nom,
                 'stock_actuel': produit.stock_actuel,
                 'stock_minimum': produit.stock_minimum,
+                'point_commande': produit.point_commande,
+                'quantite_commande_suggeree': produit.quantite_commande_suggeree or 0,
                 'message': f"Stock {niveau_alerte} pour {produit.nom}: {produit.stock_actuel} unités restantes",
                 'date_alerte': datetime.utcnow(),
                 'urgent': produit.stock_actuel == 0
             }
+            if alerte['quantite_commande_suggeree'] > 0:
+                alerte['message'] += f" (commande suggérée: {alerte['quantite_commande_suggeree']} unités)"
             alertes.append(alerte)
         
         return alertes
@@ -90,8 +96,8 @@ class AlerteService:
         for produit in produits:
             # Vérifier si le produit a été vendu dans les 30 derniers jours
             ventes_recentes = produit.ventes.filter(
-                produit.ventes.c.date_vente >= date_limite,
-                produit.ventes.c.statut == 'completed'
+                Vente.date_vente >= date_limite,
+                Vente.statut == 'completed'
             ).count()
             
             if ventes_recentes == 0 and produit.stock_actuel > 0:
@@ -132,8 +138,11 @@ class AlerteService:
     @staticmethod
     def get_alerts_summary():
         """Retourne un résumé des alertes"""
-        alertes = AlerteService.get_all_alerts()
-        
+        return AlerteService.summarize_alerts(AlerteService.get_all_alerts())
+    
+    @staticmethod
+    def summarize_alerts(alertes):
+        """Résume une liste d'alertes déjà calculée"""
         summary = {
             'total_alertes': len(alertes),
             'alertes_urgentes': len([a for a in alertes if a.get('urgent', False)]),
@@ -185,3 +194,19 @@ class AlerteService:
             'urgent': alerte.get('urgent', False),
             'date': alerte['date_alerte'].strftime('%d/%m/%Y %H:%M')
         }
+
+@subscribe(SaleCreated)
+def _alerter_stock_faible(evenement):
+    """Journalise l'alerte de stock faible d'une vente, hors de la transaction de caisse"""
+    if evenement.stock_restant > evenement.seuil_alerte:
+        return
+    niveau_alerte = "critique" if evenement.stock_restant <= 0 else "faible"
+    AlerteService.log_alert({
+        'type': 'stock_faible',
+        'niveau': niveau_alerte,
+        'produit_id': evenement.produit_id,
+        'message': f"Stock {niveau_alerte} pour le produit {evenement.produit_id} après la vente "
+                   f"{evenement.vente_id}: {evenement.stock_restant} unités restantes",
+        'date_alerte': evenement.date,
+        'urgent': evenement.stock_restant <= 0
+    })
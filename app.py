@@ -1,63 +1,318 @@
 import os
 import logging
+import threading
+import weakref
+import click
 from flask import Flask
 from flask_sqlalchemy import SQLAlchemy
 from flask_login import LoginManager
 from sqlalchemy.orm import DeclarativeBase
 from werkzeug.middleware.proxy_fix import ProxyFix
-
-# Configure logging
-logging.basicConfig(level=logging.DEBUG)
+from config import Config
+from db_routing import RoutingSession, REPLICA_BIND_KEY, store_bind_key
+from db_sqlite import configure_sqlite_engine
 
 class Base(DeclarativeBase):
     pass
 
-db = SQLAlchemy(model_class=Base)
-
-# Create the app
-app = Flask(__name__)
-app.secret_key = os.environ.get("SESSION_SECRET", "dev-secret-key-change-in-production")
-app.wsgi_app = ProxyFix(app.wsgi_app, x_proto=1, x_host=1)
+db = SQLAlchemy(model_class=Base, session_options={"class_": RoutingSession})
 
-# Configure the database
-app.config["SQLALCHEMY_DATABASE_URI"] = os.environ.get("DATABASE_URL", "sqlite:///gestion_commerciale.db")
-app.config["SQLALCHEMY_ENGINE_OPTIONS"] = {
-    "pool_recycle": 300,
-    "pool_pre_ping": True,
-}
+# Applications dont les connexions héritées sont abandonnées après un fork (sans les retenir)
+_applications = weakref.WeakSet()
+_verrou_fork = threading.Lock()
+_hook_fork_enregistre = False
 
-# Initialize extensions
-db.init_app(app)
 login_manager = LoginManager()
-login_manager.init_app(app)
 login_manager.login_view = 'main.login'  # type: ignore
 
-# Import models to ensure tables are created
-from models.client import Client
-from models.produit import Produit  
-from models.vente import Vente
-from models.achat import Achat
-
 @login_manager.user_loader
 def load_user(user_id):
-    return Client.query.get(int(user_id))
-
-# Register blueprints
-from google_auth import google_auth
-from routes.main_routes import main_bp
-from routes.produit_routes import produit_bp
-from routes.vente_routes import vente_bp
-from routes.achat_routes import achat_bp
-from routes.client_routes import client_bp
-from routes.statistique_routes import statistique_bp
-
-app.register_blueprint(google_auth)
-app.register_blueprint(main_bp)
-app.register_blueprint(produit_bp)
-app.register_blueprint(vente_bp)
-app.register_blueprint(achat_bp)
-app.register_blueprint(client_bp)
-app.register_blueprint(statistique_bp)
-
-with app.app_context():
+    from utils.auth import AuthUtils
+    return AuthUtils.load_principal(int(user_id))
+
+def create_app(config=Config):
+    """Crée et configure l'application
+
+    Aucun effet de bord à l'import du module: la base n'est touchée ni ici
+    ni à l'import (schéma géré par `flask creer-schema`, ou AUTO_CREATE_SCHEMA
+    en développement) et les blueprints ne sont importés qu'à l'enregistrement.
+    """
+    app = Flask(__name__)
+    app.config.from_object(config)
+    app.secret_key = config.SECRET_KEY
+    # Un proxy inverse devant l'application: adresse du client réel (X-Forwarded-For) pour la limitation de débit
+    app.wsgi_app = ProxyFix(app.wsgi_app, x_for=1, x_proto=1, x_host=1)
+
+    logging.basicConfig(level=getattr(logging, config.LOG_LEVEL.upper(), logging.INFO))
+
+    # Configure the database (options selon le type de base)
+    app.config["SQLALCHEMY_ENGINE_OPTIONS"] = engine_options(config, config.SQLALCHEMY_DATABASE_URI)
+
+    # Réplique de lecture optionnelle pour les rapports
+    binds = {}
+    if config.DATABASE_READ_URL:
+        binds[REPLICA_BIND_KEY] = {"url": config.DATABASE_READ_URL, **engine_options(config, config.DATABASE_READ_URL)}
+
+    # Bases dédiées aux transactions de certains magasins
+    for magasin_id, url in config.STORE_DATABASES.items():
+        binds[store_bind_key(magasin_id)] = {"url": url, **engine_options(config, url)}
+    if binds:
+        app.config["SQLALCHEMY_BINDS"] = binds
+
+    # Initialize extensions
+    db.init_app(app)
+    login_manager.init_app(app)
+
+    if config.SQLITE_PRODUCTION:
+        with app.app_context():
+            for engine in db.engines.values():
+                if engine.dialect.name == 'sqlite':
+                    configure_sqlite_engine(engine, app.config)
+
+    _register_models()
+    _register_blueprints(app)
+    register_commands(app)
+
+    # Compression des réponses selon Accept-Encoding
+    from compression import init_compression
+    init_compression(app)
+    
+    # Métriques Prometheus (/metrics), agrégées entre workers
+    from metrics import init_metrics
+    init_metrics(app)
+    
+    # Abonnés aux événements métier (distribués après commit)
+    from events import init_events
+    init_events(app)
+
+    # Profilage à la demande (aucun hook si PROFILING_ENABLED est faux)
+    from profiling import init_profiling
+    init_profiling(app)
+
+    # Connexions héritées d'un processus parent (gunicorn --preload): jamais partagées
+    _applications.add(app)
+    _register_fork_hook()
+
+    if config.AUTO_CREATE_SCHEMA:
+        with app.app_context():
+            create_schema()
+
+    return app
+
+def engine_options(config, url):
+    """Options du moteur SQLAlchemy pour le type de base de l'URL"""
+    dialecte = url.split(':', 1)[0].split('+', 1)[0]
+    return dict(config.ENGINE_OPTIONS.get(dialecte, config.ENGINE_OPTIONS['defaut']))
+
+def _register_models():
+    """Importe les modèles pour que leurs tables soient connues des métadonnées"""
+    from models.client import Client
+    from models.produit import Produit
+    from models.vente import Vente
+    from models.achat import Achat
+    from models.lot_stock import LotStock, ConsommationLot
+    from models.tache import Tache
+    from models.magasin import Magasin, StockMagasin
+
+def _register_blueprints(app):
+    from google_auth import google_auth
+    from routes.main_routes import main_bp
+    from routes.produit_routes import produit_bp
+    from routes.vente_routes import vente_bp
+    from routes.achat_routes import achat_bp
+    from routes.client_routes import client_bp
+    from routes.statistique_routes import statistique_bp
+    from routes.tache_routes import tache_bp
+    from routes.profilage_routes import profilage_bp
+    from routes.magasin_routes import magasin_bp
+
+    app.register_blueprint(google_auth)
+    app.register_blueprint(main_bp)
+    app.register_blueprint(produit_bp)
+    app.register_blueprint(vente_bp)
+    app.register_blueprint(achat_bp)
+    app.register_blueprint(client_bp)
+    app.register_blueprint(statistique_bp)
+    app.register_blueprint(tache_bp)
+    app.register_blueprint(profilage_bp)
+    app.register_blueprint(magasin_bp)
+
+def _register_fork_hook():
+    """Enregistre une seule fois, pour tout le processus, l'abandon des connexions après un fork"""
+    global _hook_fork_enregistre
+    if not hasattr(os, 'register_at_fork'):
+        return
+    with _verrou_fork:
+        if not _hook_fork_enregistre:
+            os.register_at_fork(after_in_child=_dispose_all_engines)
+            _hook_fork_enregistre = True
+
+def _dispose_all_engines():
+    for app in list(_applications):
+        _dispose_engines(app)
+
+def _dispose_engines(app):
+    """Abandonne, sans les fermer, les connexions du pool héritées du processus parent"""
+    with app.app_context():
+        for engine in db.engines.values():
+            engine.dispose(close=False)
+
+def create_schema():
+    """Crée les tables manquantes, celles des bases de magasins et le magasin par défaut
+
+    Les tables existantes reçoivent les colonnes ajoutées depuis au modèle.
+    Retourne les magasins dont la base dédiée a été préparée et les colonnes
+    ajoutées ({table: [colonnes]}).
+    """
+    from services.magasin_service import MagasinService
     db.create_all()
+    magasins = _create_store_schemas()
+    colonnes = _add_missing_model_columns()
+    MagasinService.ensure_default_store()
+    return magasins, colonnes
+
+def _create_store_schemas():
+    """Crée les tables de transactions dans les bases dédiées des magasins"""
+    from flask import current_app
+    from db_routing import create_store_schema
+    magasins = list(current_app.config['STORE_DATABASES'])
+    for magasin_id in magasins:
+        create_store_schema(db.engines[store_bind_key(magasin_id)])
+    return magasins
+
+def _add_missing_model_columns():
+    """Ajoute les colonnes manquantes à toutes les tables du modèle, bases de magasins comprises"""
+    from flask import current_app
+    from sqlalchemy import inspect
+    from db_routing import STORE_TABLES
+
+    bases = [(None, db.engine, db.metadata.sorted_tables)]
+    bases += [(magasin_id, db.engines[store_bind_key(magasin_id)],
+               [db.metadata.tables[nom] for nom in sorted(STORE_TABLES)])
+              for magasin_id in current_app.config['STORE_DATABASES']]
+    ajoutees = {}
+    for magasin_id, engine, tables in bases:
+        inspecteur = inspect(engine)
+        for table in tables:
+            if not inspecteur.has_table(table.name):
+                continue
+            colonnes = _add_missing_columns(table, engine)
+            if colonnes:
+                cle = table.name if magasin_id is None else f"{table.name} (magasin {magasin_id})"
+                ajoutees[cle] = colonnes
+    return ajoutees
+
+def _add_missing_columns(table, engine=None):
+    """Ajoute les colonnes du modèle absentes d'une table existante (ALTER TABLE ADD COLUMN)"""
+    from sqlalchemy import inspect, text
+    from sqlalchemy.schema import CreateColumn
+
+    with (engine or db.engine).begin() as connexion:
+        existantes = {colonne['name'] for colonne in inspect(connexion).get_columns(table.name)}
+        ajoutees = [colonne for colonne in table.columns if colonne.name not in existantes]
+        for colonne in ajoutees:
+            ddl = CreateColumn(colonne).compile(dialect=connexion.dialect)
+            connexion.execute(text(f"ALTER TABLE {table.name} ADD COLUMN {ddl}"))
+    return [colonne.name for colonne in ajoutees]
+
+def register_commands(app):
+    """Commandes CLI de maintenance"""
+
+    @app.cli.command('creer-schema')
+    def creer_schema():
+        """Crée les tables et colonnes manquantes (et celles des bases de magasins)"""
+        magasins, colonnes = create_schema()
+        print("Schéma de la base créé")
+        for magasin_id in magasins:
+            print(f"Tables de transactions créées dans la base du magasin {magasin_id}")
+        for table, noms in colonnes.items():
+            print(f"Colonnes ajoutées à {table}: {', '.join(noms)}")
+
+    @app.cli.command('recalculer-previsions')
+    def recalculer_previsions():
+        """Recalcule les prévisions de demande et points de commande (tâche nocturne)"""
+        from services.prevision_service import PrevisionService
+        nombre = PrevisionService.recompute_all()
+        print(f"Prévisions recalculées pour {nombre} produits")
+
+    @app.cli.command('classer-abc')
+    @click.option('--jours', default=365, help="Période d'analyse en jours")
+    def classer_abc(jours):
+        """Recalcule le classement ABC des produits"""
+        from datetime import datetime, timedelta
+        from services.statistique_service import StatistiqueService
+        resultat = StatistiqueService.compute_abc_classification(datetime.utcnow() - timedelta(days=jours))
+        for classe, stats in resultat['classes'].items():
+            print(f"Classe {classe}: {stats['nombre_produits']} produits, {stats['part_ca']:.1f}% du CA")
+
+    @app.cli.command('purger-taches')
+    def purger_taches():
+        """Supprime les résultats de tâches expirés"""
+        from services.tache_service import TacheService
+        print(f"{TacheService.purge_expired()} tâches supprimées")
+
+    @app.cli.command('partitionner')
+    def partitionner():
+        """Partitionne ventes et achats par mois (PostgreSQL) ou crée les archives (SQLite)"""
+        from partitions import partition_tables
+        tables = partition_tables()
+        print(f"Tables préparées: {', '.join(tables) or 'aucune (déjà partitionnées)'}")
+
+    @app.cli.command('archiver')
+    @click.option('--exercices-conserves', default=None, type=int, help="Exercices clos gardés en table vive")
+    @click.option('--taille-lot', default=None, type=int, help="Lignes déplacées par transaction")
+    def archiver(exercices_conserves, taille_lot):
+        """Crée les partitions à venir (PostgreSQL) ou archive les exercices clos (SQLite)"""
+        from partitions import ensure_partitions, archive_closed_years
+        if db.engine.dialect.name == 'postgresql':
+            with db.engine.begin() as connexion:
+                print(f"{ensure_partitions(connexion)} partitions créées")
+        else:
+            for table, nombre in archive_closed_years(exercices_conserves, taille_lot).items():
+                print(f"{table}: {nombre} lignes archivées")
+
+    @app.cli.command('migrer-montants')
+    def migrer_montants():
+        """Convertit les montants flottants existants en Ariary entiers"""
+        from money import migrate_money_columns
+        migrees = migrate_money_columns()
+        for table, colonnes in migrees.items():
+            print(f"{table}: {', '.join(colonnes)}")
+        if not migrees:
+            print("Montants déjà stockés en entiers")
+
+    @app.cli.command('recalculer-cumuls')
+    def recalculer_cumuls():
+        """Recalcule les cumuls de ventes des produits (ajoute les colonnes au besoin)"""
+        from models.produit import Produit
+        from services.vente_service import VenteService
+        ajoutees = _add_missing_columns(Produit.__table__)
+        if ajoutees:
+            print(f"Colonnes ajoutées à produits: {', '.join(ajoutees)}")
+        print(f"Cumuls recalculés pour {VenteService.recompute_product_totals()} produits")
+
+    @app.cli.command('initialiser-magasins')
+    def initialiser_magasins():
+        """Prépare une base existante pour les magasins (colonnes, magasin par défaut, stocks)"""
+        from services.magasin_service import MagasinService
+        resume = MagasinService.initialize_stores()
+        for table, colonnes in resume['colonnes'].items():
+            print(f"Colonnes ajoutées à {table}: {', '.join(colonnes)}")
+        for magasin_id in resume['bases_dediees']:
+            print(f"Tables de transactions créées dans la base du magasin {magasin_id}")
+        print(f"{resume['stocks_crees']} stocks du magasin par défaut créés, "
+              f"{resume['lignes_rattachees']} transactions rattachées")
+
+    @app.cli.command('reconcilier-stocks')
+    def reconcilier_stocks():
+        """Recalcule le stock global des produits depuis les stocks des magasins"""
+        from services.magasin_service import MagasinService
+        print(f"Stock global corrigé pour {MagasinService.reconcile_product_stock()} produits")
+
+    @app.cli.command('jeton-profilage')
+    @click.option('--mode', type=click.Choice(['cprofile', 'echantillonnage']), default='cprofile')
+    @click.option('--duree', default=None, type=int, help="Validité en secondes")
+    def jeton_profilage(mode, duree):
+        """Affiche un en-tête X-Profil signé pour profiler des requêtes"""
+        from profiling import generate_token
+        print(f"X-Profil: {generate_token(mode, duree)}")
@@ -1,6 +1,24 @@
+import time
 from functools import wraps
-from flask import redirect, url_for, flash
-from flask_login import current_user
+from flask import redirect, url_for, flash, request, abort, current_app
+from flask_login import UserMixin, current_user
+from cache_backend import get_backend
+
+class Principal(UserMixin):
+    """Identité de l'utilisateur connecté, en lecture seule et sans accès à la base"""
+    
+    __slots__ = ('id', 'nom', 'email')
+    
+    def __init__(self, id, nom, email):
+        object.__setattr__(self, 'id', id)
+        object.__setattr__(self, 'nom', nom)
+        object.__setattr__(self, 'email', email)
+    
+    def __setattr__(self, nom, valeur):
+        raise AttributeError("Principal est en lecture seule")
+    
+    def __repr__(self):
+        return f'<Principal {self.nom}>'
 
 class AuthUtils:
     """Utilitaires pour l'authentification"""
@@ -25,11 +43,56 @@ class AuthUtils:
                 flash('Veuillez vous connecter pour accéder à cette page.', 'warning')
                 return redirect(url_for('main.login'))
             
-            # Pour l'instant, tous les utilisateurs authentifiés sont admins
-            # Cette logique peut être étendue plus tard
+            # Sans liste ADMIN_EMAILS, tous les utilisateurs authentifiés sont admins
+            admins = current_app.config['ADMIN_EMAILS']
+            if admins and current_user.email not in admins:
+                abort(403)
             return f(*args, **kwargs)
         return decorated_function
     
+    @staticmethod
+    def rate_limit(portee, limite=None, fenetre=None):
+        """Décorateur limitant le nombre d'appels par adresse IP sur une fenêtre fixe
+        
+        Sans limite ni fenêtre explicites: LOGIN_RATE_LIMIT et LOGIN_RATE_WINDOW
+        de la configuration de l'application, lus à chaque appel.
+        L'adresse est celle du client derrière le proxy (ProxyFix x_for).
+        Le compteur vit dans le stockage de cache partagé: la limite s'applique
+        à l'ensemble des workers.
+        """
+        def decorator(f):
+            @wraps(f)
+            def decorated_function(*args, **kwargs):
+                duree = fenetre or current_app.config['LOGIN_RATE_WINDOW']
+                maximum = limite or current_app.config['LOGIN_RATE_LIMIT']
+                periode = int(time.time() // duree)
+                cle = f"debit:{portee}:{request.remote_addr}:{periode}"
+                if get_backend().incr(cle, ttl=duree) > maximum:
+                    flash('Trop de tentatives. Veuillez réessayer dans quelques instants.', 'error')
+                    return redirect(url_for('main.login'))
+                return f(*args, **kwargs)
+            return decorated_function
+        return decorator
+    
+    @staticmethod
+    def load_principal(client_id):
+        """Charge l'identité d'un client, mise en cache quelques instants"""
+        cle = f"utilisateur:{client_id}"
+        trouve, identite = get_backend().get(cle)
+        if not trouve:
+            from models.client import Client
+            client = Client.query.get(client_id)
+            if client is None:
+                return None
+            identite = {'id': client.id, 'nom': client.nom, 'email': client.email}
+            get_backend().set(cle, identite, ttl=current_app.config['USER_CACHE_TTL'])
+        return Principal(**identite)
+    
+    @staticmethod
+    def invalidate_principal(client_id):
+        """Retire l'identité d'un client du cache après modification"""
+        get_backend().delete(f"utilisateur:{client_id}")
+    
     @staticmethod
     def get_current_user_info():
         """Retourne les informations de l'utilisateur courant"""
@@ -0,0 +1,361 @@
+"""Test de charge HTTP: utilisateurs virtuels concurrents sur les vraies routes
+
+Rejoue un mélange pondéré de lectures (tableau de bord, liste des ventes,
+API des graphiques, exports) et d'écritures (ventes, achats), soit dans le
+processus via le client WSGI, soit contre un serveur (gunicorn local lancé
+par le banc avec --gunicorn, ou --url). La connexion Google est remplacée
+par un cookie de session signé avec la clé de l'application.
+
+Rapporte par route: débit, latences p50/p95/p99 et taux d'erreurs (dont
+les erreurs de verrou de la base), et compare à une référence.
+
+    python bench_charge.py --echelle 100k --utilisateurs 20 --duree 60 [--gunicorn 4] [--ecritures 0.2]
+
+Code de sortie 1 si une route régresse par rapport à la référence.
+"""
+import sys
+import json
+import time
+import random
+import socket
+import logging
+import argparse
+import itertools
+import platform
+import threading
+import statistics
+import subprocess
+from http.cookies import SimpleCookie
+from generer_donnees import ECHELLES, create_bench_app, generate
+
+REFERENCE = 'bench_charge_reference.json'
+
+# (nom, méthode, chemin, poids, écriture)
+SCENARIO = [
+    ('tableau_de_bord', 'GET', '/dashboard', 10, False),
+    ('liste_ventes', 'GET', '/ventes/', 15, False),
+    ('api_ventes_quotidiennes', 'GET', '/ventes/api/daily-sales?days=30', 15, False),
+    ('api_achats_quotidiens', 'GET', '/achats/api/daily-purchases?days=30', 8, False),
+    ('api_evolution_mensuelle', 'GET', '/statistiques/api/monthly-evolution', 8, False),
+    ('api_top_produits', 'GET', '/statistiques/api/top-products', 8, False),
+    ('export_clients', 'GET', '/clients/export', 2, False),
+    ('export_statistiques', 'GET', '/statistiques/export?format=csv', 2, False),
+    ('nouvelle_vente', 'POST', '/ventes/nouvelle', 8, True),
+    ('nouvel_achat', 'POST', '/achats/nouveau', 2, True),
+]
+
+# Messages des erreurs de verrou selon la base
+MOTIFS_VERROU = (
+    'database is locked', 'database table is locked', 'could not obtain lock',
+    'deadlock detected', 'lock timeout', 'could not serialize access',
+)
+
+class WsgiTransport:
+    """Requêtes dans le processus, via le client de test Flask"""
+
+    def __init__(self, application):
+        self.client = application.test_client(use_cookies=False)
+
+    def request(self, methode, chemin, en_tetes, donnees):
+        reponse = self.client.open(chemin, method=methode, headers=en_tetes, data=donnees)
+        return (reponse.status_code, reponse.get_data(), reponse.headers.getlist('Set-Cookie'),
+                reponse.headers.get('ETag'))
+
+class HttpTransport:
+    """Requêtes HTTP vers un serveur (connexion persistante par utilisateur)"""
+
+    def __init__(self, url):
+        import requests
+
+        self.url = url.rstrip('/')
+        self.session = requests.Session()
+
+    def request(self, methode, chemin, en_tetes, donnees):
+        reponse = self.session.request(methode, self.url + chemin, headers=en_tetes, data=donnees,
+                                       allow_redirects=False, timeout=60)
+        # Le cookie de session est géré par l'utilisateur virtuel
+        self.session.cookies.clear()
+        return (reponse.status_code, reponse.content, reponse.raw.headers.getlist('Set-Cookie'),
+                reponse.headers.get('ETag'))
+
+class VirtualUser(threading.Thread):
+    """Utilisateur connecté qui enchaîne les actions du scénario"""
+
+    def __init__(self, transport, serialiseur, client_id, donnees, poids, fin, pause, graine):
+        super().__init__(daemon=True)
+        self.transport = transport
+        self.serialiseur = serialiseur
+        self.donnees = donnees
+        self.poids = poids
+        self.fin = fin
+        self.pause = pause
+        self.rng = random.Random(graine)
+        # Connexion simulée: session Flask-Login signée avec la clé de l'application
+        self.cookie = serialiseur.dumps({'_user_id': str(client_id), '_fresh': True})
+        self.etags = {}
+        self.mesures = []
+
+    def run(self):
+        while not self.fin():
+            nom, methode, chemin, _, ecriture = self.rng.choices(SCENARIO, weights=self.poids)[0]
+            self.mesures.append((nom,) + self.execute(methode, chemin, ecriture))
+            if self.pause:
+                time.sleep(self.rng.expovariate(1 / self.pause))
+
+    def execute(self, methode, chemin, ecriture):
+        """Retourne (durée en s, résultat): ok, refus, erreur ou verrou"""
+        en_tetes = {'Cookie': f'session={self.cookie}', 'Accept-Encoding': 'gzip, br'}
+        # Les graphiques revalident leur copie comme le ferait le navigateur
+        if chemin in self.etags:
+            en_tetes['If-None-Match'] = self.etags[chemin]
+
+        donnees = self.form() if chemin == '/ventes/nouvelle' else self.purchase_form() if ecriture else None
+        debut = time.perf_counter()
+        try:
+            statut, corps, cookies, etag = self.transport.request(methode, chemin, en_tetes, donnees)
+        except Exception as e:
+            return time.perf_counter() - debut, 'verrou' if _erreur_verrou(str(e)) else 'erreur'
+        duree = time.perf_counter() - debut
+        if etag and methode == 'GET':
+            self.etags[chemin] = etag
+
+        messages = self.take_flashes(cookies)
+        if statut >= 500:
+            return duree, 'verrou' if _erreur_verrou(corps.decode('utf-8', 'replace')) else 'erreur'
+        if statut >= 400:
+            return duree, 'erreur'
+        for categorie, message in messages:
+            if categorie == 'error':
+                if _erreur_verrou(message):
+                    return duree, 'verrou'
+                # Refus métier (stock insuffisant, validation): pas une erreur du serveur
+                return duree, 'refus' if message.startswith('Stock insuffisant') else 'erreur'
+        return duree, 'ok'
+
+    def form(self):
+        produit_id = self.rng.choices(self.donnees['produits'], cum_weights=self.donnees['poids_produits'])[0]
+        return {
+            'produit_id': produit_id,
+            'client_id': self.rng.choice(self.donnees['clients']),
+            'quantite': self.rng.choice([1, 1, 1, 2, 3]),
+            'remise': 0,
+        }
+
+    def purchase_form(self):
+        produit_id = self.rng.choices(self.donnees['produits'], cum_weights=self.donnees['poids_produits'])[0]
+        return {
+            'produit_id': produit_id,
+            'quantite': self.rng.choice([20, 50, 100]),
+            'prix_unitaire': self.donnees['prix_achat'][produit_id],
+            'fournisseur': 'Fournisseur Banc',
+        }
+
+    def take_flashes(self, en_tetes_cookies):
+        """Met à jour le cookie de session et en retire les messages flash"""
+        for en_tete in en_tetes_cookies:
+            cookie = SimpleCookie()
+            cookie.load(en_tete)
+            if 'session' in cookie and cookie['session'].value:
+                self.cookie = cookie['session'].value
+
+        session = self.serialiseur.loads(self.cookie)
+        messages = session.pop('_flashes', [])
+        if messages:
+            self.cookie = self.serialiseur.dumps(session)
+        return messages
+
+def _erreur_verrou(texte):
+    texte = texte.lower()
+    return any(motif in texte for motif in MOTIFS_VERROU)
+
+def mix_weights(ecritures=None):
+    """Poids du scénario; `ecritures` fixe la part des écritures (0 à 1)"""
+    poids = [action[3] for action in SCENARIO]
+    if ecritures is None:
+        return poids
+    total_lectures = sum(p for p, action in zip(poids, SCENARIO) if not action[4])
+    total_ecritures = sum(p for p, action in zip(poids, SCENARIO) if action[4])
+    return [
+        p / total_ecritures * ecritures if action[4] else p / total_lectures * (1 - ecritures)
+        for p, action in zip(poids, SCENARIO)
+    ]
+
+def load_reference_data():
+    """Identifiants utilisés par les formulaires (produits pondérés par leurs ventes)"""
+    from app import db
+    from models.vente import Vente
+    from models.client import Client
+    from models.produit import Produit
+
+    ventes_par_produit = dict(db.session.query(Vente.produit_id, db.func.count(Vente.id)).group_by(Vente.produit_id).all())
+    produits = db.session.query(Produit.id, Produit.prix_achat).filter(Produit.actif == True).all()
+    return {
+        'produits': [p.id for p in produits],
+        'poids_produits': list(itertools.accumulate(ventes_par_produit.get(p.id, 0) + 1 for p in produits)),
+        'prix_achat': {p.id: int(p.prix_achat) for p in produits},
+        'clients': [c.id for c in db.session.query(Client.id).all()],
+    }
+
+def start_gunicorn(workers, base):
+    """Lance un gunicorn local sur la base du banc; retourne (processus, url)"""
+    import os
+
+    with socket.socket() as s:
+        s.bind(('127.0.0.1', 0))
+        port = s.getsockname()[1]
+
+    env = dict(os.environ, DATABASE_URL=base, DATABASE_READ_URL='', GUNICORN_BIND=f'127.0.0.1:{port}',
+               WEB_CONCURRENCY=str(workers), LOG_LEVEL='WARNING')
+    processus = subprocess.Popen([sys.executable, '-m', 'gunicorn', 'main:app'], env=env)
+
+    limite = time.time() + 30
+    while time.time() < limite:
+        if processus.poll() is not None:
+            raise RuntimeError("gunicorn s'est arrêté au démarrage")
+        try:
+            socket.create_connection(('127.0.0.1', port), timeout=0.5).close()
+            return processus, f'http://127.0.0.1:{port}'
+        except OSError:
+            time.sleep(0.2)
+    processus.terminate()
+    raise RuntimeError("gunicorn n'a pas démarré en 30 s")
+
+def percentile(valeurs, p):
+    valeurs = sorted(valeurs)
+    return valeurs[min(len(valeurs) - 1, int(round(p / 100 * (len(valeurs) - 1))))]
+
+def summarize(mesures, duree):
+    """Agrège les mesures par route: débit, latences (ms) et taux d'erreurs"""
+    par_route = {}
+    for nom, temps, resultat in mesures:
+        par_route.setdefault(nom, []).append((temps, resultat))
+    par_route['total'] = [(temps, resultat) for _, temps, resultat in mesures]
+
+    resume = {}
+    for nom, lignes in par_route.items():
+        temps = [t * 1000 for t, _ in lignes]
+        resultats = [r for _, r in lignes]
+        resume[nom] = {
+            'requetes': len(lignes),
+            'debit': len(lignes) / duree,
+            'p50_ms': percentile(temps, 50),
+            'p95_ms': percentile(temps, 95),
+            'p99_ms': percentile(temps, 99),
+            'moyenne_ms': statistics.fmean(temps),
+            'taux_erreur': (resultats.count('erreur') + resultats.count('verrou')) / len(lignes),
+            'erreurs_verrou': resultats.count('verrou'),
+            'refus': resultats.count('refus'),
+        }
+    return resume
+
+def run(echelle='10k', base=None, utilisateurs=10, duree=30, ecritures=None, pause=0.0,
+        gunicorn=None, url=None, graine=42):
+    """Exécute le test de charge et retourne (métadonnées, résumé par route)"""
+    from app import db
+    from models.vente import Vente
+
+    base = base or f'sqlite:///bench_{echelle}.db'
+    application = create_bench_app(base)
+    logging.getLogger().setLevel(logging.WARNING)
+    with application.app_context():
+        if db.session.query(Vente.id).first() is None:
+            generate(ECHELLES[echelle])
+        donnees = load_reference_data()
+        ventes = db.session.query(db.func.count(Vente.id)).scalar()
+
+    serialiseur = application.session_interface.get_signing_serializer(application)
+    processus = None
+    if gunicorn:
+        processus, url = start_gunicorn(gunicorn, base)
+
+    try:
+        poids = mix_weights(ecritures)
+        rng = random.Random(graine)
+        fin_prevue = time.perf_counter() + duree
+        fin = lambda: time.perf_counter() >= fin_prevue
+        liste = [
+            VirtualUser(HttpTransport(url) if url else WsgiTransport(application), serialiseur,
+                        rng.choice(donnees['clients']), donnees, poids, fin, pause, graine + i)
+            for i in range(utilisateurs)
+        ]
+        debut = time.perf_counter()
+        for utilisateur in liste:
+            utilisateur.start()
+        for utilisateur in liste:
+            utilisateur.join()
+        duree_reelle = time.perf_counter() - debut
+    finally:
+        if processus:
+            processus.terminate()
+            processus.wait(timeout=30)
+
+    meta = {
+        'echelle': echelle,
+        'ventes': ventes,
+        'mode': f'gunicorn ({gunicorn} workers)' if gunicorn else 'http' if url else 'wsgi',
+        'utilisateurs': utilisateurs,
+        'ecritures': ecritures,
+        'duree': duree_reelle,
+        'python': platform.python_version(),
+    }
+    return meta, summarize([m for u in liste for m in u.mesures], duree_reelle)
+
+def compare(resume, reference, seuil=0.2):
+    """Régressions de latence p95 ou de taux d'erreur: [(route, mesure, avant, après)]"""
+    regressions = []
+    for nom, mesures in resume.items():
+        avant = reference.get(nom)
+        if not avant:
+            continue
+        if mesures['p95_ms'] > avant['p95_ms'] * (1 + seuil) and mesures['p95_ms'] - avant['p95_ms'] > 5:
+            regressions.append((nom, 'p95_ms', avant['p95_ms'], mesures['p95_ms']))
+        if mesures['taux_erreur'] > avant['taux_erreur'] + 0.01:
+            regressions.append((nom, 'taux_erreur', avant['taux_erreur'], mesures['taux_erreur']))
+    return regressions
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--echelle', choices=ECHELLES, default='10k')
+    parser.add_argument('--base', help="URL de la base (sqlite:///bench_<echelle>.db par défaut, générée au besoin)")
+    parser.add_argument('--utilisateurs', type=int, default=10, help="Utilisateurs virtuels concurrents")
+    parser.add_argument('--duree', type=float, default=30, help="Durée du test en secondes")
+    parser.add_argument('--ecritures', type=float, help="Part des écritures dans le mélange (0 à 1)")
+    parser.add_argument('--pause', type=float, default=0.0, help="Temps de réflexion moyen entre deux actions (s)")
+    parser.add_argument('--gunicorn', type=int, metavar='WORKERS', help="Lance un gunicorn local avec ce nombre de workers")
+    parser.add_argument('--url', help="Serveur déjà lancé (sur la même base et la même SESSION_SECRET)")
+    parser.add_argument('--graine', type=int, default=42)
+    parser.add_argument('--reference', default=REFERENCE, help="Fichier de référence JSON")
+    parser.add_argument('--enregistrer', action='store_true', help="Enregistre les mesures comme nouvelle référence")
+    parser.add_argument('--seuil', type=float, default=0.2, help="Tolérance relative avant régression")
+    args = parser.parse_args()
+
+    meta, resume = run(args.echelle, args.base, args.utilisateurs, args.duree, args.ecritures, args.pause,
+                       args.gunicorn, args.url, args.graine)
+
+    try:
+        with open(args.reference, encoding='utf-8') as fichier:
+            reference = json.load(fichier)
+    except FileNotFoundError:
+        reference = None
+    anciens = reference['resultats'] if reference else {}
+
+    print(f"{meta['ventes']:,} ventes, {meta['mode']}, {meta['utilisateurs']} utilisateurs, {meta['duree']:.1f}s")
+    print(f"{'Route':<26}{'Requêtes':>10}{'req/s':>9}{'p50':>9}{'p95':>9}{'p99':>9}{'Réf. p95':>10}{'Erreurs':>9}{'Verrou':>8}{'Refus':>7}")
+    for nom, m in resume.items():
+        ref_p95 = f"{anciens[nom]['p95_ms']:.1f}" if nom in anciens else '-'
+        print(f"{nom:<26}{m['requetes']:>10}{m['debit']:>9.1f}{m['p50_ms']:>9.1f}{m['p95_ms']:>9.1f}{m['p99_ms']:>9.1f}"
+              f"{ref_p95:>10}{m['taux_erreur']:>8.1%}{m['erreurs_verrou']:>8}{m['refus']:>7}")
+
+    regressions = compare(resume, anciens, args.seuil)
+    for nom, mesure, avant, apres in regressions:
+        print(f"RÉGRESSION {nom} {mesure}: {avant:.3f} → {apres:.3f}")
+
+    if args.enregistrer:
+        with open(args.reference, 'w', encoding='utf-8') as fichier:
+            json.dump({'meta': meta, 'resultats': resume}, fichier, indent=2, ensure_ascii=False)
+        print(f"Référence enregistrée dans {args.reference}")
+
+    sys.exit(1 if regressions and not args.enregistrer else 0)
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,56 @@
+"""Mesure du temps de démarrage à froid de l'application
+
+Chaque mesure est faite dans un nouvel interpréteur: import du module
+`app`, appel de `create_app()`, puis première requête.
+
+    python bench_demarrage.py [--executions 5]
+"""
+import sys
+import json
+import argparse
+import statistics
+import subprocess
+
+MESURE = """
+import json, os, time
+debut = time.perf_counter()
+import app as module_app
+import_app = time.perf_counter()
+application = module_app.create_app()
+creation = time.perf_counter()
+application.test_client().get('/login')
+requete = time.perf_counter()
+print(json.dumps({
+    'import_app': import_app - debut,
+    'create_app': creation - import_app,
+    'premiere_requete': requete - creation,
+    'total': requete - debut
+}))
+"""
+
+def run(executions=5):
+    """Retourne la médiane et le maximum de chaque étape, en secondes"""
+    mesures = []
+    for _ in range(executions):
+        sortie = subprocess.run([sys.executable, '-c', MESURE], capture_output=True, text=True, check=True)
+        mesures.append(json.loads(sortie.stdout.strip().splitlines()[-1]))
+
+    return {
+        etape: {
+            'mediane': statistics.median(mesure[etape] for mesure in mesures),
+            'max': max(mesure[etape] for mesure in mesures)
+        }
+        for etape in mesures[0]
+    }
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--executions', type=int, default=5)
+    args = parser.parse_args()
+
+    print(f"{'Étape':<20}{'Médiane':>12}{'Max':>12}")
+    for etape, valeurs in run(args.executions).items():
+        print(f"{etape:<20}{valeurs['mediane'] * 1000:>10.1f}ms{valeurs['max'] * 1000:>10.1f}ms")
+
+if __name__ == '__main__':
+    main()
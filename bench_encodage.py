@@ -0,0 +1,111 @@
+"""Mesure de la taille et du temps d'encodage des réponses JSON et CSV
+
+Compare l'ancien format Chart.js (styles répétés dans chaque réponse) au
+format en colonnes, brut et compressé (gzip, brotli si disponible).
+
+    python bench_encodage.py [--repetitions 200]
+"""
+import json
+import time
+import random
+import argparse
+from datetime import date, timedelta
+from config import Config
+from compression import compress_bytes, brotli
+from utils.helpers import build_csv
+
+COULEURS = [
+    'rgba(255, 99, 132, 0.6)', 'rgba(54, 162, 235, 0.6)', 'rgba(255, 205, 86, 0.6)',
+    'rgba(75, 192, 192, 0.6)', 'rgba(153, 102, 255, 0.6)', 'rgba(255, 159, 64, 0.6)',
+    'rgba(199, 199, 199, 0.6)', 'rgba(83, 102, 255, 0.6)', 'rgba(40, 159, 64, 0.6)',
+    'rgba(210, 199, 199, 0.6)'
+]
+
+def _serie_quotidienne(jours):
+    labels = [(date.today() - timedelta(days=i)).isoformat() for i in range(jours + 1)]
+    montants = [round(random.uniform(0, 2_000_000), 2) for _ in labels]
+    transactions = [random.randint(0, 80) for _ in labels]
+    return labels, montants, transactions
+
+def charges_utiles():
+    """Retourne {nom: (ancien format, nouveau format)}"""
+    random.seed(42)
+    charges = {}
+    for jours in (7, 30, 365):
+        labels, montants, transactions = _serie_quotidienne(jours)
+        ancien = {'labels': labels, 'datasets': [
+            {'label': 'Montant (MGA)', 'data': montants, 'borderColor': 'rgb(75, 192, 192)',
+             'backgroundColor': 'rgba(75, 192, 192, 0.2)', 'tension': 0.1},
+            {'label': 'Nombre de transactions', 'data': transactions, 'borderColor': 'rgb(255, 99, 132)',
+             'backgroundColor': 'rgba(255, 99, 132, 0.2)', 'tension': 0.1, 'yAxisID': 'y1'}
+        ]}
+        nouveau = {'labels': labels, 'series': {'montant': montants, 'transactions': transactions}}
+        charges[f'ventes_{jours}j'] = (ancien, nouveau)
+
+    labels = [f'Produit {i}' for i in range(10)]
+    quantites = [random.randint(10, 500) for _ in labels]
+    charges['top_produits'] = (
+        {'labels': labels, 'datasets': [{'label': 'Quantité vendue', 'data': quantites, 'backgroundColor': COULEURS}]},
+        {'labels': labels, 'series': {'quantite': quantites}}
+    )
+    return charges
+
+def _mesurer(fonction, repetitions):
+    debut = time.perf_counter()
+    for _ in range(repetitions):
+        resultat = fonction()
+    return resultat, (time.perf_counter() - debut) / repetitions * 1e6
+
+def mesurer_contenu(contenu, repetitions):
+    """Taille (octets) et temps (µs) brut, gzip et brotli"""
+    mesures = {'brut': (len(contenu), 0.0)}
+    for encodage in ['gzip', 'br'] if brotli is not None else ['gzip']:
+        # Hors application: niveaux de la configuration par défaut
+        niveau = Config.COMPRESS_BR_QUALITY if encodage == 'br' else Config.COMPRESS_LEVEL
+        compresse, duree = _mesurer(lambda: compress_bytes(contenu, encodage, niveau), repetitions)
+        mesures[encodage] = (len(compresse), duree)
+    return mesures
+
+def run(repetitions=200):
+    """Exécute les mesures et retourne une liste de lignes de résultats"""
+    resultats = []
+    for nom, (ancien, nouveau) in charges_utiles().items():
+        for format_reponse, charge in (('chartjs', ancien), ('colonnes', nouveau)):
+            contenu, duree_json = _mesurer(
+                lambda: json.dumps(charge, separators=(',', ':')).encode('utf-8'), repetitions
+            )
+            resultats.append({
+                'charge': nom,
+                'format': format_reponse,
+                'encodage_json_us': duree_json,
+                'mesures': mesurer_contenu(contenu, repetitions)
+            })
+
+    random.seed(42)
+    lignes = [[f'Client {i}', f'client{i}@exemple.mg', random.randint(0, 40), random.uniform(0, 5e6)] for i in range(2000)]
+    contenu, duree_csv = _mesurer(
+        lambda: build_csv(lignes, ['Nom', 'Email', "Nombre d'achats", 'Total']).encode('utf-8'), max(1, repetitions // 20)
+    )
+    resultats.append({
+        'charge': 'export_clients_2000',
+        'format': 'csv',
+        'encodage_json_us': duree_csv,
+        'mesures': mesurer_contenu(contenu, max(1, repetitions // 20))
+    })
+    return resultats
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--repetitions', type=int, default=200)
+    args = parser.parse_args()
+
+    print(f"{'Charge':<22}{'Format':<10}{'Encodage':>11}{'Brut':>10}{'gzip':>10}{'µs gzip':>10}{'br':>10}{'µs br':>10}")
+    for ligne in run(args.repetitions):
+        mesures = ligne['mesures']
+        gzip_taille, gzip_duree = mesures['gzip']
+        br_taille, br_duree = (f"{mesures['br'][0]}", f"{mesures['br'][1]:.1f}") if 'br' in mesures else ('-', '-')
+        print(f"{ligne['charge']:<22}{ligne['format']:<10}{ligne['encodage_json_us']:>9.1f}µs"
+              f"{mesures['brut'][0]:>10}{gzip_taille:>10}{gzip_duree:>10.1f}{br_taille:>10}{br_duree:>10}")
+
+if __name__ == '__main__':
+    main()
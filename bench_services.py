@@ -0,0 +1,291 @@
+"""Banc d'essai des services: durée, nombre de requêtes et pic mémoire par méthode
+
+Couvre les méthodes publiques de StatistiqueService, VenteService,
+AchatService, StockService et AlerteService sur un jeu de données généré
+par generer_donnees.py (créé au besoin), et compare à une référence.
+
+Les écritures sont mesurées dans un SAVEPOINT annulé après chaque appel:
+la base n'est jamais modifiée. Le cache de mémoïsation est désactivé
+(sauf --avec-cache) pour mesurer le chemin des requêtes.
+
+    python bench_services.py --echelle 100k [--enregistrer] [--filtre Vente]
+
+Code de sortie 1 si une méthode régresse par rapport à la référence.
+"""
+import sys
+import json
+import time
+import logging
+import inspect
+import argparse
+import platform
+import statistics
+import tracemalloc
+from contextlib import contextmanager, nullcontext
+from datetime import datetime, timedelta
+from sqlalchemy import event
+from generer_donnees import ECHELLES, create_bench_app, generate
+
+REFERENCE = 'bench_services_reference.json'
+
+def cases(ctx):
+    """Cas mesurés: (nom, appel, écriture)"""
+    from services.statistique_service import StatistiqueService
+    from services.vente_service import VenteService
+    from services.achat_service import AchatService
+    from services.stock_service import StockService
+    from services.alerte_service import AlerteService
+
+    il_y_a_30_jours = datetime.utcnow() - timedelta(days=30)
+    return [
+        ('StatistiqueService.get_balance_commerciale', lambda: StatistiqueService.get_balance_commerciale(), False),
+        ('StatistiqueService.get_monthly_statistics', lambda: StatistiqueService.get_monthly_statistics(), False),
+        ('StatistiqueService.get_yearly_comparison', lambda: StatistiqueService.get_yearly_comparison(), False),
+        ('StatistiqueService.get_client_statistics', lambda: StatistiqueService.get_client_statistics(), False),
+        ('StatistiqueService.get_product_performance', lambda: StatistiqueService.get_product_performance(), False),
+        ('StatistiqueService.compute_abc_classification', lambda: StatistiqueService.compute_abc_classification(), True),
+        ('StatistiqueService.get_dashboard_data', lambda: StatistiqueService.get_dashboard_data(), False),
+        ('StatistiqueService.get_rapport_data', lambda: StatistiqueService.get_rapport_data(), False),
+        ('StatistiqueService.export_statistics_data', lambda: StatistiqueService.export_statistics_data(), False),
+
+        ('VenteService.create_vente', lambda: VenteService.create_vente(ctx['produit_id'], ctx['client_id'], 1), True),
+        ('VenteService.get_ventes_by_period', lambda: VenteService.get_ventes_by_period(il_y_a_30_jours), False),
+        ('VenteService.get_ventes_by_client', lambda: VenteService.get_ventes_by_client(ctx['client_id']), False),
+        ('VenteService.get_ventes_by_product', lambda: VenteService.get_ventes_by_product(ctx['produit_id']), False),
+        ('VenteService.calculate_daily_sales', lambda: VenteService.calculate_daily_sales(30), False),
+        ('VenteService.get_top_selling_products', lambda: VenteService.get_top_selling_products(), False),
+        ('VenteService.get_sales_summary', lambda: VenteService.get_sales_summary(), False),
+        ('VenteService.cancel_vente', lambda: VenteService.cancel_vente(ctx['vente_id'], 'Banc d\'essai'), True),
+
+        ('AchatService.create_achat', lambda: AchatService.create_achat(ctx['produit_id'], 10, ctx['prix_achat']), True),
+        ('AchatService.get_achats_by_period', lambda: AchatService.get_achats_by_period(il_y_a_30_jours), False),
+        ('AchatService.get_achats_by_product', lambda: AchatService.get_achats_by_product(ctx['produit_id']), False),
+        ('AchatService.get_achats_by_supplier', lambda: AchatService.get_achats_by_supplier(ctx['fournisseur']), False),
+        ('AchatService.calculate_daily_purchases', lambda: AchatService.calculate_daily_purchases(30), False),
+        ('AchatService.get_top_suppliers', lambda: AchatService.get_top_suppliers(), False),
+        ('AchatService.get_purchases_summary', lambda: AchatService.get_purchases_summary(), False),
+        ('AchatService.cancel_achat', lambda: AchatService.cancel_achat(ctx['achat_id'], 'Banc d\'essai'), True),
+
+        ('StockService.get_products_with_low_stock', lambda: StockService.get_products_with_low_stock(), False),
+        ('StockService.get_stock_summary', lambda: StockService.get_stock_summary(), False),
+        ('StockService.update_stock_from_sale', lambda: StockService.update_stock_from_sale(ctx['produit_id'], 1), True),
+        ('StockService.update_stock_from_purchase', lambda: StockService.update_stock_from_purchase(ctx['produit_id'], 1), True),
+        ('StockService.get_stock_movements', lambda: StockService.get_stock_movements(), False),
+        ('StockService.calculate_stock_turnover', lambda: StockService.calculate_stock_turnover(ctx['produit_id']), False),
+        ('StockService.calculate_stock_turnover_batch', lambda: StockService.calculate_stock_turnover_batch(), False),
+        ('StockService.get_slow_movers', lambda: StockService.get_slow_movers(), False),
+
+        ('AlerteService.check_low_stock_alerts', lambda: AlerteService.check_low_stock_alerts(), False),
+        ('AlerteService.check_sales_performance_alerts', lambda: AlerteService.check_sales_performance_alerts(), False),
+        ('AlerteService.check_product_expiry_alerts', lambda: AlerteService.check_product_expiry_alerts(), False),
+        ('AlerteService.get_all_alerts', lambda: AlerteService.get_all_alerts(), False),
+        ('AlerteService.get_alerts_summary', lambda: AlerteService.get_alerts_summary(), False),
+        ('AlerteService.summarize_alerts', lambda: AlerteService.summarize_alerts(ctx['alertes']), False),
+        ('AlerteService.log_alert', lambda: [AlerteService.log_alert(a) for a in ctx['alertes'][:1]], False),
+        ('AlerteService.format_alert_for_display', lambda: [AlerteService.format_alert_for_display(a) for a in ctx['alertes']], False),
+    ]
+
+def uncovered_methods(noms):
+    """Méthodes publiques des services sans cas de mesure"""
+    from services.statistique_service import StatistiqueService
+    from services.vente_service import VenteService
+    from services.achat_service import AchatService
+    from services.stock_service import StockService
+    from services.alerte_service import AlerteService
+
+    manquantes = []
+    for service in (StatistiqueService, VenteService, AchatService, StockService, AlerteService):
+        for nom, _ in inspect.getmembers(service, inspect.isfunction):
+            if not nom.startswith('_') and f'{service.__name__}.{nom}' not in noms:
+                manquantes.append(f'{service.__name__}.{nom}')
+    return manquantes
+
+def build_context():
+    """Paramètres des appels: produit le plus vendu, client le plus fidèle, etc."""
+    from app import db
+    from models.vente import Vente
+    from models.achat import Achat
+    from models.produit import Produit
+    from services.alerte_service import AlerteService
+
+    produit_id = db.session.query(Vente.produit_id).group_by(Vente.produit_id).order_by(
+        db.func.count(Vente.id).desc()).limit(1).scalar()
+    client_id = db.session.query(Vente.client_id).group_by(Vente.client_id).order_by(
+        db.func.count(Vente.id).desc()).limit(1).scalar()
+    fournisseur = db.session.query(Achat.fournisseur).group_by(Achat.fournisseur).order_by(
+        db.func.count(Achat.id).desc()).limit(1).scalar()
+    vente_id = db.session.query(db.func.max(Vente.id)).filter(Vente.statut == 'completed').scalar()
+    achat_id = db.session.query(db.func.max(Achat.id)).filter(Achat.statut == 'completed').scalar()
+    return {
+        'produit_id': produit_id,
+        'client_id': client_id,
+        'fournisseur': fournisseur,
+        'vente_id': vente_id,
+        'achat_id': achat_id,
+        'prix_achat': db.session.get(Produit, produit_id).prix_achat,
+        'alertes': AlerteService.get_all_alerts(),
+    }
+
+class QueryCounter:
+    """Compte les requêtes SQL émises sur tous les moteurs"""
+
+    def __init__(self, engines):
+        self.requetes = 0
+        for engine in engines:
+            event.listen(engine, 'before_cursor_execute', self._compter)
+
+    def _compter(self, *args):
+        self.requetes += 1
+
+@contextmanager
+def isolated_write():
+    """Exécute l'appel dans un SAVEPOINT annulé ensuite (mécanisme des lots de db_sqlite)"""
+    from app import db
+
+    session = db.session()
+    point = session.begin_nested()
+    session.info['ecriture_groupee'] = True
+    session.info['point_de_sauvegarde'] = point
+    try:
+        yield
+    finally:
+        session.info.pop('ecriture_groupee', None)
+        session.info.pop('point_de_sauvegarde', None)
+        if point.is_active:
+            point.rollback()
+        # Chaque appel repart d'une session vide (pas de lecture servie par la carte d'identité)
+        session.expunge_all()
+
+def measure(appel, compteur, repetitions):
+    """Médiane de la durée (ms), requêtes d'un appel et pic mémoire (Kio)"""
+    # Appel de chauffe (compilation des requêtes, imports paresseux)
+    with isolated_write():
+        appel()
+
+    durees = []
+    requetes = 0
+    for _ in range(repetitions):
+        with isolated_write():
+            avant = compteur.requetes
+            debut = time.perf_counter()
+            appel()
+            durees.append((time.perf_counter() - debut) * 1000)
+            requetes = compteur.requetes - avant
+
+    # Pic mémoire mesuré à part: tracemalloc ralentit fortement l'exécution
+    tracemalloc.start()
+    try:
+        with isolated_write():
+            tracemalloc.reset_peak()
+            appel()
+            pic = tracemalloc.get_traced_memory()[1]
+    finally:
+        tracemalloc.stop()
+
+    return {'duree_ms': statistics.median(durees), 'requetes': requetes, 'memoire_kio': pic / 1024}
+
+def run(echelle='10k', base=None, repetitions=5, filtre=None, avec_cache=False):
+    """Exécute le banc et retourne (métadonnées, {méthode: mesures})"""
+    from app import db
+    from cache import cache_disabled
+    from models.vente import Vente
+
+    application = create_bench_app(base or f'sqlite:///bench_{echelle}.db')
+    # Écritures mesurées dans la transaction du banc, sans la file d'écriture SQLite
+    application.config['SQLITE_PRODUCTION'] = False
+    # Les alertes journalisées à chaque appel noieraient le rapport
+    logging.getLogger().setLevel(logging.WARNING)
+
+    with application.app_context():
+        if db.session.query(Vente.id).first() is None:
+            generate(ECHELLES[echelle])
+
+        meta = {
+            'echelle': echelle,
+            'ventes': db.session.query(db.func.count(Vente.id)).scalar(),
+            'dialecte': db.engine.dialect.name,
+            'python': platform.python_version(),
+            'avec_cache': avec_cache,
+            'date': datetime.utcnow().isoformat(timespec='seconds'),
+        }
+
+        ctx = build_context()
+        liste = cases(ctx)
+        manquantes = uncovered_methods({nom for nom, _, _ in liste})
+        if manquantes:
+            print(f"Méthodes non couvertes: {', '.join(manquantes)}", file=sys.stderr)
+
+        compteur = QueryCounter(db.engines.values())
+        resultats = {}
+        with nullcontext() if avec_cache else cache_disabled():
+            for nom, appel, ecriture in liste:
+                if filtre and filtre.lower() not in nom.lower():
+                    continue
+                resultats[nom] = dict(measure(appel, compteur, repetitions), ecriture=ecriture)
+        db.session.rollback()
+
+    return meta, resultats
+
+def compare(resultats, reference, seuil=0.2):
+    """Compare à la référence; retourne [(méthode, mesure, avant, après)] des régressions"""
+    regressions = []
+    for nom, mesures in resultats.items():
+        avant = reference.get(nom)
+        if not avant:
+            continue
+        # Durée et mémoire: tolérance relative, plus un plancher contre le bruit des très petites valeurs
+        if mesures['duree_ms'] > avant['duree_ms'] * (1 + seuil) and mesures['duree_ms'] - avant['duree_ms'] > 1:
+            regressions.append((nom, 'duree_ms', avant['duree_ms'], mesures['duree_ms']))
+        if mesures['requetes'] > avant['requetes']:
+            regressions.append((nom, 'requetes', avant['requetes'], mesures['requetes']))
+        if mesures['memoire_kio'] > avant['memoire_kio'] * (1 + seuil) and mesures['memoire_kio'] - avant['memoire_kio'] > 64:
+            regressions.append((nom, 'memoire_kio', avant['memoire_kio'], mesures['memoire_kio']))
+    return regressions
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--echelle', choices=ECHELLES, default='10k')
+    parser.add_argument('--base', help="URL de la base (sqlite:///bench_<echelle>.db par défaut, générée au besoin)")
+    parser.add_argument('--repetitions', type=int, default=5)
+    parser.add_argument('--filtre', help="Ne mesure que les méthodes dont le nom contient ce texte")
+    parser.add_argument('--avec-cache', action='store_true', help="Laisse le cache de mémoïsation actif")
+    parser.add_argument('--reference', default=REFERENCE, help="Fichier de référence JSON")
+    parser.add_argument('--enregistrer', action='store_true', help="Enregistre les mesures comme nouvelle référence")
+    parser.add_argument('--seuil', type=float, default=0.2, help="Tolérance relative avant régression")
+    args = parser.parse_args()
+
+    meta, resultats = run(args.echelle, args.base, args.repetitions, args.filtre, args.avec_cache)
+
+    try:
+        with open(args.reference, encoding='utf-8') as fichier:
+            reference = json.load(fichier)
+    except FileNotFoundError:
+        reference = None
+
+    if reference and reference['meta'].get('echelle') != meta['echelle']:
+        print(f"Référence à l'échelle {reference['meta'].get('echelle')}, mesures à {meta['echelle']}: pas de comparaison")
+        reference = None
+    anciens = reference['resultats'] if reference else {}
+
+    print(f"{meta['ventes']:,} ventes, {meta['dialecte']}, Python {meta['python']}")
+    print(f"{'Méthode':<50}{'Durée':>11}{'Réf.':>11}{'Requêtes':>10}{'Réf.':>6}{'Mémoire':>12}")
+    for nom, mesures in resultats.items():
+        avant = anciens.get(nom, {})
+        ref_duree = f"{avant['duree_ms']:.1f}ms" if avant else '-'
+        ref_requetes = f"{avant['requetes']}" if avant else '-'
+        print(f"{nom:<50}{mesures['duree_ms']:>9.1f}ms{ref_duree:>11}{mesures['requetes']:>10}{ref_requetes:>6}"
+              f"{mesures['memoire_kio']:>9.0f}Kio")
+
+    regressions = compare(resultats, anciens, args.seuil)
+    for nom, mesure, avant, apres in regressions:
+        print(f"RÉGRESSION {nom} {mesure}: {avant:.1f} → {apres:.1f}")
+
+    if args.enregistrer:
+        with open(args.reference, 'w', encoding='utf-8') as fichier:
+            json.dump({'meta': meta, 'resultats': resultats}, fichier, indent=2, ensure_ascii=False)
+        print(f"Référence enregistrée dans {args.reference}")
+
+    sys.exit(1 if regressions and not args.enregistrer else 0)
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,227 @@
+import time
+import random
+import hashlib
+import inspect
+import functools
+import contextvars
+from contextlib import contextmanager
+from datetime import datetime, timezone
+from flask import request, make_response, current_app
+from sqlalchemy import event, inspect as sa_inspect
+from sqlalchemy.orm import Session
+from sqlalchemy.orm.attributes import set_committed_value
+from cache_backend import get_backend
+from compression import etag_base
+from metrics import count
+from db_routing import current_store
+
+_cache_desactive = contextvars.ContextVar('cache_desactive', default=False)
+_demarrage = time.time()
+
+class DataVersions:
+    """Compteurs de version par table, incrémentés à chaque commit qui modifie la table
+
+    Stockés dans le stockage de cache: avec un stockage partagé, une écriture
+    validée dans un worker invalide les entrées de tous les autres.
+    """
+
+    def get(self, tables):
+        return tuple(get_backend().get_counters([f'version:{table}' for table in tables]))
+
+    def bump(self, tables):
+        backend = get_backend()
+        maintenant = time.time()
+        for table in tables:
+            backend.incr(f'version:{table}')
+            backend.set(f'modifie:{table}', maintenant)
+
+    def validators(self, tables):
+        """Retourne (empreinte, date de dernière modification) des tables
+
+        L'empreinte inclut l'époque du stockage: des compteurs remis à zéro
+        (redémarrage, stockage vidé) ne redonnent jamais une empreinte déjà émise.
+        """
+        backend = get_backend()
+        compteurs = backend.get_counters(['epoque'] + [f'version:{table}' for table in tables])
+        if compteurs[0] == 0:
+            compteurs[0] = backend.incr('epoque', random.randint(1, 2 ** 31))
+        modifications = [m for m in backend.get_many([f'modifie:{table}' for table in tables]) if m]
+        derniere_modification = max(modifications) if modifications else _demarrage
+        return tuple(compteurs), datetime.fromtimestamp(int(derniere_modification), timezone.utc)
+
+def detached_copy(valeur, _copies=None, profondeur=0):
+    """Copie d'un résultat où chaque instance ORM est remplacée par une copie hors session
+
+    Les copies reprennent les colonnes et relations déjà chargées; les
+    instances d'origine restent dans leur session (celle de l'appelant ou
+    d'un thread de section) et ne sont jamais partagées ni détachées.
+    """
+    _copies = {} if _copies is None else _copies
+    if profondeur > 6:
+        return valeur
+    if isinstance(valeur, dict):
+        return {k: detached_copy(v, _copies, profondeur + 1) for k, v in valeur.items()}
+    if isinstance(valeur, list):
+        return [detached_copy(v, _copies, profondeur + 1) for v in valeur]
+    if isinstance(valeur, tuple):
+        elements = [detached_copy(v, _copies, profondeur + 1) for v in valeur]
+        return valeur._make(elements) if hasattr(valeur, '_make') else type(valeur)(elements)
+    if isinstance(valeur, (set, frozenset)):
+        return type(valeur)(detached_copy(v, _copies, profondeur + 1) for v in valeur)
+    if hasattr(valeur, '__table__'):
+        return _copier_instance(valeur, _copies, profondeur)
+    return valeur
+
+def _copier_instance(instance, copies, profondeur):
+    if id(instance) in copies:
+        return copies[id(instance)]
+    mapper = sa_inspect(instance).mapper
+    copie = mapper.class_manager.new_instance()
+    copies[id(instance)] = copie
+    charges = instance.__dict__
+    for attribut in mapper.column_attrs:
+        if attribut.key in charges:
+            set_committed_value(copie, attribut.key, charges[attribut.key])
+    for relation in mapper.relationships:
+        if relation.key in charges:
+            set_committed_value(copie, relation.key, detached_copy(charges[relation.key], copies, profondeur + 1))
+    return copie
+
+data_versions = DataVersions()
+
+def _normaliser(valeur):
+    """Rend un argument hachable et stable pour la clé de cache"""
+    if isinstance(valeur, dict):
+        return tuple(sorted((k, _normaliser(v)) for k, v in valeur.items()))
+    if isinstance(valeur, (list, tuple, set)):
+        return tuple(_normaliser(v) for v in valeur)
+    return valeur
+
+def cached(tables, ttl=None):
+    """Décorateur de mémoïsation versionnée
+
+    La clé combine la méthode, ses arguments normalisés (valeurs par défaut
+    comprises), le magasin courant et la version des tables lues: toute écriture validée sur
+    l'une de ces tables rend les entrées précédentes inaccessibles. Le TTL
+    borne la durée de vie des résultats dépendant de l'heure courante.
+    Passer sans_cache=True à l'appel force le recalcul.
+    Les résultats sont partagés: les appelants ne doivent pas les modifier,
+    et les instances ORM qu'ils contiennent sont des copies hors session
+    (colonnes et relations déjà chargées).
+    """
+    tables = tuple(tables)
+
+    def decorator(f):
+        signature = inspect.signature(f)
+        nom = f"{f.__module__}.{f.__qualname__}"
+
+        @functools.wraps(f)
+        def decorated_function(*args, sans_cache=False, **kwargs):
+            if sans_cache or _cache_desactive.get() or not current_app.config['CACHE_ENABLED']:
+                return f(*args, **kwargs)
+
+            arguments = signature.bind(*args, **kwargs)
+            arguments.apply_defaults()
+            empreinte = repr((_normaliser(arguments.arguments), current_store(), data_versions.get(tables)))
+            cle = f"memo:{nom}:{hashlib.sha1(empreinte.encode('utf-8')).hexdigest()}"
+
+            backend = get_backend()
+            trouve, valeur = backend.get(cle)
+            count('cache_requests_total', 'hit' if trouve else 'miss')
+            if trouve:
+                return valeur
+
+            # Copie hors session: les instances de l'appelant restent dans sa session
+            valeur = detached_copy(f(*args, **kwargs))
+            backend.set(cle, valeur, ttl if ttl is not None else current_app.config['CACHE_DEFAULT_TTL'])
+            return valeur
+
+        decorated_function.sans_cache = f
+        return decorated_function
+    return decorator
+
+def conditional_get(tables):
+    """Décorateur de route: ETag et Last-Modified dérivés des versions des tables
+
+    Si l'ETag envoyé par le client (If-None-Match) est à jour, la route
+    répond 304 sans être exécutée. L'empreinte couvre l'URL complète, le
+    magasin courant (choisi en session, d'où Vary: Cookie), les versions
+    des tables et une tranche de CACHE_DEFAULT_TTL secondes pour les
+    fenêtres relatives à l'heure courante.
+    """
+    tables = tuple(tables)
+
+    def decorator(f):
+        @functools.wraps(f)
+        def decorated_function(*args, **kwargs):
+            if not current_app.config['CACHE_ENABLED']:
+                return f(*args, **kwargs)
+
+            versions, derniere_modification = data_versions.validators(tables)
+            tranche = int(time.time() // current_app.config['CACHE_DEFAULT_TTL'])
+            empreinte = repr((request.full_path, current_store(), versions, tranche))
+            etag = hashlib.sha1(empreinte.encode('utf-8')).hexdigest()
+
+            # L'ETag renvoyé par le client peut porter le suffixe de son encodage
+            etag_client = next((tag for tag in request.if_none_match.as_set() if etag_base(tag) == etag), None)
+            if etag_client:
+                response = make_response('', 304)
+                response.set_etag(etag_client)
+            else:
+                response = make_response(f(*args, **kwargs))
+                if response.status_code != 200:
+                    return response
+                response.set_etag(etag)
+
+            response.last_modified = derniere_modification
+            response.vary.add('Cookie')
+            response.cache_control.private = True
+            response.cache_control.no_cache = True
+            return response
+        return decorated_function
+    return decorator
+
+@contextmanager
+def cache_disabled():
+    """Désactive le cache pour les appels du bloc (vérifications de cohérence)"""
+    jeton = _cache_desactive.set(True)
+    try:
+        yield
+    finally:
+        _cache_desactive.reset(jeton)
+
+def cache_stats():
+    """Statistiques du cache de mémoïsation"""
+    return get_backend().stats()
+
+@event.listens_for(Session, 'after_flush')
+def _collecter_tables_modifiees(session, flush_context):
+    tables = session.info.setdefault('tables_modifiees', set())
+    for instance in list(session.new) + list(session.dirty) + list(session.deleted):
+        table = getattr(instance, '__tablename__', None)
+        if table:
+            tables.add(table)
+
+@event.listens_for(Session, 'do_orm_execute')
+def _collecter_tables_requetes(orm_execute_state):
+    # Mises à jour et suppressions groupées (update(Produit), delete(...))
+    if orm_execute_state.is_update or orm_execute_state.is_delete:
+        mapper = orm_execute_state.bind_mapper
+        if mapper is not None:
+            orm_execute_state.session.info.setdefault('tables_modifiees', set()).add(mapper.local_table.name)
+
+@event.listens_for(Session, 'after_commit')
+def _incrementer_versions(session):
+    # Également appelé à la libération d'un SAVEPOINT: seul le commit réel compte
+    if session.in_nested_transaction():
+        return
+    tables = session.info.pop('tables_modifiees', None)
+    if tables:
+        data_versions.bump(tables)
+
+@event.listens_for(Session, 'after_rollback')
+def _oublier_tables(session):
+    # Un SAVEPOINT annulé (écriture groupée en échec) garde les tables des autres écritures
+    if session.in_nested_transaction():
+        return
+    session.info.pop('tables_modifiees', None)
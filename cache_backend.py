@@ -0,0 +1,552 @@
+import os
+import sys
+import time
+import pickle
+import socket
+import sqlite3
+import logging
+import tempfile
+import threading
+from collections import OrderedDict
+from urllib.parse import urlparse
+from flask import current_app
+
+def estimate_size(valeur, profondeur=0):
+    """Estime la taille mémoire d'une valeur (structures imbriquées comprises)"""
+    taille = sys.getsizeof(valeur, 64)
+    if profondeur > 6:
+        return taille
+    if isinstance(valeur, dict):
+        taille += sum(estimate_size(k, profondeur + 1) + estimate_size(v, profondeur + 1) for k, v in valeur.items())
+    elif isinstance(valeur, (list, tuple, set, frozenset)):
+        taille += sum(estimate_size(v, profondeur + 1) for v in valeur)
+    elif hasattr(valeur, '__table__'):
+        # Instance ORM: colonnes chargées uniquement
+        taille += sum(sys.getsizeof(v, 64) for v in vars(valeur).values())
+    return taille
+
+class CacheBackend:
+    """Interface commune des stockages de cache
+
+    Les valeurs expirent après `ttl` secondes (None: pas d'expiration).
+    Les compteurs (`incr`) servent aux versions de données et à la
+    limitation de débit.
+    """
+
+    nom = None
+
+    def __init__(self):
+        self.hits = 0
+        self.misses = 0
+
+    def get(self, cle):
+        """Retourne (trouvé, valeur)"""
+        trouve, valeur = self._get(cle)
+        if trouve:
+            self.hits += 1
+        else:
+            self.misses += 1
+        return trouve, valeur
+
+    def get_many(self, cles):
+        """Retourne les valeurs de plusieurs clés (None si absentes), sans compter de hits"""
+        raise NotImplementedError
+
+    def set(self, cle, valeur, ttl=None):
+        raise NotImplementedError
+
+    def delete(self, cle):
+        raise NotImplementedError
+
+    def incr(self, cle, montant=1, ttl=None):
+        """Incrémente un compteur et retourne sa nouvelle valeur (ttl appliqué à la création)"""
+        raise NotImplementedError
+
+    def incr_many(self, montants):
+        """Incrémente plusieurs compteurs ({clé: montant}, sans TTL) en un aller-retour si possible"""
+        for cle, montant in montants.items():
+            self.incr(cle, montant)
+
+    def get_counters(self, cles):
+        """Retourne la valeur de plusieurs compteurs (0 s'ils n'existent pas)"""
+        raise NotImplementedError
+
+    def clear(self):
+        raise NotImplementedError
+
+    def stats(self):
+        total = self.hits + self.misses
+        return {
+            'backend': self.nom,
+            'hits': self.hits,
+            'misses': self.misses,
+            'taux_hit': (self.hits / total * 100) if total > 0 else 0
+        }
+
+    def _get(self, cle):
+        raise NotImplementedError
+
+class MemoryBackend(CacheBackend):
+    """LRU en mémoire du processus, borné en nombre d'entrées et en taille estimée
+
+    Les valeurs ne sont pas copiées: les appelants ne doivent pas les modifier.
+    """
+
+    nom = 'memoire'
+
+    def __init__(self, max_entries=512, max_bytes=64 * 1024 * 1024):
+        super().__init__()
+        self.max_entries = max_entries
+        self.max_bytes = max_bytes
+        self._entrees = OrderedDict()
+        self._compteurs = {}
+        self._taille = 0
+        self._verrou = threading.Lock()
+        self.evictions = 0
+
+    def _get(self, cle):
+        with self._verrou:
+            entree = self._entrees.get(cle)
+            if entree is None:
+                return False, None
+            if entree[2] is not None and entree[2] <= time.monotonic():
+                self._retirer(cle)
+                return False, None
+            self._entrees.move_to_end(cle)
+            return True, entree[0]
+
+    def get_many(self, cles):
+        maintenant = time.monotonic()
+        with self._verrou:
+            entrees = [self._entrees.get(cle) for cle in cles]
+        return [entree[0] if entree is not None and (entree[2] is None or entree[2] > maintenant) else None
+                for entree in entrees]
+
+    def set(self, cle, valeur, ttl=None):
+        taille = estimate_size(valeur)
+        if taille > self.max_bytes:
+            return
+        expiration = time.monotonic() + ttl if ttl is not None else None
+        with self._verrou:
+            if cle in self._entrees:
+                self._retirer(cle)
+            self._entrees[cle] = (valeur, taille, expiration)
+            self._taille += taille
+            while self._entrees and (len(self._entrees) > self.max_entries or self._taille > self.max_bytes):
+                self._retirer(next(iter(self._entrees)))
+                self.evictions += 1
+
+    def delete(self, cle):
+        with self._verrou:
+            if cle in self._entrees:
+                self._retirer(cle)
+
+    def incr(self, cle, montant=1, ttl=None):
+        maintenant = time.monotonic()
+        with self._verrou:
+            valeur, expiration = self._compteurs.get(cle, (0, None))
+            if expiration is not None and expiration <= maintenant:
+                valeur, expiration = 0, None
+            if valeur == 0 and ttl is not None:
+                expiration = maintenant + ttl
+            self._compteurs[cle] = (valeur + montant, expiration)
+            return valeur + montant
+
+    def get_counters(self, cles):
+        maintenant = time.monotonic()
+        resultats = []
+        for cle in cles:
+            valeur, expiration = self._compteurs.get(cle, (0, None))
+            resultats.append(0 if expiration is not None and expiration <= maintenant else valeur)
+        return resultats
+
+    def clear(self):
+        with self._verrou:
+            self._entrees.clear()
+            self._compteurs.clear()
+            self._taille = 0
+
+    def stats(self):
+        stats = super().stats()
+        with self._verrou:
+            stats.update({
+                'entrees': len(self._entrees),
+                'taille_octets': self._taille,
+                'evictions': self.evictions
+            })
+        return stats
+
+    def _retirer(self, cle):
+        valeur, taille, expiration = self._entrees.pop(cle)
+        self._taille -= taille
+
+class SharedMemoryBackend(CacheBackend):
+    """Cache partagé par les processus d'une même machine
+
+    Fichier SQLite en mémoire partagée (/dev/shm) projeté en mémoire (mmap)
+    et en mode WAL: les lectures concurrentes des workers ne se bloquent pas,
+    les écritures sont sérialisées par SQLite. Éviction LRU approximative
+    au-delà de `max_bytes`.
+    """
+
+    nom = 'partage'
+    _INTERVALLE_ACCES = 10  # Précision de l'horodatage LRU (secondes), évite une écriture par lecture
+    _INTERVALLE_EVICTION = 32  # Contrôle de la taille toutes les N écritures
+
+    def __init__(self, chemin=None, max_bytes=64 * 1024 * 1024):
+        super().__init__()
+        dossier = '/dev/shm' if os.path.isdir('/dev/shm') else tempfile.gettempdir()
+        self.chemin = chemin or os.path.join(dossier, 'gestion_commerciale_cache.db')
+        self.max_bytes = max_bytes
+        self._local = threading.local()
+        self._ecritures = 0
+
+    def _connexion(self):
+        # Une connexion par thread et par processus (jamais héritée d'un fork)
+        connexion = getattr(self._local, 'connexion', None)
+        if connexion is None or self._local.pid != os.getpid():
+            connexion = sqlite3.connect(self.chemin, timeout=5, isolation_level=None)
+            connexion.execute('PRAGMA journal_mode=WAL')
+            connexion.execute('PRAGMA synchronous=OFF')
+            connexion.execute(f'PRAGMA mmap_size={self.max_bytes * 2}')
+            connexion.execute("""CREATE TABLE IF NOT EXISTS entrees (
+                cle TEXT PRIMARY KEY, valeur BLOB, taille INTEGER, expiration REAL, acces REAL)""")
+            connexion.execute('CREATE INDEX IF NOT EXISTS ix_entrees_acces ON entrees (acces)')
+            connexion.execute("""CREATE TABLE IF NOT EXISTS compteurs (
+                cle TEXT PRIMARY KEY, valeur INTEGER NOT NULL, expiration REAL)""")
+            self._local.connexion = connexion
+            self._local.pid = os.getpid()
+        return connexion
+
+    def _get(self, cle):
+        maintenant = time.time()
+        ligne = self._connexion().execute(
+            'SELECT valeur, expiration, acces FROM entrees WHERE cle = ?', (cle,)
+        ).fetchone()
+        if ligne is None or (ligne[1] is not None and ligne[1] <= maintenant):
+            return False, None
+        if ligne[2] < maintenant - self._INTERVALLE_ACCES:
+            self._connexion().execute('UPDATE entrees SET acces = ? WHERE cle = ?', (maintenant, cle))
+        return True, pickle.loads(ligne[0])
+
+    def get_many(self, cles):
+        if not cles:
+            return []
+        lignes = dict(self._connexion().execute(
+            f"""SELECT cle, valeur FROM entrees WHERE cle IN ({','.join('?' * len(cles))})
+                AND (expiration IS NULL OR expiration > ?)""",
+            (*cles, time.time())
+        ).fetchall())
+        return [pickle.loads(lignes[cle]) if cle in lignes else None for cle in cles]
+
+    def set(self, cle, valeur, ttl=None):
+        donnees = pickle.dumps(valeur, pickle.HIGHEST_PROTOCOL)
+        if len(donnees) > self.max_bytes:
+            return
+        maintenant = time.time()
+        self._connexion().execute(
+            'INSERT OR REPLACE INTO entrees (cle, valeur, taille, expiration, acces) VALUES (?, ?, ?, ?, ?)',
+            (cle, donnees, len(donnees), maintenant + ttl if ttl is not None else None, maintenant)
+        )
+        self._ecritures += 1
+        if self._ecritures % self._INTERVALLE_EVICTION == 0:
+            self._evincer()
+
+    def delete(self, cle):
+        self._connexion().execute('DELETE FROM entrees WHERE cle = ?', (cle,))
+
+    def incr(self, cle, montant=1, ttl=None):
+        maintenant = time.time()
+        connexion = self._connexion()
+        connexion.execute('BEGIN IMMEDIATE')
+        try:
+            connexion.execute(
+                'DELETE FROM compteurs WHERE cle = ? AND expiration IS NOT NULL AND expiration <= ?',
+                (cle, maintenant)
+            )
+            valeur = connexion.execute(
+                """INSERT INTO compteurs (cle, valeur, expiration) VALUES (?, ?, ?)
+                   ON CONFLICT (cle) DO UPDATE SET valeur = valeur + excluded.valeur
+                   RETURNING valeur""",
+                (cle, montant, maintenant + ttl if ttl is not None else None)
+            ).fetchone()[0]
+            connexion.execute('COMMIT')
+        except Exception:
+            connexion.execute('ROLLBACK')
+            raise
+        return valeur
+
+    def incr_many(self, montants):
+        if not montants:
+            return
+        connexion = self._connexion()
+        connexion.execute('BEGIN IMMEDIATE')
+        try:
+            connexion.executemany(
+                """INSERT INTO compteurs (cle, valeur) VALUES (?, ?)
+                   ON CONFLICT (cle) DO UPDATE SET valeur = valeur + excluded.valeur""",
+                list(montants.items())
+            )
+            connexion.execute('COMMIT')
+        except Exception:
+            connexion.execute('ROLLBACK')
+            raise
+
+    def get_counters(self, cles):
+        if not cles:
+            return []
+        maintenant = time.time()
+        lignes = dict(self._connexion().execute(
+            f"""SELECT cle, valeur FROM compteurs WHERE cle IN ({','.join('?' * len(cles))})
+                AND (expiration IS NULL OR expiration > ?)""",
+            (*cles, maintenant)
+        ).fetchall())
+        return [lignes.get(cle, 0) for cle in cles]
+
+    def clear(self):
+        connexion = self._connexion()
+        connexion.execute('DELETE FROM entrees')
+        connexion.execute('DELETE FROM compteurs')
+
+    def stats(self):
+        stats = super().stats()
+        entrees, taille = self._connexion().execute(
+            'SELECT COUNT(*), COALESCE(SUM(taille), 0) FROM entrees'
+        ).fetchone()
+        stats.update({'entrees': entrees, 'taille_octets': taille})
+        return stats
+
+    def _evincer(self):
+        """Supprime les entrées expirées puis les moins récemment lues au-delà de la taille maximale"""
+        connexion = self._connexion()
+        connexion.execute('DELETE FROM entrees WHERE expiration IS NOT NULL AND expiration <= ?', (time.time(),))
+        connexion.execute('DELETE FROM compteurs WHERE expiration IS NOT NULL AND expiration <= ?', (time.time(),))
+        excedent = connexion.execute('SELECT COALESCE(SUM(taille), 0) FROM entrees').fetchone()[0] - self.max_bytes
+        if excedent <= 0:
+            return
+        cles = []
+        for cle, taille in connexion.execute('SELECT cle, taille FROM entrees ORDER BY acces'):
+            cles.append(cle)
+            excedent -= taille
+            if excedent <= 0:
+                break
+        connexion.executemany('DELETE FROM entrees WHERE cle = ?', [(cle,) for cle in cles])
+
+class RedisError(Exception):
+    """Erreur renvoyée par le serveur Redis"""
+
+class RedisBackend(CacheBackend):
+    """Client minimal du protocole Redis (RESP): Redis, Valkey ou tout serveur compatible
+
+    Les clés sont préfixées pour partager une base avec d'autres applications;
+    l'éviction est laissée à la politique `maxmemory` du serveur. Un serveur
+    injoignable, ou qui répond par une erreur (-ERR, -OOM, -READONLY...), se
+    comporte comme un cache vide (les requêtes n'échouent pas).
+    """
+
+    nom = 'redis'
+
+    def __init__(self, url=None, prefixe='gc:', timeout=1.0):
+        super().__init__()
+        parametres = urlparse(url or 'redis://localhost:6379/0')
+        self.hote = parametres.hostname or 'localhost'
+        self.port = parametres.port or 6379
+        self.base = int(parametres.path.lstrip('/') or 0)
+        self.mot_de_passe = parametres.password
+        self.prefixe = prefixe
+        self.timeout = timeout
+        self._local = threading.local()
+
+    def _get(self, cle):
+        donnees = self._executer('GET', self.prefixe + cle)
+        if donnees is None:
+            return False, None
+        return True, pickle.loads(donnees)
+
+    def get_many(self, cles):
+        if not cles:
+            return []
+        valeurs = self._executer('MGET', *[self.prefixe + cle for cle in cles])
+        if valeurs is None:
+            return [None] * len(cles)
+        return [pickle.loads(valeur) if valeur is not None else None for valeur in valeurs]
+
+    def set(self, cle, valeur, ttl=None):
+        donnees = pickle.dumps(valeur, pickle.HIGHEST_PROTOCOL)
+        if ttl is not None:
+            self._executer('SET', self.prefixe + cle, donnees, 'PX', max(1, int(ttl * 1000)))
+        else:
+            self._executer('SET', self.prefixe + cle, donnees)
+
+    def delete(self, cle):
+        self._executer('DEL', self.prefixe + cle)
+
+    def incr(self, cle, montant=1, ttl=None):
+        valeur = self._executer('INCRBY', self.prefixe + cle, montant)
+        if valeur is None:
+            return 0
+        if ttl is not None and valeur == montant:
+            self._executer('PEXPIRE', self.prefixe + cle, max(1, int(ttl * 1000)))
+        return valeur
+
+    def incr_many(self, montants):
+        if montants:
+            self._executer_groupe([('INCRBY', self.prefixe + cle, montant) for cle, montant in montants.items()])
+
+    def get_counters(self, cles):
+        if not cles:
+            return []
+        valeurs = self._executer('MGET', *[self.prefixe + cle for cle in cles])
+        if valeurs is None:
+            return [0] * len(cles)
+        return [int(valeur) if valeur is not None else 0 for valeur in valeurs]
+
+    def clear(self):
+        curseur = b'0'
+        while True:
+            reponse = self._executer('SCAN', curseur, 'MATCH', self.prefixe + '*', 'COUNT', 500)
+            if reponse is None:
+                return
+            curseur, cles = reponse
+            if cles:
+                self._executer('DEL', *cles)
+            if curseur == b'0':
+                return
+
+    def _connexion(self):
+        fichier = getattr(self._local, 'fichier', None)
+        if fichier is None or self._local.pid != os.getpid():
+            connexion = socket.create_connection((self.hote, self.port), timeout=self.timeout)
+            connexion.setsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY, 1)
+            self._local.connexion = connexion
+            self._local.fichier = fichier = connexion.makefile('rb')
+            self._local.pid = os.getpid()
+            if self.mot_de_passe:
+                self._envoyer('AUTH', self.mot_de_passe)
+            if self.base:
+                self._envoyer('SELECT', self.base)
+        return fichier
+
+    def _executer(self, *arguments):
+        """Exécute une commande; None si le serveur est injoignable ou répond par une erreur"""
+        try:
+            return self._envoyer(*arguments)
+        except (OSError, EOFError, RedisError) as e:
+            self._echec(e)
+            return None
+
+    def _executer_groupe(self, commandes):
+        """Envoie plusieurs commandes d'un bloc (pipeline) et lit leurs réponses
+
+        Toutes les réponses sont lues avant de signaler une erreur: aucune ne
+        reste sur la connexion pour l'appel suivant. None en cas d'échec.
+        """
+        try:
+            fichier = self._connexion()
+            self._local.connexion.sendall(b''.join(self._encoder(arguments) for arguments in commandes))
+            reponses = [self._lire(fichier) for _ in commandes]
+            erreur = next((reponse for reponse in reponses if isinstance(reponse, RedisError)), None)
+            if erreur is not None:
+                raise erreur
+            return reponses
+        except (OSError, EOFError, RedisError) as e:
+            self._echec(e)
+            return None
+
+    def _echec(self, erreur):
+        # Connexion abandonnée: une réponse partielle ou inattendue la désynchroniserait
+        self._fermer()
+        if isinstance(erreur, RedisError):
+            logging.warning(f"Erreur du cache Redis ({self.hote}:{self.port}): {str(erreur)}")
+        else:
+            logging.warning(f"Cache Redis injoignable ({self.hote}:{self.port}): {str(erreur)}")
+
+    def _envoyer(self, *arguments):
+        fichier = self._connexion()
+        self._local.connexion.sendall(self._encoder(arguments))
+        reponse = self._lire(fichier)
+        if isinstance(reponse, RedisError):
+            raise reponse
+        return reponse
+
+    def _encoder(self, arguments):
+        morceaux = [b'*%d\r\n' % len(arguments)]
+        for argument in arguments:
+            if not isinstance(argument, bytes):
+                argument = str(argument).encode('utf-8')
+            morceaux.append(b'$%d\r\n%s\r\n' % (len(argument), argument))
+        return b''.join(morceaux)
+
+    def _lire(self, fichier):
+        """Lit une réponse complète; une erreur du serveur est retournée (RedisError), pas levée"""
+        ligne = fichier.readline()
+        if not ligne:
+            raise EOFError("Connexion fermée par le serveur")
+        type_reponse, contenu = ligne[:1], ligne[1:-2]
+        if type_reponse == b'+':
+            return contenu
+        if type_reponse == b'-':
+            return RedisError(contenu.decode('utf-8', 'replace'))
+        if type_reponse == b':':
+            return int(contenu)
+        if type_reponse == b'$':
+            longueur = int(contenu)
+            if longueur < 0:
+                return None
+            donnees = fichier.read(longueur + 2)
+            return donnees[:-2]
+        if type_reponse == b'*':
+            nombre = int(contenu)
+            if nombre < 0:
+                return None
+            return [self._lire(fichier) for _ in range(nombre)]
+        raise RedisError(f"Réponse inattendue: {ligne!r}")
+
+    def _fermer(self):
+        connexion = getattr(self._local, 'connexion', None)
+        if connexion is not None:
+            try:
+                connexion.close()
+            except OSError:
+                pass
+        self._local.connexion = None
+        self._local.fichier = None
+
+BACKENDS = {
+    'memoire': MemoryBackend,
+    'partage': SharedMemoryBackend,
+    'redis': RedisBackend
+}
+
+_verrou_backend = threading.Lock()
+
+def create_backend(config):
+    """Instancie le stockage de cache décrit par une configuration (CACHE_BACKEND, CACHE_URL, limites)"""
+    nom = config['CACHE_BACKEND']
+    if nom not in BACKENDS:
+        raise ValueError(f"Stockage de cache inconnu: {nom}")
+    if nom == 'partage':
+        return SharedMemoryBackend(chemin=config['CACHE_URL'] or None, max_bytes=config['CACHE_MAX_BYTES'])
+    if nom == 'redis':
+        return RedisBackend(url=config['CACHE_URL'] or None)
+    return MemoryBackend(max_entries=config['CACHE_MAX_ENTRIES'], max_bytes=config['CACHE_MAX_BYTES'])
+
+def get_backend(app=None):
+    """Retourne le stockage de cache de l'application (courante par défaut)
+
+    Partagé par le cache, la limitation de débit, les sessions utilisateur,
+    les métriques et le flux; créé au premier usage d'après app.config.
+    """
+    app = app or current_app._get_current_object()
+    backend = app.extensions.get('cache_backend')
+    if backend is None:
+        with _verrou_backend:
+            backend = app.extensions.get('cache_backend')
+            if backend is None:
+                backend = create_backend(app.config)
+                app.extensions['cache_backend'] = backend
+    return backend
+
+def set_backend(backend, app=None):
+    """Remplace le stockage de cache de l'application (courante par défaut; mesures)"""
+    (app or current_app._get_current_object()).extensions['cache_backend'] = backend
@@ -19,21 +19,27 @@ class Client(UserMixin, db.Model):
     def __repr__(self):
         return f'<Client {self.nom}>'
     
+    def _agreger_ventes(self, expression):
+        """Agrège les ventes du client, archives comprises"""
+        from models.vente import Vente
+        from partitions import source
+        ventes = source(Vente)
+        return db.session.query(expression(ventes)).filter(ventes.client_id == self.id).scalar()
+    
     @property
     def total_achats(self):
         """Calcule le montant total des achats du client"""
-        return sum(vente.montant_total for vente in self.ventes)
+        return self._agreger_ventes(lambda ventes: db.func.sum(ventes.montant_total)) or 0
     
     @property
     def nombre_achats(self):
         """Retourne le nombre d'achats du client"""
-        return self.ventes.count()
+        return self._agreger_ventes(lambda ventes: db.func.count(ventes.id))
     
     @property
     def dernier_achat(self):
         """Retourne la date du dernier achat"""
-        derniere_vente = self.ventes.order_by(db.desc('date_vente')).first()
-        return derniere_vente.date_vente if derniere_vente else None
+        return self._agreger_ventes(lambda ventes: db.func.max(ventes.date_vente))
     
     def to_dict(self):
         """Convertit l'objet en dictionnaire"""
@@ -1,10 +1,13 @@
-from flask import Blueprint, render_template, request, redirect, url_for, flash, jsonify
+from flask import Blueprint, render_template, request, redirect, url_for, flash, jsonify, make_response
 from flask_login import login_required
 from models.client import Client
 from services.vente_service import VenteService
 from services.statistique_service import StatistiqueService
+from services.tache_service import TacheService
 from app import db
+from db_routing import read_only
 from utils.helpers import format_currency
+from utils.auth import AuthUtils
 
 client_bp = Blueprint('client', __name__, url_prefix='/clients')
 
@@ -37,10 +40,12 @@ def list_clients():
         elif sort_by == 'total_achats':
             # Tri complexe par total des achats - utilise une sous-requête
             from models.vente import Vente
+            from partitions import source
+            ventes = source(Vente)
             subquery = db.session.query(
-                Vente.client_id,
-                db.func.sum(Vente.montant_total).label('total')
-            ).filter_by(statut='completed').group_by(Vente.client_id).subquery()
+                ventes.client_id,
+                db.func.sum(ventes.montant_total).label('total')
+            ).filter(ventes.statut == 'completed').group_by(ventes.client_id).subquery()
             
             query = query.outerjoin(subquery, Client.id == subquery.c.client_id).order_by(
                 db.desc(db.coalesce(subquery.c.total, 0))
@@ -146,6 +151,7 @@ def modifier_client(id):
         client.adresse = adresse if adresse else None
         
         db.session.commit()
+        AuthUtils.invalidate_principal(client.id)
         flash("Informations du client mises à jour avec succès.", "success")
         
     except Exception as e:
@@ -196,33 +202,16 @@ def statistiques_clients():
 
 @client_bp.route('/export')
 @login_required
+@read_only
 def export_clients():
     """Exporte la liste des clients"""
     try:
-        from utils.helpers import export_to_csv
-        
-        clients = Client.query.order_by(Client.nom).all()
-        
-        # Préparer les données
-        data = []
-        for client in clients:
-            data.append([
-                client.nom,
-                client.email,
-                client.telephone or '',
-                client.adresse or '',
-                client.date_inscription.strftime('%d/%m/%Y') if client.date_inscription else '',
-                client.nombre_achats,
-                client.total_achats,
-                format_currency(client.total_achats / client.nombre_achats) if client.nombre_achats > 0 else '0 MGA'
-            ])
-        
-        headers = [
-            'Nom', 'Email', 'Téléphone', 'Adresse', 'Date inscription',
-            'Nombre d\'achats', 'Total achats (MGA)', 'Panier moyen'
-        ]
-        
-        return export_to_csv(data, 'clients.csv', headers)
+        contenu, nom_fichier, content_type = TacheService.generer('export_clients')
+        
+        response = make_response(contenu)
+        response.headers["Content-Disposition"] = f"attachment; filename={nom_fichier}"
+        response.headers["Content-type"] = content_type
+        return response
         
     except Exception as e:
         flash(f"Erreur lors de l'export: {str(e)}", "error")
@@ -0,0 +1,109 @@
+import zlib
+from flask import request, current_app
+
+try:
+    import brotli
+except ImportError:  # Brotli optionnel: gzip seul sans le paquet
+    brotli = None
+
+# text/event-stream est exclu: un flux SSE doit atteindre le client message par message
+COMPRESSIBLE_TYPES = {
+    'application/json',
+    'text/csv',
+    'text/html',
+    'text/plain',
+    'text/css',
+    'application/javascript'
+}
+
+# Suffixe ajouté à l'ETag de chaque représentation compressée
+ETAG_SUFFIXES = {'gzip': '-gzip', 'br': '-br'}
+
+def etag_base(etag):
+    """Retire le suffixe d'encodage d'un ETag"""
+    for suffixe in ETAG_SUFFIXES.values():
+        if etag.endswith(suffixe):
+            return etag[:-len(suffixe)]
+    return etag
+
+def negotiate_encoding():
+    """Choisit l'encodage selon Accept-Encoding (brotli si disponible, sinon gzip)"""
+    encodages = ['br', 'gzip'] if brotli is not None else ['gzip']
+    return request.accept_encodings.best_match(encodages)
+
+def compression_level(encodage):
+    """Niveau de compression de l'encodage dans la configuration de l'application"""
+    if encodage == 'br':
+        return current_app.config['COMPRESS_BR_QUALITY']
+    return current_app.config['COMPRESS_LEVEL']
+
+def _compresseur(encodage, niveau):
+    if encodage == 'br':
+        compresseur = brotli.Compressor(quality=niveau)
+        return compresseur.process, compresseur.flush, compresseur.finish
+    # wbits 16+: en-tête et somme de contrôle gzip
+    compresseur = zlib.compressobj(niveau, zlib.DEFLATED, 16 + zlib.MAX_WBITS)
+    return compresseur.compress, lambda: compresseur.flush(zlib.Z_SYNC_FLUSH), compresseur.flush
+
+def compress_bytes(donnees, encodage, niveau=None):
+    """Compresse un contenu complet (niveau configuré de l'application par défaut)"""
+    compresser, vider, terminer = _compresseur(encodage, compression_level(encodage) if niveau is None else niveau)
+    return compresser(donnees) + terminer()
+
+def _compresser_flux(morceaux, encodage, niveau):
+    """Compresse une réponse en flux, morceau par morceau
+
+    Chaque morceau est vidé (sync flush) pour que le client le reçoive
+    sans attendre la fin de la réponse.
+    """
+    compresser, vider, terminer = _compresseur(encodage, niveau)
+    try:
+        for morceau in morceaux:
+            if isinstance(morceau, str):
+                morceau = morceau.encode('utf-8')
+            donnees = compresser(morceau) + vider()
+            if donnees:
+                yield donnees
+        yield terminer()
+    finally:
+        if hasattr(morceaux, 'close'):
+            morceaux.close()
+
+def compress_response(response):
+    """Compresse la réponse si le client l'accepte et que le type s'y prête"""
+    if not current_app.config['COMPRESS_ENABLED']:
+        return response
+
+    if (response.status_code != 200
+            or 'Content-Encoding' in response.headers
+            or response.mimetype not in COMPRESSIBLE_TYPES
+            or request.range is not None):
+        return response
+
+    response.vary.add('Accept-Encoding')
+    encodage = negotiate_encoding()
+    if not encodage:
+        return response
+
+    if response.is_streamed or response.direct_passthrough:
+        # Flux et fichiers (send_file): compression au fil de l'eau, sans Content-Length
+        response.direct_passthrough = False
+        # Niveau lu ici: le flux est produit hors du contexte de la requête
+        response.response = _compresser_flux(response.response, encodage, compression_level(encodage))
+        response.headers.pop('Content-Length', None)
+        response.headers.pop('Accept-Ranges', None)
+    else:
+        donnees = response.get_data()
+        if len(donnees) < current_app.config['COMPRESS_MIN_SIZE']:
+            return response
+        response.set_data(compress_bytes(donnees, encodage))
+
+    response.headers['Content-Encoding'] = encodage
+    etag, faible = response.get_etag()
+    if etag:
+        response.set_etag(etag + ETAG_SUFFIXES[encodage], weak=faible)
+    return response
+
+def init_compression(app):
+    """Active la compression des réponses de l'application"""
+    app.after_request(compress_response)
@@ -5,13 +5,143 @@ class Config:
     SQLALCHEMY_DATABASE_URI = os.environ.get('DATABASE_URL', 'sqlite:///gestion_commerciale.db')
     SQLALCHEMY_TRACK_MODIFICATIONS = False
     
+    # Options du moteur SQLAlchemy selon le type de base
+    ENGINE_OPTIONS = {
+        'postgresql': {
+            'pool_recycle': 300,
+            'pool_pre_ping': True,
+            'pool_size': int(os.environ.get('DB_POOL_SIZE', 5)),
+            'max_overflow': int(os.environ.get('DB_MAX_OVERFLOW', 10)),
+        },
+        'sqlite': {},
+        'defaut': {
+            'pool_recycle': 300,
+            'pool_pre_ping': True,
+        },
+    }
+    
+    # Profil SQLite de production: WAL, pragmas et file d'écriture unique
+    SQLITE_PRODUCTION = os.environ.get('SQLITE_PRODUCTION', '1') not in ('0', 'false', 'False')
+    SQLITE_BUSY_TIMEOUT = int(os.environ.get('SQLITE_BUSY_TIMEOUT', 5000))  # millisecondes
+    SQLITE_MMAP_SIZE = int(os.environ.get('SQLITE_MMAP_SIZE', 256 * 1024 * 1024))
+    SQLITE_CACHE_SIZE_KB = int(os.environ.get('SQLITE_CACHE_SIZE_KB', 64 * 1024))
+    SQLITE_GROUP_COMMIT_MAX = int(os.environ.get('SQLITE_GROUP_COMMIT_MAX', 64))  # Écritures par lot
+    SQLITE_WRITE_TIMEOUT = float(os.environ.get('SQLITE_WRITE_TIMEOUT', 30))  # Attente maximale en file (secondes)
+    # Métriques Prometheus (/metrics), agrégées dans le stockage de cache
+    METRICS_ENABLED = os.environ.get('METRICS_ENABLED', '1') not in ('0', 'false', 'False')
+    METRICS_FLUSH_INTERVAL = float(os.environ.get('METRICS_FLUSH_INTERVAL', 5))  # Envoi des compteurs du worker (secondes)
+    METRICS_TOKEN = os.environ.get('METRICS_TOKEN', '')  # Jeton Bearer exigé; sans jeton, accès local uniquement
+    # Profilage des requêtes à la demande (en-tête X-Profil signé ou échantillonnage)
+    PROFILING_ENABLED = os.environ.get('PROFILING_ENABLED', '0') not in ('0', 'false', 'False')
+    PROFILING_SAMPLE = os.environ.get('PROFILING_SAMPLE', '')  # 'endpoint:pourcentage,...', '*' pour toutes les routes
+    PROFILING_MODE = os.environ.get('PROFILING_MODE', 'echantillonnage')  # Mode des requêtes échantillonnées: cprofile, echantillonnage
+    PROFILING_SAMPLE_INTERVAL = float(os.environ.get('PROFILING_SAMPLE_INTERVAL', 0.005))  # Relevé des piles (secondes)
+    PROFILING_DIR = os.environ.get('PROFILING_DIR', 'profils')
+    PROFILING_MAX_FILES = int(os.environ.get('PROFILING_MAX_FILES', 200))
+    PROFILING_SECRET = os.environ.get('PROFILING_SECRET', '')  # Clé de signature de l'en-tête (SECRET_KEY par défaut)
+    PROFILING_TOKEN_TTL = int(os.environ.get('PROFILING_TOKEN_TTL', 3600))  # Validité d'un jeton (secondes)
+    ADMIN_EMAILS = [e.strip() for e in os.environ.get('ADMIN_EMAILS', '').split(',') if e.strip()]  # Vide: tout utilisateur connecté
+    AUTO_CREATE_SCHEMA = os.environ.get('AUTO_CREATE_SCHEMA', '0') not in ('0', 'false', 'False')  # Développement
+    LOG_LEVEL = os.environ.get('LOG_LEVEL', 'INFO')
+    
+    # Réplique de lecture (rapports); repli sur la primaire au-delà du retard maximal
+    DATABASE_READ_URL = os.environ.get('DATABASE_READ_URL', '')
+    DATABASE_READ_MAX_LAG = float(os.environ.get('DATABASE_READ_MAX_LAG', 5))  # secondes
+    DATABASE_READ_LAG_CHECK_INTERVAL = float(os.environ.get('DATABASE_READ_LAG_CHECK_INTERVAL', 5))
+    
     # Google OAuth configuration
     GOOGLE_OAUTH_CLIENT_ID = os.environ.get('GOOGLE_OAUTH_CLIENT_ID', '')
     GOOGLE_OAUTH_CLIENT_SECRET = os.environ.get('GOOGLE_OAUTH_CLIENT_SECRET', '')
+    OIDC_DISCOVERY_URL = os.environ.get('OIDC_DISCOVERY_URL', 'https://accounts.google.com/.well-known/openid-configuration')
+    OIDC_DISCOVERY_DEFAULT_TTL = int(os.environ.get('OIDC_DISCOVERY_DEFAULT_TTL', 3600))  # Sans en-têtes de cache
+    OIDC_HTTP_CONNECT_TIMEOUT = float(os.environ.get('OIDC_HTTP_CONNECT_TIMEOUT', 3))  # secondes
+    OIDC_HTTP_READ_TIMEOUT = float(os.environ.get('OIDC_HTTP_READ_TIMEOUT', 10))
+    OIDC_HTTP_RETRIES = int(os.environ.get('OIDC_HTTP_RETRIES', 2))
     
     # Application settings
     CURRENCY = 'MGA'  # Ariary
     LOW_STOCK_THRESHOLD = 5
+    COSTING_METHOD = os.environ.get('COSTING_METHOD', 'moyen_pondere')  # moyen_pondere, fifo
+    
+    # Prévision de la demande et réapprovisionnement
+    FORECAST_HISTORY_DAYS = int(os.environ.get('FORECAST_HISTORY_DAYS', 90))
+    FORECAST_METHOD = os.environ.get('FORECAST_METHOD', 'lissage')  # lissage, moyenne_mobile
+    LEAD_TIME_DAYS = int(os.environ.get('LEAD_TIME_DAYS', 7))
+    SERVICE_LEVEL = float(os.environ.get('SERVICE_LEVEL', 0.95))
+    REVIEW_PERIOD_DAYS = int(os.environ.get('REVIEW_PERIOD_DAYS', 14))
+    
+    # Classement ABC (parts cumulées limites des classes A et B)
+    ABC_SEUIL_A = 0.80
+    ABC_SEUIL_B = 0.95
+    
+    # Tâches d'arrière-plan (rapports et exports)
+    JOB_WORKERS = int(os.environ.get('JOB_WORKERS', 2))
+    JOB_ARTIFACT_DIR = os.environ.get('JOB_ARTIFACT_DIR', 'artefacts')
+    JOB_RESULT_TTL = int(os.environ.get('JOB_RESULT_TTL', 900))  # Validité des résultats (secondes)
+    JOB_TIMEOUT = int(os.environ.get('JOB_TIMEOUT', 1800))  # Au-delà, une tâche en cours est considérée perdue
+    
+    # Tableaux de bord: sections chargées en parallèle
+    DASHBOARD_WORKERS = int(os.environ.get('DASHBOARD_WORKERS', 8))
+    DASHBOARD_SECTION_TIMEOUT = float(os.environ.get('DASHBOARD_SECTION_TIMEOUT', 10))  # secondes
+    
+    # Stockage de cache partagé: memoire (par processus), partage (même machine), redis
+    # memoire par défaut pour le serveur de développement; gunicorn.conf.py impose partage ou redis
+    CACHE_BACKEND = os.environ.get('CACHE_BACKEND', 'memoire')
+    CACHE_URL = os.environ.get('CACHE_URL', '')  # Chemin du fichier (partage) ou redis://hote:port/base
+    
+    # Mémoïsation des lectures (invalidée par version de table à chaque commit)
+    CACHE_ENABLED = os.environ.get('CACHE_ENABLED', '1') not in ('0', 'false', 'False')
+    CACHE_MAX_ENTRIES = int(os.environ.get('CACHE_MAX_ENTRIES', 512))
+    CACHE_MAX_BYTES = int(os.environ.get('CACHE_MAX_BYTES', 64 * 1024 * 1024))
+    CACHE_DEFAULT_TTL = float(os.environ.get('CACHE_DEFAULT_TTL', 300))  # Fenêtres relatives à l'heure courante
+    
+    # Compression des réponses (gzip, brotli si le paquet est installé)
+    COMPRESS_ENABLED = os.environ.get('COMPRESS_ENABLED', '1') not in ('0', 'false', 'False')
+    COMPRESS_MIN_SIZE = int(os.environ.get('COMPRESS_MIN_SIZE', 500))  # octets
+    COMPRESS_LEVEL = int(os.environ.get('COMPRESS_LEVEL', 6))
+    COMPRESS_BR_QUALITY = int(os.environ.get('COMPRESS_BR_QUALITY', 5))
+    
+    # Identité des utilisateurs connectés (cache du chargement par Flask-Login)
+    USER_CACHE_TTL = int(os.environ.get('USER_CACHE_TTL', 60))  # secondes
+    
+    # Limitation de débit des connexions (par adresse IP)
+    LOGIN_RATE_LIMIT = int(os.environ.get('LOGIN_RATE_LIMIT', 10))
+    LOGIN_RATE_WINDOW = int(os.environ.get('LOGIN_RATE_WINDOW', 60))  # secondes
+    
+    # Partitionnement des transactions: partitions mensuelles (PostgreSQL), archives des exercices clos (SQLite)
+    PARTITION_MONTHS_AHEAD = int(os.environ.get('PARTITION_MONTHS_AHEAD', 3))  # Partitions créées à l'avance
+    EXERCICE_DEBUT_MOIS = int(os.environ.get('EXERCICE_DEBUT_MOIS', 1))  # Premier mois de l'exercice comptable
+    ARCHIVE_EXERCICES_CONSERVES = int(os.environ.get('ARCHIVE_EXERCICES_CONSERVES', 1))  # Exercices clos gardés en table vive
+    ARCHIVE_BATCH_SIZE = int(os.environ.get('ARCHIVE_BATCH_SIZE', 1000))  # Lignes déplacées par transaction
+    ARCHIVE_PAUSE = float(os.environ.get('ARCHIVE_PAUSE', 0.05))  # Pause entre deux lots (secondes)
+    
+    # Événements métier distribués après commit (abonnés sur un pool borné)
+    EVENT_WORKERS = int(os.environ.get('EVENT_WORKERS', 2))
+    EVENT_QUEUE_SIZE = int(os.environ.get('EVENT_QUEUE_SIZE', 1000))  # Événements en attente au-delà des workers
+    EVENT_QUEUE_TIMEOUT = float(os.environ.get('EVENT_QUEUE_TIMEOUT', 2))  # Attente d'une place en file (secondes)
+    EVENT_RETRIES = int(os.environ.get('EVENT_RETRIES', 3))  # Nouvelles tentatives d'un abonné en erreur
+    EVENT_RETRY_DELAY = float(os.environ.get('EVENT_RETRY_DELAY', 0.5))  # Premier délai, doublé à chaque tentative
+    EVENTS_SYNCHRONOUS = os.environ.get('EVENTS_SYNCHRONOUS', '0') not in ('0', 'false', 'False')  # Tests: abonnés dans le thread du commit
+    
+    # Flux temps réel des tableaux de bord (Server-Sent Events)
+    FLUX_ENABLED = os.environ.get('FLUX_ENABLED', '1') not in ('0', 'false', 'False')
+    FLUX_MAX_CONNECTIONS = int(os.environ.get('FLUX_MAX_CONNECTIONS', 500))  # Connexions ouvertes par processus
+    FLUX_POLL_INTERVAL = float(os.environ.get('FLUX_POLL_INTERVAL', 0.5))  # Relève des messages des autres workers (secondes)
+    FLUX_HEARTBEAT = float(os.environ.get('FLUX_HEARTBEAT', 15))  # Commentaire de maintien de la connexion (secondes)
+    FLUX_BUFFER = int(os.environ.get('FLUX_BUFFER', 256))  # Messages rejouables à la reconnexion
+    FLUX_MESSAGE_TTL = int(os.environ.get('FLUX_MESSAGE_TTL', 60))  # Durée de dépôt d'un message (secondes)
+    FLUX_MISSING_GRACE = float(os.environ.get('FLUX_MISSING_GRACE', 2))  # Attente d'un message réservé non écrit
+    FLUX_RETRY_MS = int(os.environ.get('FLUX_RETRY_MS', 5000))  # Délai de reconnexion du navigateur
+    
+    # Magasins: stock par magasin, transactions d'un magasin éventuellement sur sa propre base
+    DEFAULT_STORE_ID = int(os.environ.get('MAGASIN_PAR_DEFAUT', 1))  # Magasin des opérations non rattachées
+    STORE_DATABASES = {  # MAGASIN_DATABASES="2=postgresql://...,3=sqlite:///magasin3.db"
+        int(magasin): url.strip()
+        for magasin, _, url in (
+            element.partition('=') for element in os.environ.get('MAGASIN_DATABASES', '').split(',') if element.strip()
+        )
+    }
+    STORE_QUERY_TIMEOUT = float(os.environ.get('STORE_QUERY_TIMEOUT', 10))  # Rapports consolidés: attente d'une base de magasin
     
     # Pagination
     POSTS_PER_PAGE = 20
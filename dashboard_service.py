@@ -0,0 +1,117 @@
+from concurrent.futures import ThreadPoolExecutor, TimeoutError, Future
+from flask import current_app, has_request_context, copy_current_request_context
+from db_routing import current_store, use_store
+from cache import detached_copy
+from contextlib import contextmanager
+import contextvars
+import threading
+import logging
+import time
+
+_verrou_executeur = threading.Lock()
+_thread_section = threading.local()
+_sans_repli = contextvars.ContextVar('sections_sans_repli', default=False)
+
+def _get_executeur():
+    """Retourne le pool borné des sections de tableau de bord de l'application (créé à la demande)"""
+    app = current_app._get_current_object()
+    with _verrou_executeur:
+        executeur = app.extensions.get('sections_tableau_de_bord')
+        if executeur is None:
+            executeur = ThreadPoolExecutor(max_workers=app.config['DASHBOARD_WORKERS'], thread_name_prefix='section')
+            app.extensions['sections_tableau_de_bord'] = executeur
+    return executeur
+
+class DashboardService:
+    """Assemblage concurrent des sections indépendantes des tableaux de bord"""
+    
+    @staticmethod
+    def assemble(sections, timeout=None):
+        """Exécute les sections en parallèle, chacune avec sa propre session
+        
+        `sections` associe un nom à (fonction, valeur_par_defaut) ou
+        (fonction, valeur_par_defaut, timeout). Une section en erreur ou qui
+        dépasse son délai est remplacée par sa valeur par défaut.
+        Appelé depuis une section, l'assemblage s'exécute sur place pour ne
+        pas attendre des threads du pool qu'il occupe lui-même. Sous
+        `complete_sections`, les sections s'exécutent sur place, sans délai ni
+        repli. Retourne (resultats, sections_indisponibles).
+        """
+        if _sans_repli.get():
+            return {nom: section[0]() for nom, section in sections.items()}, []
+        
+        timeout = timeout if timeout is not None else current_app.config['DASHBOARD_SECTION_TIMEOUT']
+        debut = time.monotonic()
+        imbrique = getattr(_thread_section, 'actif', False)
+        
+        futures = {}
+        for nom, section in sections.items():
+            fonction = section[0]
+            if imbrique:
+                futures[nom] = Future()
+                try:
+                    futures[nom].set_result(fonction())
+                except Exception as e:
+                    futures[nom].set_exception(e)
+            else:
+                futures[nom] = _get_executeur().submit(DashboardService._contextualiser(fonction))
+        
+        resultats = {}
+        indisponibles = []
+        for nom, section in sections.items():
+            valeur_par_defaut = section[1]
+            delai = section[2] if len(section) > 2 else timeout
+            try:
+                resultats[nom] = futures[nom].result(timeout=max(0, debut + delai - time.monotonic()))
+            except TimeoutError:
+                logging.warning(f"Section '{nom}' non chargée après {delai}s")
+                resultats[nom] = valeur_par_defaut
+                indisponibles.append(nom)
+            except Exception as e:
+                logging.error(f"Erreur dans la section '{nom}': {str(e)}")
+                resultats[nom] = valeur_par_defaut
+                indisponibles.append(nom)
+        
+        return resultats, indisponibles
+    
+    @staticmethod
+    @contextmanager
+    def complete_sections():
+        """Assemblages exécutés sur place, sans délai ni valeur de repli
+        
+        Pour les résultats enregistrés (tâches d'arrière-plan): une section
+        lente est attendue, une section en erreur fait échouer l'appelant au
+        lieu de produire un résultat dégradé.
+        """
+        jeton = _sans_repli.set(True)
+        try:
+            yield
+        finally:
+            _sans_repli.reset(jeton)
+    
+    @staticmethod
+    def _contextualiser(fonction):
+        """Exécute la fonction dans un contexte applicatif propre au thread
+        
+        Dans une requête, le contexte est copié (session utilisateur comprise)
+        mais chaque thread obtient son propre contexte applicatif, donc sa
+        propre session SQLAlchemy. Le magasin courant est conservé. Le
+        résultat est copié hors session avant de quitter le thread: aucune
+        instance ORM n'est partagée avec le thread de la requête.
+        """
+        magasin = current_store()
+        
+        def dans_le_magasin():
+            _thread_section.actif = True
+            with use_store(magasin):
+                return detached_copy(fonction())
+        
+        if has_request_context():
+            return copy_current_request_context(dans_le_magasin)
+        
+        app = current_app._get_current_object()
+        
+        def executer():
+            with app.app_context():
+                return dans_le_magasin()
+        return executer
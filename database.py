@@ -1,4 +1,4 @@
-from app import db
+from app import db, create_schema
 from sqlalchemy import create_engine
 from sqlalchemy.orm import sessionmaker
 import os
@@ -10,14 +10,14 @@ def get_database_url():
 def init_database():
     """Initialize database with all tables"""
     with db.app.app_context():
-        db.create_all()
+        create_schema()
         print("Database initialized successfully")
 
 def reset_database():
     """Reset database by dropping and recreating all tables"""
     with db.app.app_context():
         db.drop_all()
-        db.create_all()
+        create_schema()
         print("Database reset successfully")
 
 class DatabaseManager:
@@ -0,0 +1,229 @@
+import time
+import logging
+import functools
+import contextvars
+from contextlib import contextmanager
+from flask import current_app, has_request_context, session as flask_session
+from flask_sqlalchemy.session import Session
+from sqlalchemy import event, text, or_, MetaData, Table, Column, Index, UniqueConstraint
+from sqlalchemy.orm import with_loader_criteria
+from sqlalchemy.sql.util import find_tables
+
+REPLICA_BIND_KEY = 'replica'
+STORE_BIND_PREFIX = 'magasin_'
+
+# Tables de transactions d'un magasin: sur sa base dédiée s'il en a une
+STORE_TABLES = frozenset({'ventes', 'achats', 'lots_stock', 'consommations_lot', 'stocks_magasin'})
+
+_lecture_seule = contextvars.ContextVar('lecture_seule', default=False)
+_forcer_primaire = contextvars.ContextVar('forcer_primaire', default=False)
+_magasin_courant = contextvars.ContextVar('magasin_courant', default=None)
+
+# Dernière mesure du retard de la réplique: (retard en secondes, horodatage de la mesure)
+_retard_replique = {'retard': 0.0, 'mesure': 0.0}
+
+LAG_QUERIES = {
+    'postgresql': """
+        SELECT CASE
+            WHEN NOT pg_is_in_recovery() THEN 0
+            WHEN pg_last_wal_receive_lsn() = pg_last_wal_replay_lsn() THEN 0
+            ELSE EXTRACT(EPOCH FROM now() - pg_last_xact_replay_timestamp())
+        END
+    """,
+}
+
+class RoutingSession(Session):
+    """Session qui envoie les lectures des méthodes en lecture seule vers la réplique
+
+    Tout le reste (écritures, flush, transactions ayant déjà écrit, lectures
+    qui suivent une écriture du même utilisateur) reste sur la base primaire.
+    Sert aussi de session aux lots de la file d'écriture SQLite (db_sqlite).
+    """
+
+    def commit(self):
+        # Dans un lot de la file d'écriture SQLite, le commit réel est fait par l'écrivain
+        if self.info.get('ecriture_groupee'):
+            self.flush()
+            return
+        super().commit()
+
+    def rollback(self):
+        # Dans un lot de la file d'écriture, seule l'écriture en cours (SAVEPOINT) est annulée
+        point = self.info.get('point_de_sauvegarde')
+        if point is not None:
+            if point.is_active:
+                point.rollback()
+            return
+        super().rollback()
+
+    def get_bind(self, mapper=None, clause=None, bind=None, **kwargs):
+        magasin = _magasin_courant.get()
+        if bind is None and store_is_sharded(magasin) and _tables_magasin(mapper, clause):
+            return self._db.engines[store_bind_key(magasin)]
+        if bind is None and _lecture_seule.get() and self._peut_lire_replique():
+            return self._db.engines[REPLICA_BIND_KEY]
+        return super().get_bind(mapper=mapper, clause=clause, bind=bind, **kwargs)
+
+    def _peut_lire_replique(self):
+        if _forcer_primaire.get() or REPLICA_BIND_KEY not in self._db.engines:
+            return False
+        if self._flushing or self.info.get('ecriture') or self.new or self.deleted or self.dirty:
+            return False
+        return replica_available(self._db.engines[REPLICA_BIND_KEY])
+
+def replica_available(engine):
+    """Applique les règles de repli vers la primaire (retard et lecture après écriture)"""
+    retard_max = current_app.config.get('DATABASE_READ_MAX_LAG', 5)
+
+    # Lecture après écriture: l'utilisateur qui vient d'écrire relit la primaire
+    if has_request_context():
+        derniere_ecriture = flask_session.get('_derniere_ecriture')
+        if derniere_ecriture and time.time() - derniere_ecriture < retard_max:
+            return False
+
+    return get_replica_lag(engine) <= retard_max
+
+def get_replica_lag(engine):
+    """Retourne le retard de la réplique en secondes (mis en cache quelques secondes)"""
+    intervalle = current_app.config.get('DATABASE_READ_LAG_CHECK_INTERVAL', 5)
+    maintenant = time.time()
+    if maintenant - _retard_replique['mesure'] < intervalle:
+        return _retard_replique['retard']
+
+    requete = LAG_QUERIES.get(engine.dialect.name)
+    try:
+        if requete:
+            with engine.connect() as connexion:
+                retard = float(connexion.execute(text(requete)).scalar() or 0)
+        else:
+            # Pas de réplication native (ex. deux fichiers SQLite): considérée à jour
+            retard = 0.0
+    except Exception as e:
+        logging.warning(f"Réplique de lecture indisponible, repli sur la primaire: {str(e)}")
+        retard = float('inf')
+
+    _retard_replique['retard'] = retard
+    _retard_replique['mesure'] = maintenant
+    return retard
+
+def read_only(f):
+    """Décorateur: les requêtes exécutées par la fonction peuvent aller sur la réplique"""
+    @functools.wraps(f)
+    def decorated_function(*args, **kwargs):
+        jeton = _lecture_seule.set(True)
+        try:
+            return f(*args, **kwargs)
+        finally:
+            _lecture_seule.reset(jeton)
+    return decorated_function
+
+def mark_write():
+    """Note que l'utilisateur vient d'écrire (lecture après écriture sur la primaire)"""
+    if has_request_context():
+        flask_session['_derniere_ecriture'] = time.time()
+
+@contextmanager
+def use_primary():
+    """Force la base primaire, même à l'intérieur d'une méthode en lecture seule"""
+    jeton = _forcer_primaire.set(True)
+    try:
+        yield
+    finally:
+        _forcer_primaire.reset(jeton)
+
+@event.listens_for(RoutingSession, 'after_flush')
+def _marquer_ecriture(session, flush_context):
+    session.info['ecriture'] = True
+
+@event.listens_for(RoutingSession, 'after_commit')
+def _enregistrer_ecriture(session):
+    if session.info.pop('ecriture', False):
+        mark_write()
+
+@event.listens_for(RoutingSession, 'after_rollback')
+def _annuler_ecriture(session):
+    session.info.pop('ecriture', None)
+
+def store_bind_key(magasin_id):
+    return f'{STORE_BIND_PREFIX}{magasin_id}'
+
+def store_is_sharded(magasin_id):
+    """Indique si les tables de transactions du magasin sont sur une base dédiée"""
+    return magasin_id is not None and int(magasin_id) in current_app.config.get('STORE_DATABASES', {})
+
+def current_store():
+    """Magasin du contexte courant (None: tous les magasins de la base primaire)"""
+    return _magasin_courant.get()
+
+@contextmanager
+def use_store(magasin_id):
+    """Limite les tables de transactions à un magasin et les lit ou écrit dans sa base
+
+    Les objets d'un magasin doivent être écrits (flush, commit) dans son
+    contexte: le routage se décide au moment de l'écriture.
+    """
+    jeton = _magasin_courant.set(None if magasin_id is None else int(magasin_id))
+    try:
+        yield
+    finally:
+        _magasin_courant.reset(jeton)
+
+def in_store(f):
+    """Décorateur: exécute la fonction dans le magasin passé en `magasin_id` (magasin par défaut si absent)
+
+    Posé sous @serialized_write: le magasin est fixé dans le thread d'écriture.
+    """
+    @functools.wraps(f)
+    def decorated_function(*args, magasin_id=None, **kwargs):
+        with use_store(magasin_id or current_app.config['DEFAULT_STORE_ID']):
+            return f(*args, **kwargs)
+    return decorated_function
+
+def _tables_magasin(mapper, clause):
+    if mapper is not None:
+        return mapper.persist_selectable.name in STORE_TABLES
+    if clause is not None:
+        return any(getattr(table, 'name', None) in STORE_TABLES
+                   for table in find_tables(clause, include_aliases=True, include_crud=True))
+    return False
+
+@event.listens_for(RoutingSession, 'do_orm_execute')
+def _filtrer_magasin(orm_execute_state):
+    # Dans le contexte d'un magasin, ses lignes seules (lignes sans magasin: magasin par défaut)
+    magasin = _magasin_courant.get()
+    etat = orm_execute_state
+    if magasin is None or etat.is_column_load or not (etat.is_select or etat.is_update or etat.is_delete):
+        return
+    from models.vente import Vente
+    from models.achat import Achat
+    from models.lot_stock import LotStock
+    from models.magasin import StockMagasin
+
+    if magasin == current_app.config['DEFAULT_STORE_ID']:
+        critere = lambda cls: or_(cls.magasin_id == magasin, cls.magasin_id.is_(None))
+    else:
+        critere = lambda cls: cls.magasin_id == magasin
+    etat.statement = etat.statement.options(*[
+        with_loader_criteria(modele, critere, include_aliases=True)
+        for modele in (Vente, Achat, LotStock, StockMagasin)
+    ])
+
+def create_store_schema(engine):
+    """Crée les tables de transactions d'un magasin dans sa base dédiée
+
+    Copie colonnes, index et contraintes d'unicité, sans les clés étrangères:
+    produits, clients et magasins restent sur la base primaire.
+    """
+    from app import db
+
+    metadonnees = MetaData()
+    for nom in sorted(STORE_TABLES):
+        table = db.metadata.tables[nom]
+        elements = [Column(c.name, c.type, primary_key=c.primary_key, nullable=c.nullable,
+                           server_default=c.server_default) for c in table.columns]
+        elements += [Index(index.name, *[c.name for c in index.columns], unique=index.unique) for index in table.indexes]
+        elements += [UniqueConstraint(*[c.name for c in contrainte.columns], name=contrainte.name)
+                     for contrainte in table.constraints if isinstance(contrainte, UniqueConstraint)]
+        Table(nom, metadonnees, *elements)
+    metadonnees.create_all(engine)
+    return sorted(STORE_TABLES)
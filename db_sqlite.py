@@ -0,0 +1,191 @@
+import os
+import queue
+import logging
+import functools
+import threading
+from concurrent.futures import Future, TimeoutError as FutureTimeoutError
+from flask import current_app
+from sqlalchemy import event
+
+def configure_sqlite_engine(engine, config):
+    """Profil de production SQLite: WAL et pragmas (réglages de `config`) à chaque connexion
+
+    Les transactions sont ouvertes explicitement (BEGIN émis par SQLAlchemy,
+    pas par le pilote) pour que les SAVEPOINT fonctionnent; la file
+    d'écriture ouvre les siennes en BEGIN IMMEDIATE.
+    """
+    @event.listens_for(engine, 'connect')
+    def _pragmas(connexion_dbapi, enregistrement):
+        connexion_dbapi.isolation_level = None
+        curseur = connexion_dbapi.cursor()
+        curseur.execute('PRAGMA journal_mode=WAL')
+        curseur.execute('PRAGMA synchronous=NORMAL')
+        curseur.execute(f"PRAGMA busy_timeout={config['SQLITE_BUSY_TIMEOUT']}")
+        curseur.execute(f"PRAGMA mmap_size={config['SQLITE_MMAP_SIZE']}")
+        curseur.execute(f"PRAGMA cache_size=-{config['SQLITE_CACHE_SIZE_KB']}")
+        curseur.close()
+
+    @event.listens_for(engine, 'begin')
+    def _begin(connexion):
+        if connexion.get_execution_options().get('sqlite_immediate'):
+            connexion.exec_driver_sql('BEGIN IMMEDIATE')
+        else:
+            connexion.exec_driver_sql('BEGIN')
+
+class WriteQueue:
+    """File d'écriture unique du processus, avec validation groupée
+
+    Un seul thread écrit: il prend toutes les écritures en attente, les
+    exécute chacune dans un SAVEPOINT d'une même transaction BEGIN IMMEDIATE,
+    puis valide le lot en un seul commit. Une écriture en erreur n'annule
+    que son SAVEPOINT. Si le commit du lot échoue, chaque écriture est
+    rejouée seule. Les lectures ne passent pas par la file.
+    """
+
+    def __init__(self, app):
+        self.app = app
+        self.pid = os.getpid()
+        self.lots = 0
+        self.ecritures = 0
+        self.taille_max_lot = 0
+        self._file = queue.Queue()
+        self._thread = threading.Thread(target=self._boucle, name='ecrivain-sqlite', daemon=True)
+        self._thread.start()
+
+    def in_writer_thread(self):
+        return threading.current_thread() is self._thread
+
+    def submit(self, fonction, args, kwargs):
+        """Met une écriture en file et attend son résultat
+
+        Passé SQLITE_WRITE_TIMEOUT, une écriture encore en file est retirée
+        (l'appelant reçoit l'erreur); une écriture déjà commencée est
+        attendue jusqu'à son résultat réel, pour ne pas signaler en échec
+        une écriture qui sera validée.
+        """
+        future = Future()
+        self._file.put((fonction, args, kwargs, future))
+        try:
+            return future.result(timeout=self.app.config['SQLITE_WRITE_TIMEOUT'])
+        except FutureTimeoutError:
+            if future.cancel():
+                raise
+            return future.result()
+
+    def stats(self):
+        return {
+            'lots': self.lots,
+            'ecritures': self.ecritures,
+            'taille_moyenne_lot': self.ecritures / self.lots if self.lots else 0,
+            'taille_max_lot': self.taille_max_lot,
+            'en_attente': self._file.qsize()
+        }
+
+    def _boucle(self):
+        while True:
+            lot = [self._file.get()]
+            while len(lot) < self.app.config['SQLITE_GROUP_COMMIT_MAX']:
+                try:
+                    lot.append(self._file.get_nowait())
+                except queue.Empty:
+                    break
+
+            # Écritures abandonnées par leur appelant (délai dépassé): jamais exécutées
+            lot = [ecriture for ecriture in lot if ecriture[3].set_running_or_notify_cancel()]
+            if not lot:
+                continue
+
+            try:
+                self._executer_lot(lot)
+            except Exception as e:
+                logging.exception("Échec inattendu de la file d'écriture")
+                for fonction, args, kwargs, future in lot:
+                    if not future.done():
+                        future.set_exception(e)
+
+            self.lots += 1
+            self.ecritures += len(lot)
+            self.taille_max_lot = max(self.taille_max_lot, len(lot))
+
+    def _executer_lot(self, lot):
+        from app import db
+
+        resultats = []
+        with self.app.app_context():
+            session = db.session()
+            # Les objets retournés restent lisibles après le commit du lot
+            session.expire_on_commit = False
+            try:
+                session.connection(execution_options={'sqlite_immediate': True})
+                session.info['ecriture_groupee'] = True
+                for fonction, args, kwargs, future in lot:
+                    point = session.begin_nested()
+                    session.info['point_de_sauvegarde'] = point
+                    try:
+                        resultat = fonction(*args, **kwargs)
+                        if point.is_active:
+                            point.commit()
+                        resultats.append((future, resultat, None))
+                    except Exception as e:
+                        if point.is_active:
+                            point.rollback()
+                        resultats.append((future, None, e))
+                    finally:
+                        session.info.pop('point_de_sauvegarde', None)
+                session.info.pop('ecriture_groupee', None)
+                session.commit()
+            except Exception as e:
+                session.info.pop('ecriture_groupee', None)
+                session.info.pop('point_de_sauvegarde', None)
+                session.rollback()
+                logging.warning(f"Validation groupée impossible, écritures rejouées une à une: {str(e)}")
+                resultats = None
+
+        if resultats is None:
+            for fonction, args, kwargs, future in lot:
+                with self.app.app_context():
+                    db.session().expire_on_commit = False
+                    try:
+                        future.set_result(fonction(*args, **kwargs))
+                    except Exception as e:
+                        future.set_exception(e)
+            return
+
+        for future, resultat, erreur in resultats:
+            if erreur is not None:
+                future.set_exception(erreur)
+            else:
+                future.set_result(resultat)
+
+_verrou_file = threading.Lock()
+
+def get_write_queue():
+    """File d'écriture de l'application courante (None hors profil SQLite de production)"""
+    from app import db
+
+    app = current_app._get_current_object()
+    if not app.config.get('SQLITE_PRODUCTION') or db.engine.dialect.name != 'sqlite':
+        return None
+
+    file_ecriture = app.extensions.get('file_ecriture')
+    if file_ecriture is None or file_ecriture.pid != os.getpid():
+        with _verrou_file:
+            file_ecriture = app.extensions.get('file_ecriture')
+            if file_ecriture is None or file_ecriture.pid != os.getpid():
+                file_ecriture = WriteQueue(app)
+                app.extensions['file_ecriture'] = file_ecriture
+    return file_ecriture
+
+def serialized_write(f):
+    """Décorateur: l'écriture passe par la file d'écriture unique (SQLite de production)"""
+    @functools.wraps(f)
+    def decorated_function(*args, **kwargs):
+        file_ecriture = get_write_queue()
+        if file_ecriture is None or file_ecriture.in_writer_thread():
+            return f(*args, **kwargs)
+
+        from db_routing import mark_write
+        resultat = file_ecriture.submit(f, args, kwargs)
+        mark_write()
+        return resultat
+    return decorated_function
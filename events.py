@@ -0,0 +1,212 @@
+"""Événements métier publiés après commit
+
+Les services publient des événements typés (vente créée ou annulée, achat
+créé ou annulé, produit reprix) pendant leur transaction; ils ne sont
+distribués qu'une fois la transaction validée, et oubliés si elle est
+annulée. Les effets de bord (alertes, journal d'audit...) s'abonnent ici au
+lieu d'allonger la transaction de caisse.
+
+Les abonnés tournent sur un pool borné (EVENT_WORKERS threads, au plus
+EVENT_QUEUE_SIZE événements en attente): quand la file est pleine, la
+publication attend une place jusqu'à EVENT_QUEUE_TIMEOUT secondes puis
+abandonne l'appel (journalisé et compté). Un abonné en erreur est relancé
+EVENT_RETRIES fois avec un délai croissant. Avec EVENTS_SYNCHRONOUS (tests),
+les abonnés tournent dans le thread qui valide la transaction.
+"""
+import os
+import time
+import logging
+import threading
+from dataclasses import dataclass, asdict
+from datetime import datetime
+from concurrent.futures import ThreadPoolExecutor
+from flask import current_app
+from sqlalchemy import event
+from sqlalchemy.orm import Session
+from metrics import count
+
+@dataclass(frozen=True)
+class DomainEvent:
+    """Événement métier: données copiées avant le commit (les instances ORM expirent)"""
+    date: datetime
+
+@dataclass(frozen=True)
+class SaleCreated(DomainEvent):
+    vente_id: int
+    produit_id: int
+    client_id: int
+    quantite: int
+    montant_total: int
+    stock_restant: int
+    seuil_alerte: int
+    magasin_id: int = None
+
+@dataclass(frozen=True)
+class SaleCancelled(DomainEvent):
+    vente_id: int
+    produit_id: int
+    quantite: int
+    montant_total: int
+    date_vente: datetime
+    stock_restant: int
+    seuil_alerte: int
+    motif: str = None
+    magasin_id: int = None
+
+@dataclass(frozen=True)
+class PurchaseCreated(DomainEvent):
+    achat_id: int
+    produit_id: int
+    quantite: int
+    montant_total: int
+    stock_restant: int
+    seuil_alerte: int
+    fournisseur: str = None
+    magasin_id: int = None
+
+@dataclass(frozen=True)
+class PurchaseCancelled(DomainEvent):
+    achat_id: int
+    produit_id: int
+    quantite: int
+    montant_total: int
+    stock_restant: int
+    seuil_alerte: int
+    motif: str = None
+    magasin_id: int = None
+
+@dataclass(frozen=True)
+class ProductRepriced(DomainEvent):
+    produit_id: int
+    ancien_prix_achat: int
+    nouveau_prix_achat: int
+    ancien_prix_vente: int
+    nouveau_prix_vente: int
+
+EVENT_TYPES = (SaleCreated, SaleCancelled, PurchaseCreated, PurchaseCancelled, ProductRepriced)
+
+_abonnes = []
+_verrou_executeur = threading.Lock()
+
+def subscribe(*types_evenements, tentatives=None):
+    """Décorateur: abonne une fonction aux événements des types donnés (tous par défaut)"""
+    def decorator(f):
+        _abonnes.append((types_evenements or (DomainEvent,), f, tentatives))
+        return f
+    return decorator
+
+def publish(evenement):
+    """Publie un événement à la validation de la transaction en cours
+
+    Annulé avec la transaction, ou avec le SAVEPOINT en cours (écritures
+    groupées de la file SQLite). Hors transaction, distribué tout de suite.
+    """
+    from app import db
+
+    app = current_app._get_current_object()
+    session = db.session()
+    transaction = session.get_nested_transaction() or session.get_transaction()
+    if transaction is None:
+        _distribuer(app, evenement)
+        return
+    session.info.setdefault('evenements', []).append((transaction, app, evenement))
+
+@event.listens_for(Session, 'after_commit')
+def _distribuer_apres_commit(session):
+    # Également appelé à la libération d'un SAVEPOINT: seul le commit réel compte
+    if session.in_nested_transaction():
+        return
+    for transaction, app, evenement in session.info.pop('evenements', ()):
+        _distribuer(app, evenement)
+
+@event.listens_for(Session, 'after_soft_rollback')
+def _oublier_apres_rollback(session, transaction_precedente):
+    en_attente = session.info.get('evenements')
+    if not en_attente:
+        return
+    if transaction_precedente.nested:
+        session.info['evenements'] = [e for e in en_attente if e[0] is not transaction_precedente]
+    else:
+        session.info.pop('evenements', None)
+
+def _get_executeur(app):
+    """Pool borné des abonnés de l'application et ses places en file (recréés après un fork)"""
+    pool = app.extensions.get('evenements')
+    if pool is None or pool[2] != os.getpid():
+        with _verrou_executeur:
+            pool = app.extensions.get('evenements')
+            if pool is None or pool[2] != os.getpid():
+                taille = app.config['EVENT_WORKERS']
+                pool = (ThreadPoolExecutor(max_workers=taille, thread_name_prefix='evenement'),
+                        threading.BoundedSemaphore(taille + app.config['EVENT_QUEUE_SIZE']),
+                        os.getpid())
+                app.extensions['evenements'] = pool
+    return pool[0], pool[1]
+
+def _distribuer(app, evenement):
+    nom = type(evenement).__name__
+    count('evenements_publies_total', nom)
+    for types_evenements, fonction, tentatives in _abonnes:
+        if not isinstance(evenement, types_evenements):
+            continue
+        if app.config.get('EVENTS_SYNCHRONOUS'):
+            _executer(app, fonction, evenement, tentatives)
+            continue
+
+        executeur, places = _get_executeur(app)
+        # Contre-pression: la publication attend qu'une place se libère
+        if not places.acquire(timeout=app.config['EVENT_QUEUE_TIMEOUT']):
+            count('evenements_rejetes_total', nom)
+            logging.error(f"File des événements pleine: {nom} non transmis à {fonction.__qualname__}")
+            continue
+        future = executeur.submit(_executer, app, fonction, evenement, tentatives)
+        future.add_done_callback(lambda _, places=places: places.release())
+
+def _executer(app, fonction, evenement, tentatives):
+    """Appelle un abonné dans son propre contexte d'application, avec relances"""
+    tentatives = app.config['EVENT_RETRIES'] if tentatives is None else tentatives
+    for tentative in range(tentatives + 1):
+        try:
+            with app.app_context():
+                fonction(evenement)
+            return
+        except Exception as e:
+            if tentative == tentatives:
+                count('evenements_echecs_total', type(evenement).__name__)
+                logging.error(f"Abonné {fonction.__qualname__} en échec sur {type(evenement).__name__} "
+                              f"après {tentatives + 1} tentatives: {str(e)}")
+                return
+            logging.warning(f"Abonné {fonction.__qualname__} en erreur ({str(e)}), nouvelle tentative")
+            time.sleep(app.config['EVENT_RETRY_DELAY'] * 2 ** tentative)
+
+def wait_idle(timeout=None):
+    """Attend que les événements en file de l'application courante soient traités (arrêt, tests); retourne False au délai"""
+    app = current_app._get_current_object()
+    pool = app.extensions.get('evenements')
+    if pool is None or pool[2] != os.getpid():
+        return True
+    places = pool[1]
+    limite = None if timeout is None else time.monotonic() + timeout
+    total = app.config['EVENT_WORKERS'] + app.config['EVENT_QUEUE_SIZE']
+    pris = 0
+    try:
+        while pris < total:
+            reste = None if limite is None else max(limite - time.monotonic(), 0)
+            if not places.acquire(timeout=reste):
+                return False
+            pris += 1
+        return True
+    finally:
+        for _ in range(pris):
+            places.release()
+
+@subscribe()
+def _journaliser_audit(evenement):
+    """Journal d'audit des opérations validées"""
+    donnees = {cle: valeur for cle, valeur in asdict(evenement).items() if cle != 'date'}
+    logging.getLogger('audit').info(f"{type(evenement).__name__} {evenement.date.isoformat(timespec='seconds')} {donnees}")
+
+def init_events(app):
+    """Enregistre les abonnés des services"""
+    import services.alerte_service  # noqa: F401  (abonnements aux ventes)
+    import flux  # noqa: F401  (flux temps réel des tableaux de bord)
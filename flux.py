@@ -0,0 +1,211 @@
+"""Flux temps réel des tableaux de bord (Server-Sent Events)
+
+Les événements métier validés (events.py) sont traduits en messages SSE:
+vente et annulation (montant, périodes du tableau de bord concernées),
+niveau de stock, ouverture et fermeture d'alerte de stock faible. Chaque
+message reçoit un numéro global (compteur `flux:seq` du stockage de cache)
+et y est déposé quelques instants (FLUX_MESSAGE_TTL): avec un stockage
+partagé, un message publié par un worker atteint les clients de tous les
+autres.
+
+Dans chaque processus, un seul thread relève les nouveaux messages toutes
+les FLUX_POLL_INTERVAL secondes et réveille les connexions, qui n'ont
+qu'une position dans un tampon commun: une connexion inactive ne coûte
+qu'un thread (ou une greenlet) en attente. Un client qui se reconnecte
+envoie Last-Event-ID et reçoit ce qu'il a manqué, ou `resynchroniser` si
+le tampon ne le couvre plus.
+"""
+import os
+import json
+import time
+import logging
+import threading
+from collections import deque
+from datetime import datetime, timedelta
+from flask import current_app
+from cache_backend import get_backend
+from events import subscribe, SaleCreated, SaleCancelled, PurchaseCreated, PurchaseCancelled
+
+CLE_SEQUENCE = 'flux:seq'
+
+class StreamHub:
+    """Tampon des derniers messages du processus et réveil des connexions"""
+
+    def __init__(self):
+        self._condition = threading.Condition()
+        self._verrou_releve = threading.Lock()
+        self._messages = deque()
+        self._dernier = None
+        self._manquants = {}
+        self._thread = None
+        self._pid = None
+        self.app = None
+        self.connexions = 0
+
+    def start(self, app):
+        """Démarre le thread de relève du processus (une fois par processus, après le fork)
+
+        Réglages et stockage du flux: ceux de `app`, la première application
+        qui ouvre une connexion dans le processus.
+        """
+        with self._condition:
+            if self._thread is not None and self._pid == os.getpid():
+                return
+            self.app = app
+            self._messages = deque(maxlen=app.config['FLUX_BUFFER'])
+            self._dernier = None
+            self._manquants.clear()
+            self._pid = os.getpid()
+            self._thread = threading.Thread(target=self._boucle, name='flux-releve', daemon=True)
+        self.poll()
+        self._thread.start()
+
+    def started(self):
+        return self._thread is not None and self._pid == os.getpid()
+
+    def _boucle(self):
+        while True:
+            time.sleep(self.app.config['FLUX_POLL_INTERVAL'])
+            try:
+                self.poll()
+            except Exception as e:
+                logging.warning(f"Relève du flux impossible: {str(e)}")
+
+    def poll(self):
+        """Lit les messages publiés depuis la dernière relève et réveille les connexions"""
+        with self._verrou_releve:
+            config = self.app.config
+            backend = get_backend(self.app)
+            courant = backend.get_counters([CLE_SEQUENCE])[0]
+            if self._dernier is None or courant < self._dernier:
+                # Premier relevé, ou compteur remis à zéro (stockage vidé)
+                self._dernier = courant
+                return
+            if courant == self._dernier:
+                return
+
+            premier = max(self._dernier + 1, courant - config['FLUX_BUFFER'] + 1)
+            numeros = list(range(premier, courant + 1))
+            nouveaux = []
+            maintenant = time.monotonic()
+            for numero, texte in zip(numeros, backend.get_many([f'flux:{n}' for n in numeros])):
+                if texte is None:
+                    # Numéro réservé mais message pas encore écrit: attendu un moment, puis abandonné
+                    if maintenant - self._manquants.setdefault(numero, maintenant) < config['FLUX_MISSING_GRACE']:
+                        break
+                    logging.warning(f"Message de flux {numero} perdu")
+                else:
+                    nouveaux.append((numero, texte))
+                self._manquants.pop(numero, None)
+                self._dernier = numero
+
+        if nouveaux:
+            with self._condition:
+                self._messages.extend(nouveaux)
+                self._condition.notify_all()
+
+    def stream(self, dernier_id=None):
+        """Générateur de la réponse SSE d'une connexion (après start)"""
+        config = self.app.config
+        with self._condition:
+            position = self._dernier if dernier_id is None else dernier_id
+            self.connexions += 1
+        try:
+            yield f"retry: {config['FLUX_RETRY_MS']}\n\n"
+            while True:
+                messages = []
+                with self._condition:
+                    perdus = self._hors_tampon(position)
+                    if perdus or position > self._dernier:
+                        # Messages sortis du tampon, ou compteur remis à zéro depuis le dernier id du client
+                        position = self._dernier
+                    else:
+                        messages = self._depuis(position)
+                        if not messages:
+                            self._condition.wait(config['FLUX_HEARTBEAT'])
+                            messages = self._depuis(position)
+                if perdus:
+                    yield "event: resynchroniser\ndata: {}\n\n"
+                elif messages:
+                    position = messages[-1][0]
+                    yield ''.join(texte for numero, texte in messages)
+                else:
+                    # Garde la connexion ouverte à travers les proxys et détecte les déconnexions
+                    yield ": ping\n\n"
+        finally:
+            with self._condition:
+                self.connexions -= 1
+
+    def _hors_tampon(self, position):
+        return position < self._dernier and (not self._messages or position < self._messages[0][0] - 1)
+
+    def _depuis(self, position):
+        return [message for message in self._messages if message[0] > position]
+
+hub = StreamHub()
+
+def broadcast(type_message, donnees):
+    """Publie un message SSE pour toutes les connexions, dans tous les workers"""
+    backend = get_backend()
+    numero = backend.incr(CLE_SEQUENCE)
+    texte = f"id: {numero}\nevent: {type_message}\ndata: {json.dumps(donnees, default=str)}\n\n"
+    backend.set(f'flux:{numero}', texte, current_app.config['FLUX_MESSAGE_TTL'])
+    if hub.started():
+        hub.poll()
+
+def dashboard_periods(date_vente):
+    """Périodes du tableau de bord (jour, semaine, mois) qui comptent une vente"""
+    aujourd_hui = datetime.now().date()
+    debut_jour = datetime.combine(aujourd_hui, datetime.min.time())
+    periodes = []
+    if debut_jour <= date_vente < debut_jour + timedelta(days=1):
+        periodes.append('jour')
+    if date_vente >= datetime.combine(aujourd_hui - timedelta(days=7), datetime.min.time()):
+        periodes.append('semaine')
+    if date_vente >= datetime.combine(aujourd_hui.replace(day=1), datetime.min.time()):
+        periodes.append('mois')
+    return periodes
+
+def _message_stock(evenement, variation):
+    """Niveau de stock, et ouverture ou fermeture de l'alerte si le seuil est franchi"""
+    broadcast('stock', {
+        'produit_id': evenement.produit_id,
+        'stock': evenement.stock_restant,
+        'seuil_alerte': evenement.seuil_alerte
+    })
+    avant = evenement.stock_restant - variation
+    if (avant <= evenement.seuil_alerte) != (evenement.stock_restant <= evenement.seuil_alerte):
+        from app import db
+        from models.produit import Produit
+        produit = db.session.get(Produit, evenement.produit_id)
+        broadcast('alerte', {
+            'produit_id': evenement.produit_id,
+            'produit_nom': produit.nom if produit else None,
+            'etat': 'ouverte' if evenement.stock_restant <= evenement.seuil_alerte else 'fermee',
+            'stock': evenement.stock_restant,
+            'urgent': evenement.stock_restant <= 0
+        })
+
+@subscribe(SaleCreated, SaleCancelled)
+def _diffuser_vente(evenement):
+    annulee = isinstance(evenement, SaleCancelled)
+    date_vente = evenement.date_vente if annulee else evenement.date
+    broadcast('vente_annulee' if annulee else 'vente', {
+        'vente_id': evenement.vente_id,
+        'produit_id': evenement.produit_id,
+        'quantite': evenement.quantite,
+        'montant': evenement.montant_total,
+        'periodes': dashboard_periods(date_vente)
+    })
+    _message_stock(evenement, evenement.quantite if annulee else -evenement.quantite)
+
+@subscribe(PurchaseCreated, PurchaseCancelled)
+def _diffuser_achat(evenement):
+    annule = isinstance(evenement, PurchaseCancelled)
+    broadcast('achat_annule' if annule else 'achat', {
+        'achat_id': evenement.achat_id,
+        'produit_id': evenement.produit_id,
+        'quantite': evenement.quantite,
+        'montant': evenement.montant_total
+    })
+    _message_stock(evenement, -evenement.quantite if annule else evenement.quantite)
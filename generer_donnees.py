@@ -0,0 +1,249 @@
+"""Génère un jeu de données synthétique à l'échelle de la production
+
+Remplit produits, clients, ventes et achats par insertions groupées, avec
+des distributions réalistes: popularité des produits en loi de Zipf,
+saisonnalité (fêtes de fin d'année, week-ends, croissance), remises et
+annulations. L'échelle est le nombre de ventes; les autres tables suivent.
+
+    python generer_donnees.py --echelle 100k [--base sqlite:///bench_100k.db] [--reinitialiser]
+"""
+import math
+import time
+import random
+import argparse
+import itertools
+from datetime import datetime, timedelta
+from sqlalchemy import insert, text
+from config import Config
+from money import Money
+
+ECHELLES = {
+    '10k': 10_000,
+    '100k': 100_000,
+    '1m': 1_000_000,
+    '10m': 10_000_000,
+}
+
+CATEGORIES = ['Riz', 'Huile', 'Sucre', 'Savon', 'Farine', 'Café', 'Thé', 'Lait', 'Biscuits', 'Conserves',
+              'Piles', 'Bougies', 'Allumettes', 'Sel', 'Pâtes', 'Boissons', 'Cahiers', 'Stylos']
+VILLES = ['Antananarivo', 'Toamasina', 'Antsirabe', 'Fianarantsoa', 'Mahajanga', 'Toliara', 'Antsiranana']
+FOURNISSEURS = [f'Fournisseur {nom}' for nom in (
+    'Analamanga', 'Vakinankaratra', 'Atsinanana', 'Boeny', 'Haute Matsiatra', 'Diana', 'Sava', 'Itasy',
+    'Alaotra', 'Menabe', 'Sofia', 'Amoron\'i Mania', 'Vatovavy', 'Anosy', 'Androy', 'Melaky'
+)]
+
+# Profil hebdomadaire (lundi → dimanche) et horaire des transactions
+POIDS_JOUR_SEMAINE = [0.9, 0.9, 0.95, 1.0, 1.15, 1.35, 0.75]
+POIDS_HEURE = [0, 0, 0, 0, 0, 0, 1, 3, 6, 8, 9, 10, 9, 7, 7, 8, 9, 10, 8, 5, 3, 1, 0, 0]
+QUANTITES, POIDS_QUANTITES = [1, 2, 3, 4, 5, 10, 20], [50, 20, 12, 7, 5, 4, 2]
+REMISES, POIDS_REMISES = [0.0, 5.0, 10.0, 15.0], [82, 10, 6, 2]
+
+TAUX_ANNULATION_VENTES = 0.03
+TAUX_ANNULATION_ACHATS = 0.01
+
+def dimensions(lignes):
+    """Nombre de lignes de chaque table pour une échelle (nombre de ventes)"""
+    return {
+        'produits': min(max(lignes // 500, 50), 20_000),
+        'clients': min(max(lignes // 50, 100), 200_000),
+        'ventes': lignes,
+        'achats': max(lignes // 8, 10),
+    }
+
+def create_bench_app(url=None):
+    """Application sur la base donnée, sans réplique, schéma créé au besoin"""
+    from app import create_app
+
+    class ConfigBanc(Config):
+        SQLALCHEMY_DATABASE_URI = url or Config.SQLALCHEMY_DATABASE_URI
+        DATABASE_READ_URL = None
+        AUTO_CREATE_SCHEMA = True
+
+    return create_app(ConfigBanc)
+
+def zipf_weights(n, exposant):
+    """Poids cumulés d'une loi de Zipf sur n rangs"""
+    return list(itertools.accumulate(1.0 / (rang ** exposant) for rang in range(1, n + 1)))
+
+def seasonal_day_weights(debut, jours):
+    """Poids cumulés de chaque jour: saison, fêtes, jour de semaine et croissance"""
+    poids = []
+    for i in range(jours):
+        jour = debut + timedelta(days=i)
+        # Pic annuel fin décembre, creux en milieu d'année
+        saison = 1 + 0.25 * math.cos(2 * math.pi * (jour.timetuple().tm_yday - 355) / 365)
+        fetes = 1.6 if jour.month == 12 and jour.day >= 15 else 1.0
+        croissance = 1 + 0.3 * i / jours
+        poids.append(saison * fetes * croissance * POIDS_JOUR_SEMAINE[jour.weekday()])
+    return list(itertools.accumulate(poids))
+
+def _date_aleatoire(rng, debut, jours, poids_jours, heures_cumulees):
+    jour = rng.choices(range(jours), cum_weights=poids_jours)[0]
+    heure = rng.choices(range(24), cum_weights=heures_cumulees)[0]
+    return debut + timedelta(days=jour, hours=heure, seconds=rng.randrange(3600))
+
+def _inserer(db, table, lignes_iter, taille_lot, total, nom):
+    """Insère par lots (executemany) en validant chaque lot"""
+    inseres = 0
+    debut = time.perf_counter()
+    while True:
+        lot = list(itertools.islice(lignes_iter, taille_lot))
+        if not lot:
+            break
+        db.session.execute(insert(table), lot)
+        db.session.commit()
+        inseres += len(lot)
+        print(f"\r{nom}: {inseres}/{total} ({inseres / (time.perf_counter() - debut):,.0f} lignes/s)", end='', flush=True)
+    print()
+    return inseres
+
+def _produits(rng, n):
+    for i in range(n):
+        prix_achat = Money(round(rng.lognormvariate(math.log(15000), 0.9), -2)) or Money(100)
+        taux_marge = rng.uniform(15, 60)
+        stock = rng.randint(0, 400)
+        yield {
+            'id': i + 1,
+            'nom': f'{rng.choice(CATEGORIES)} {i + 1:05d}',
+            'description': None,
+            'prix_achat': prix_achat,
+            'prix_vente': Money(round(prix_achat * (1 + taux_marge / 100), -2)),
+            'stock_initial': stock,
+            'stock_actuel': stock,
+            'stock_minimum': rng.choice([5, 10, 20]),
+            'taux_marge': round(taux_marge, 1),
+            'date_creation': datetime.utcnow(),
+            'actif': rng.random() > 0.02,
+        }
+
+def _clients(rng, n):
+    for i in range(n):
+        yield {
+            'id': i + 1,
+            'nom': f'Client {i + 1:06d}',
+            'email': f'client{i + 1}@exemple.mg',
+            'telephone': f'03{rng.choice("2348")} {rng.randint(10, 99)} {rng.randint(100, 999)} {rng.randint(10, 99)}',
+            'adresse': rng.choice(VILLES),
+            'date_inscription': datetime.utcnow(),
+        }
+
+def _ventes(rng, n, prix, rangs_produits, nb_clients, debut, jours):
+    poids_produits = zipf_weights(len(rangs_produits), 1.07)
+    # Clients fidèles: popularité plus plate que celle des produits
+    poids_clients = zipf_weights(nb_clients, 0.8)
+    poids_jours = seasonal_day_weights(debut, jours)
+    heures = list(itertools.accumulate(POIDS_HEURE))
+    for i in range(n):
+        produit_id = rangs_produits[rng.choices(range(len(rangs_produits)), cum_weights=poids_produits)[0]]
+        prix_achat, prix_vente = prix[produit_id]
+        quantite = rng.choices(QUANTITES, weights=POIDS_QUANTITES)[0]
+        remise = rng.choices(REMISES, weights=POIDS_REMISES)[0]
+        montant_brut = quantite * prix_vente
+        montant_remise = montant_brut.percentage(remise)
+        annulee = rng.random() < TAUX_ANNULATION_VENTES
+        yield {
+            'id': i + 1,
+            'produit_id': produit_id,
+            'client_id': rng.choices(range(1, nb_clients + 1), cum_weights=poids_clients)[0],
+            'quantite': quantite,
+            'prix_unitaire': prix_vente,
+            'remise': remise,
+            'montant_remise': montant_remise,
+            'montant_total': montant_brut - montant_remise,
+            'cout_achat': quantite * prix_achat,
+            'date_vente': _date_aleatoire(rng, debut, jours, poids_jours, heures),
+            'statut': 'cancelled' if annulee else 'completed',
+            'notes': 'Annulée: erreur de saisie' if annulee else None,
+        }
+
+def _achats(rng, n, prix, rangs_produits, debut, jours):
+    # Les produits les plus vendus sont aussi les plus réapprovisionnés
+    poids_produits = zipf_weights(len(rangs_produits), 0.9)
+    poids_fournisseurs = zipf_weights(len(FOURNISSEURS), 1.0)
+    poids_jours = seasonal_day_weights(debut, jours)
+    heures = list(itertools.accumulate(POIDS_HEURE))
+    for i in range(n):
+        produit_id = rangs_produits[rng.choices(range(len(rangs_produits)), cum_weights=poids_produits)[0]]
+        quantite = rng.choice([10, 20, 24, 50, 100, 200])
+        prix_unitaire = Money(round(prix[produit_id][0] * rng.uniform(0.95, 1.05), -1))
+        annule = rng.random() < TAUX_ANNULATION_ACHATS
+        yield {
+            'id': i + 1,
+            'produit_id': produit_id,
+            'quantite': quantite,
+            'prix_unitaire': prix_unitaire,
+            'montant_total': quantite * prix_unitaire,
+            'fournisseur': FOURNISSEURS[rng.choices(range(len(FOURNISSEURS)), cum_weights=poids_fournisseurs)[0]],
+            'date_achat': _date_aleatoire(rng, debut, jours, poids_jours, heures),
+            'statut': 'cancelled' if annule else 'completed',
+            'notes': 'Annulé: livraison refusée' if annule else None,
+            'numero_facture': f'FAC-{i + 1:08d}',
+        }
+
+def generate(lignes, graine=42, jours=730, taille_lot=10_000, reinitialiser=False):
+    """Remplit la base de l'application courante et retourne le nombre de lignes par table"""
+    from app import db, create_schema
+    from models.produit import Produit
+    from models.client import Client
+    from models.vente import Vente
+    from models.achat import Achat
+
+    if reinitialiser:
+        db.drop_all()
+        create_schema()
+    elif db.session.query(Vente.id).first() is not None or db.session.query(Produit.id).first() is not None:
+        raise RuntimeError("La base contient déjà des données (utiliser --reinitialiser)")
+
+    rng = random.Random(graine)
+    tailles = dimensions(lignes)
+    debut = datetime.combine(datetime.utcnow().date() - timedelta(days=jours), datetime.min.time())
+
+    produits = list(_produits(rng, tailles['produits']))
+    prix = {p['id']: (p['prix_achat'], p['prix_vente']) for p in produits}
+    # Rang de popularité indépendant de l'identifiant
+    rangs_produits = [p['id'] for p in produits]
+    rng.shuffle(rangs_produits)
+
+    resultat = {
+        'produits': _inserer(db, Produit, iter(produits), taille_lot, tailles['produits'], 'produits'),
+        'clients': _inserer(db, Client, _clients(rng, tailles['clients']), taille_lot, tailles['clients'], 'clients'),
+        'ventes': _inserer(db, Vente, _ventes(rng, tailles['ventes'], prix, rangs_produits, tailles['clients'], debut, jours),
+                           taille_lot, tailles['ventes'], 'ventes'),
+        'achats': _inserer(db, Achat, _achats(rng, tailles['achats'], prix, rangs_produits, debut, jours),
+                           taille_lot, tailles['achats'], 'achats'),
+    }
+
+    # Identifiants fournis explicitement: les séquences PostgreSQL doivent suivre
+    if db.engine.dialect.name == 'postgresql':
+        for table in resultat:
+            db.session.execute(text(
+                f"SELECT setval(pg_get_serial_sequence('{table}', 'id'), (SELECT MAX(id) FROM {table}))"
+            ))
+
+    # Cumuls de ventes des produits: insertions groupées, hors VenteService
+    from services.vente_service import VenteService
+    VenteService.recompute_product_totals()
+
+    # Statistiques de l'optimiseur à jour après un chargement massif
+    db.session.execute(text('ANALYZE'))
+    db.session.commit()
+    return resultat
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--echelle', choices=ECHELLES, default='10k', help="Nombre de ventes")
+    parser.add_argument('--base', help="URL de la base (DATABASE_URL par défaut)")
+    parser.add_argument('--graine', type=int, default=42)
+    parser.add_argument('--jours', type=int, default=730, help="Historique couvert, en jours")
+    parser.add_argument('--taille-lot', type=int, default=10_000)
+    parser.add_argument('--reinitialiser', action='store_true', help="Supprime et recrée les tables")
+    args = parser.parse_args()
+
+    application = create_bench_app(args.base)
+    with application.app_context():
+        debut = time.perf_counter()
+        resultat = generate(ECHELLES[args.echelle], args.graine, args.jours, args.taille_lot, args.reinitialiser)
+        print(f"{sum(resultat.values()):,} lignes générées en {time.perf_counter() - debut:.1f}s: {resultat}")
+
+if __name__ == '__main__':
+    main()
@@ -1,47 +1,133 @@
 # Use this Flask blueprint for Google authentication. Do not use flask-dance.
 
 import json
+import logging
 import os
+import threading
+from datetime import datetime, timezone
+from email.utils import parsedate_to_datetime
 
 import requests
+from requests.adapters import HTTPAdapter
+from urllib3.util.retry import Retry
 from app import db
-from flask import Blueprint, redirect, request, url_for, flash
+from cache_backend import get_backend
+from utils.auth import AuthUtils
+from flask import Blueprint, redirect, request, url_for, flash, current_app
 from flask_login import login_required, login_user, logout_user
 from models.client import Client
 from oauthlib.oauth2 import WebApplicationClient
 
-GOOGLE_CLIENT_ID = os.environ.get("GOOGLE_OAUTH_CLIENT_ID", "")
-GOOGLE_CLIENT_SECRET = os.environ.get("GOOGLE_OAUTH_CLIENT_SECRET", "")
-GOOGLE_DISCOVERY_URL = "https://accounts.google.com/.well-known/openid-configuration"
-
 # Make sure to use this redirect URL. It has to match the one in the whitelist
 DEV_REDIRECT_URL = f'https://{os.environ.get("REPLIT_DEV_DOMAIN", "localhost:5000")}/google_login/callback'
 
-# ALWAYS display setup instructions to the user:
-print(f"""To make Google authentication work:
+
+def setup_instructions():
+    """Instructions de configuration OAuth (affichées au démarrage si les identifiants manquent)"""
+    return f"""To make Google authentication work:
 1. Go to https://console.cloud.google.com/apis/credentials
 2. Create a new OAuth 2.0 Client ID
 3. Add {DEV_REDIRECT_URL} to Authorized redirect URIs
 
 For detailed instructions, see:
 https://docs.replit.com/additional-resources/google-auth-in-flask#set-up-your-oauth-app--client
-""")
-
-client = WebApplicationClient(GOOGLE_CLIENT_ID)
+"""
+
+_verrou_session_http = threading.Lock()
+
+
+def _identifiants():
+    """Identifiant et secret du client OAuth de l'application ('' si absents)"""
+    config = current_app.config
+    return config["GOOGLE_OAUTH_CLIENT_ID"], config["GOOGLE_OAUTH_CLIENT_SECRET"]
+
+
+def get_http_session():
+    """Session HTTP partagée (pool de connexions, reprises), une par application et par processus"""
+    app = current_app._get_current_object()
+    with _verrou_session_http:
+        session, pid = app.extensions.get("session_oidc", (None, None))
+        if session is None or pid != os.getpid():
+            # Les POST (échange du code) ne sont repris que sur échec de connexion
+            reprises = Retry(
+                total=app.config["OIDC_HTTP_RETRIES"],
+                backoff_factor=0.3,
+                status_forcelist=(500, 502, 503, 504),
+                allowed_methods=frozenset({"GET"}),
+            )
+            session = requests.Session()
+            session.mount("https://", HTTPAdapter(max_retries=reprises, pool_maxsize=10))
+            session.mount("http://", HTTPAdapter(max_retries=reprises, pool_maxsize=10))
+            app.extensions["session_oidc"] = (session, os.getpid())
+    return session
+
+
+def http_request(method, url, **kwargs):
+    """Requête sortante avec délai d'attente par défaut"""
+    config = current_app.config
+    kwargs.setdefault("timeout", (config["OIDC_HTTP_CONNECT_TIMEOUT"], config["OIDC_HTTP_READ_TIMEOUT"]))
+    return get_http_session().request(method, url, **kwargs)
+
+
+def _duree_cache(response):
+    """Durée de validité d'une réponse d'après ses en-têtes HTTP (Cache-Control, Expires)"""
+    cache_control = response.headers.get("Cache-Control", "")
+    directives = {}
+    for partie in cache_control.lower().split(","):
+        nom, _, valeur = partie.strip().partition("=")
+        if nom:
+            directives[nom] = valeur.strip('"')
+    if "no-store" in directives or "no-cache" in directives:
+        return 0
+    if directives.get("max-age", "").isdigit():
+        return max(0, int(directives["max-age"]) - int(response.headers.get("Age", "0") or 0))
+    expires = response.headers.get("Expires")
+    if expires:
+        try:
+            return max(0, int((parsedate_to_datetime(expires) - datetime.now(timezone.utc)).total_seconds()))
+        except (TypeError, ValueError):
+            return 0
+    return current_app.config["OIDC_DISCOVERY_DEFAULT_TTL"]
+
+
+def get_provider_config():
+    """Document de découverte OIDC, mis en cache selon ses en-têtes HTTP"""
+    url = current_app.config["OIDC_DISCOVERY_URL"]
+    cle = f"oidc:decouverte:{url}"
+    trouve, configuration = get_backend().get(cle)
+    if trouve:
+        return configuration
+
+    response = http_request("GET", url)
+    response.raise_for_status()
+    configuration = response.json()
+    duree = _duree_cache(response)
+    if duree > 0:
+        get_backend().set(cle, configuration, ttl=duree)
+    return configuration
 
 google_auth = Blueprint("google_auth", __name__)
 
 
+@google_auth.record_once
+def _signaler_configuration(state):
+    if not state.app.config["GOOGLE_OAUTH_CLIENT_ID"] or not state.app.config["GOOGLE_OAUTH_CLIENT_SECRET"]:
+        logging.warning(setup_instructions())
+
+
 @google_auth.route("/google_login")
+@AuthUtils.rate_limit('connexion')
 def login():
-    if not GOOGLE_CLIENT_ID or not GOOGLE_CLIENT_SECRET:
+    client_id, client_secret = _identifiants()
+    if not client_id or not client_secret:
         flash("Google OAuth non configuré. Veuillez configurer GOOGLE_OAUTH_CLIENT_ID et GOOGLE_OAUTH_CLIENT_SECRET.", "error")
         return redirect(url_for("main.login"))
     
     try:
-        google_provider_cfg = requests.get(GOOGLE_DISCOVERY_URL).json()
+        google_provider_cfg = get_provider_config()
         authorization_endpoint = google_provider_cfg["authorization_endpoint"]
 
+        client = WebApplicationClient(client_id)
         request_uri = client.prepare_request_uri(
             authorization_endpoint,
             # Replacing http:// with https:// is important as the external
@@ -62,10 +148,13 @@ def callback():
         flash("Authentification Google annulée.", "warning")
         return redirect(url_for("main.login"))
     
+    client_id, client_secret = _identifiants()
     try:
-        google_provider_cfg = requests.get(GOOGLE_DISCOVERY_URL).json()
+        google_provider_cfg = get_provider_config()
         token_endpoint = google_provider_cfg["token_endpoint"]
 
+        # Un client OAuth par requête: il conserve le jeton reçu
+        client = WebApplicationClient(client_id)
         token_url, headers, body = client.prepare_token_request(
             token_endpoint,
             # Replacing http:// with https:// is important as the external
@@ -74,18 +163,21 @@ def callback():
             redirect_url=request.base_url.replace("http://", "https://"),
             code=code,
         )
-        token_response = requests.post(
+        token_response = http_request(
+            "POST",
             token_url,
             headers=headers,
             data=body,
-            auth=(GOOGLE_CLIENT_ID, GOOGLE_CLIENT_SECRET),
+            auth=(client_id, client_secret),
         )
+        token_response.raise_for_status()
 
         client.parse_request_body_response(json.dumps(token_response.json()))
 
         userinfo_endpoint = google_provider_cfg["userinfo_endpoint"]
         uri, headers, body = client.add_token(userinfo_endpoint)
-        userinfo_response = requests.get(uri, headers=headers, data=body)
+        userinfo_response = http_request("GET", uri, headers=headers, data=body)
+        userinfo_response.raise_for_status()
 
         userinfo = userinfo_response.json()
         if userinfo.get("email_verified"):
@@ -108,6 +200,11 @@ def callback():
 
         return redirect(url_for("main.index"))
     
+    except requests.HTTPError as e:
+        # Code refusé ou expiré, jeton invalide, indisponibilité de Google
+        logging.warning(f"Échec de la connexion Google: {e.response.status_code} sur {e.response.url.split('?')[0]}")
+        flash("La connexion avec Google a échoué. Veuillez réessayer.", "error")
+        return redirect(url_for("main.login"))
     except Exception as e:
         flash(f"Erreur lors de l'authentification: {str(e)}", "error")
         return redirect(url_for("main.login"))
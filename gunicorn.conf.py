@@ -0,0 +1,35 @@
+# Configuration gunicorn (chargée automatiquement depuis le répertoire courant)
+#   gunicorn main:app
+import os
+import multiprocessing
+
+bind = os.environ.get('GUNICORN_BIND', '0.0.0.0:5000')
+workers = int(os.environ.get('WEB_CONCURRENCY', multiprocessing.cpu_count() * 2 + 1))
+threads = int(os.environ.get('GUNICORN_THREADS', 2))
+
+# Versions de tables du cache, limitation de débit et flux SSE doivent être
+# vus par tous les workers (et par une éventuelle instance dédiée au flux):
+# stockage partagé par défaut, stockage par processus refusé à plusieurs workers
+os.environ.setdefault('CACHE_BACKEND', 'partage')
+if workers > 1 and os.environ['CACHE_BACKEND'] == 'memoire':
+    raise RuntimeError(
+        "CACHE_BACKEND=memoire ne fonctionne qu'avec un seul worker: "
+        "utiliser partage ou redis, ou WEB_CONCURRENCY=1"
+    )
+
+# Chaque connexion au flux SSE (/dashboard/flux) occupe un thread du worker.
+# Pour des centaines de tableaux de bord ouverts, servir /dashboard/flux par
+# une instance dédiée à workers asynchrones (paquet gevent), par exemple:
+#   GUNICORN_WORKER_CLASS=gevent WEB_CONCURRENCY=1 GUNICORN_BIND=0.0.0.0:5001 gunicorn main:app
+# (stockage partagé ci-dessus, ou redis si les instances sont sur des machines différentes).
+worker_class = os.environ.get('GUNICORN_WORKER_CLASS', 'gthread')
+worker_connections = int(os.environ.get('GUNICORN_WORKER_CONNECTIONS', 1000))  # Workers asynchrones
+
+# Workers à threads: le flux ne doit jamais occuper tous les threads d'un worker
+if worker_class in ('gthread', 'sync'):
+    os.environ.setdefault('FLUX_MAX_CONNECTIONS', str(max(threads - 1, 0)))
+
+# L'application est chargée une seule fois avant le fork: démarrage rapide et
+# mémoire partagée entre workers. Les connexions du pool héritées du maître
+# sont abandonnées dans chaque worker (app.py: un seul hook os.register_at_fork).
+preload_app = os.environ.get('GUNICORN_PRELOAD', '1') not in ('0', 'false', 'False')
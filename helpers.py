@@ -74,8 +74,8 @@ def paginate_results(query, page, per_page=20):
         error_out=False
     )
 
-def export_to_csv(data, filename, headers):
-    """Exporte des données vers un fichier CSV"""
+def build_csv(data, headers):
+    """Construit le contenu CSV d'un tableau de données"""
     output = io.StringIO()
     writer = csv.writer(output)
     
@@ -86,8 +86,12 @@ def export_to_csv(data, filename, headers):
     for row in data:
         writer.writerow(row)
     
+    return output.getvalue()
+
+def export_to_csv(data, filename, headers):
+    """Exporte des données vers un fichier CSV"""
     # Créer la réponse
-    response = make_response(output.getvalue())
+    response = make_response(build_csv(data, headers))
     response.headers["Content-Disposition"] = f"attachment; filename={filename}"
     response.headers["Content-type"] = "text/csv; charset=utf-8"
     
@@ -131,8 +135,9 @@ def safe_divide(numerator, denominator, default=0):
     return numerator / denominator
 
 def round_currency(amount):
-    """Arrondit un montant à la devise (Ariary = entier)"""
-    return round(amount)
+    """Arrondit un montant à la devise (Ariary = entier, demis éloignés de zéro)"""
+    from money import Money
+    return Money(amount)
 
 def get_fiscal_year_dates(year=None):
     """Retourne les dates de début et fin d'année fiscale"""
@@ -0,0 +1,146 @@
+from models.lot_stock import LotStock, ConsommationLot
+from models.vente import Vente
+from models.produit import Produit
+from app import db
+from db_routing import current_store
+from flask import current_app
+from datetime import datetime
+from sqlalchemy import func
+from money import Money
+
+class LotService:
+    """Service de valorisation FIFO par couches de stock (lots du magasin courant)"""
+    
+    @staticmethod
+    def fifo_active():
+        """Indique si la valorisation FIFO est activée"""
+        return current_app.config['COSTING_METHOD'] == 'fifo'
+    
+    @staticmethod
+    def open_lot(achat, produit, stock_avant):
+        """Ouvre le lot correspondant à un achat (l'achat doit avoir un id)"""
+        # Le stock antérieur non couvert par des lots devient un lot d'ouverture
+        stock_en_lots = db.session.query(
+            func.coalesce(func.sum(LotStock.quantite_restante), 0)
+        ).filter(LotStock.produit_id == produit.id).scalar()
+        if stock_avant > stock_en_lots:
+            LotService._open_opening_lot(produit, stock_avant - stock_en_lots)
+        
+        lot = LotStock()
+        lot.produit_id = produit.id
+        lot.magasin_id = achat.magasin_id
+        lot.achat_id = achat.id
+        lot.quantite_initiale = achat.quantite
+        lot.quantite_restante = achat.quantite
+        lot.prix_unitaire = achat.prix_unitaire
+        lot.date_entree = achat.date_achat or datetime.utcnow()
+        db.session.add(lot)
+        return lot
+    
+    @staticmethod
+    def consume(vente, produit, stock_avant):
+        """Prélève les lots les plus anciens pour une vente et retourne son coût d'achat
+        
+        Les lots épuisés ne sont plus jamais relus: le coût d'une vente est
+        résolu en temps amorti constant par unité de lot consommée.
+        """
+        return LotService._prelever(produit, vente.quantite, vente.id, stock_avant)
+    
+    @staticmethod
+    def restore_vente(vente):
+        """Remet dans leurs lots d'origine les quantités prélevées par une vente"""
+        consommations = ConsommationLot.query.filter_by(vente_id=vente.id).all()
+        for consommation in consommations:
+            lot = db.session.get(LotStock, consommation.lot_id)
+            lot.quantite_restante += consommation.quantite
+            db.session.delete(consommation)
+        return len(consommations)
+    
+    @staticmethod
+    def cancel_lot(achat, produit, stock_actuel):
+        """Supprime le lot d'un achat annulé (stock_actuel: stock du magasin de l'achat)
+        
+        Les ventes qui avaient consommé ce lot sont réaffectées aux lots
+        suivants et leur coût d'achat est recalculé.
+        """
+        lot = LotStock.query.filter_by(achat_id=achat.id).first()
+        if not lot:
+            return False
+        
+        stock_hors_lot = stock_actuel - lot.quantite_restante
+        ecart_benefice = Money(0)
+        consommations = ConsommationLot.query.filter_by(lot_id=lot.id).all()
+        for consommation in consommations:
+            vente = db.session.get(Vente, consommation.vente_id)
+            quantite = consommation.quantite
+            ancien_cout = quantite * consommation.prix_unitaire
+            db.session.delete(consommation)
+            
+            nouveau_cout = LotService._prelever(
+                produit, quantite, vente.id, stock_hors_lot, exclure_lot_id=lot.id
+            )
+            stock_hors_lot -= quantite
+            if vente.cout_achat is not None:
+                vente.cout_achat += nouveau_cout - ancien_cout
+                if vente.statut == 'completed':
+                    ecart_benefice -= nouveau_cout - ancien_cout
+        
+        # Le bénéfice cumulé du produit suit le coût réaffecté de ses ventes
+        if ecart_benefice:
+            produit.benefice_ventes = Produit.benefice_ventes + ecart_benefice
+        
+        db.session.flush()
+        db.session.delete(lot)
+        return True
+    
+    @staticmethod
+    def _prelever(produit, quantite, vente_id, stock_disponible, exclure_lot_id=None):
+        """Consomme `quantite` unités dans l'ordre FIFO et retourne le coût total"""
+        lots_query = LotStock.query.filter(
+            LotStock.produit_id == produit.id,
+            LotStock.quantite_restante > 0
+        )
+        if exclure_lot_id:
+            lots_query = lots_query.filter(LotStock.id != exclure_lot_id)
+        
+        restant = quantite
+        cout = Money(0)
+        for lot in lots_query.order_by(LotStock.date_entree, LotStock.id).limit(quantite):
+            pris = min(lot.quantite_restante, restant)
+            lot.quantite_restante -= pris
+            cout += LotService._enregistrer_consommation(vente_id, lot, pris)
+            restant -= pris
+            if restant == 0:
+                return cout
+        
+        # Stock antérieur à la valorisation FIFO: lot d'ouverture au coût moyen pondéré
+        ecart = max(stock_disponible - (quantite - restant), restant)
+        lot = LotService._open_opening_lot(produit, ecart)
+        db.session.flush()
+        lot.quantite_restante -= restant
+        cout += LotService._enregistrer_consommation(vente_id, lot, restant)
+        return cout
+    
+    @staticmethod
+    def _open_opening_lot(produit, quantite):
+        """Crée un lot d'ouverture pour le stock non couvert par des achats"""
+        lot = LotStock()
+        lot.produit_id = produit.id
+        lot.magasin_id = current_store()
+        lot.quantite_initiale = quantite
+        lot.quantite_restante = quantite
+        lot.prix_unitaire = produit.prix_achat
+        lot.date_entree = produit.date_creation or datetime.utcnow()
+        db.session.add(lot)
+        return lot
+    
+    @staticmethod
+    def _enregistrer_consommation(vente_id, lot, quantite):
+        """Enregistre le prélèvement d'une vente sur un lot et retourne son coût"""
+        consommation = ConsommationLot()
+        consommation.vente_id = vente_id
+        consommation.lot_id = lot.id
+        consommation.quantite = quantite
+        consommation.prix_unitaire = lot.prix_unitaire
+        db.session.add(consommation)
+        return quantite * lot.prix_unitaire
@@ -0,0 +1,48 @@
+from app import db
+from datetime import datetime
+from money import MoneyType
+
+class LotStock(db.Model):
+    """Couche de stock (lot) ouverte par un achat, consommée en FIFO par les ventes"""
+    __tablename__ = 'lots_stock'
+    __table_args__ = (
+        db.Index('ix_lots_stock_fifo', 'produit_id', 'date_entree', 'id'),
+    )
+    
+    id = db.Column(db.Integer, primary_key=True)
+    produit_id = db.Column(db.Integer, db.ForeignKey('produits.id'), nullable=False)
+    magasin_id = db.Column(db.Integer, db.ForeignKey('magasins.id'), index=True)  # None: magasin par défaut
+    achat_id = db.Column(db.Integer, db.ForeignKey('achats.id'), index=True)  # None pour le stock d'ouverture
+    quantite_initiale = db.Column(db.Integer, nullable=False)
+    quantite_restante = db.Column(db.Integer, nullable=False)
+    prix_unitaire = db.Column(MoneyType, nullable=False)  # Coût unitaire en Ariary (MGA)
+    date_entree = db.Column(db.DateTime, default=datetime.utcnow)
+    
+    def __repr__(self):
+        return f'<LotStock {self.id} - {self.quantite_restante}/{self.quantite_initiale} unités>'
+    
+    def to_dict(self):
+        """Convertit l'objet en dictionnaire"""
+        return {
+            'id': self.id,
+            'produit_id': self.produit_id,
+            'magasin_id': self.magasin_id,
+            'achat_id': self.achat_id,
+            'quantite_initiale': self.quantite_initiale,
+            'quantite_restante': self.quantite_restante,
+            'prix_unitaire': self.prix_unitaire,
+            'date_entree': self.date_entree.isoformat() if self.date_entree else None
+        }
+
+class ConsommationLot(db.Model):
+    """Quantité prélevée sur un lot par une vente (permet la restauration à l'annulation)"""
+    __tablename__ = 'consommations_lot'
+    
+    id = db.Column(db.Integer, primary_key=True)
+    vente_id = db.Column(db.Integer, db.ForeignKey('ventes.id'), nullable=False, index=True)
+    lot_id = db.Column(db.Integer, db.ForeignKey('lots_stock.id'), nullable=False, index=True)
+    quantite = db.Column(db.Integer, nullable=False)
+    prix_unitaire = db.Column(MoneyType, nullable=False)
+    
+    def __repr__(self):
+        return f'<ConsommationLot vente {self.vente_id} - lot {self.lot_id}: {self.quantite}>'
@@ -0,0 +1,52 @@
+from app import db
+from datetime import datetime
+
+class Magasin(db.Model):
+    """Point de vente; ses tables de transactions peuvent avoir leur propre base (MAGASIN_DATABASES)"""
+    __tablename__ = 'magasins'
+
+    id = db.Column(db.Integer, primary_key=True)
+    nom = db.Column(db.String(100), nullable=False)
+    code = db.Column(db.String(20), unique=True, nullable=False)
+    adresse = db.Column(db.Text)
+    actif = db.Column(db.Boolean, default=True)
+    date_creation = db.Column(db.DateTime, default=datetime.utcnow)
+
+    def __repr__(self):
+        return f'<Magasin {self.code}>'
+
+    def to_dict(self):
+        """Convertit l'objet en dictionnaire"""
+        from db_routing import store_is_sharded
+        return {
+            'id': self.id,
+            'nom': self.nom,
+            'code': self.code,
+            'adresse': self.adresse,
+            'actif': self.actif,
+            'base_dediee': store_is_sharded(self.id),
+            'date_creation': self.date_creation.isoformat() if self.date_creation else None
+        }
+
+class StockMagasin(db.Model):
+    """Stock d'un produit dans un magasin (Produit.stock_actuel en est la somme)"""
+    __tablename__ = 'stocks_magasin'
+    __table_args__ = (
+        db.UniqueConstraint('produit_id', 'magasin_id', name='uq_stocks_magasin_produit_magasin'),
+    )
+
+    id = db.Column(db.Integer, primary_key=True)
+    produit_id = db.Column(db.Integer, db.ForeignKey('produits.id'), nullable=False)
+    magasin_id = db.Column(db.Integer, db.ForeignKey('magasins.id'), nullable=False, index=True)
+    quantite = db.Column(db.Integer, nullable=False, default=0)
+
+    def __repr__(self):
+        return f'<StockMagasin produit {self.produit_id} - magasin {self.magasin_id}: {self.quantite}>'
+
+    def to_dict(self):
+        """Convertit l'objet en dictionnaire"""
+        return {
+            'produit_id': self.produit_id,
+            'magasin_id': self.magasin_id,
+            'quantite': self.quantite
+        }
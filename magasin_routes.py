@@ -0,0 +1,88 @@
+from flask import Blueprint, render_template, request, redirect, url_for, flash, session, g
+from flask_login import login_required, current_user
+from services.magasin_service import MagasinService
+from services.statistique_service import StatistiqueService
+from utils.auth import AuthUtils
+from utils.helpers import get_date_range
+from db_routing import current_store, use_store
+from datetime import datetime
+
+magasin_bp = Blueprint('magasin', __name__, url_prefix='/magasins')
+
+@magasin_bp.before_app_request
+def _magasin_de_la_session():
+    """Magasin choisi par l'utilisateur (aucun: tous les magasins de la base primaire)"""
+    g.contexte_magasin = use_store(session.get('magasin'))
+    g.contexte_magasin.__enter__()
+
+@magasin_bp.teardown_app_request
+def _quitter_magasin(exception=None):
+    contexte = g.pop('contexte_magasin', None)
+    if contexte is not None:
+        contexte.__exit__(None, None, None)
+
+@magasin_bp.app_context_processor
+def _magasins_navigation():
+    if not current_user.is_authenticated:
+        return {}
+    try:
+        return {'magasins': MagasinService.get_all_magasins(), 'magasin_courant': current_store()}
+    except Exception:
+        return {}
+
+@magasin_bp.route('/')
+@login_required
+def list_magasins():
+    """Liste les magasins et compare leurs résultats sur la période"""
+    try:
+        period = request.args.get('period', 'month', type=str)
+        date_debut, date_fin = get_date_range(period)
+
+        comparaison = StatistiqueService.get_store_comparison(
+            datetime.combine(date_debut, datetime.min.time()) if date_debut else None,
+            datetime.combine(date_fin, datetime.max.time()) if date_fin else None
+        )
+
+        return render_template('magasins.html',
+                               comparaison=comparaison,
+                               tous_magasins=MagasinService.get_all_magasins(actifs_seulement=False),
+                               sections_indisponibles=comparaison['magasins_indisponibles'],
+                               period=period)
+
+    except Exception as e:
+        flash(f"Erreur lors du chargement des magasins: {str(e)}", "error")
+        return render_template('magasins.html', comparaison={'magasins': []}, tous_magasins=[], period='month')
+
+@magasin_bp.route('/nouveau', methods=['POST'])
+@login_required
+@AuthUtils.is_admin_required
+def nouveau_magasin():
+    """Crée un nouveau magasin"""
+    nom = request.form.get('nom', '').strip()
+    code = request.form.get('code', '').strip().upper()
+    adresse = request.form.get('adresse', '').strip()
+
+    if not nom or not code:
+        flash("Le nom et le code du magasin sont requis.", "error")
+        return redirect(url_for('magasin.list_magasins'))
+
+    magasin, message = MagasinService.create_magasin(nom, code, adresse or None)
+    flash(message, "success" if magasin else "error")
+    return redirect(url_for('magasin.list_magasins'))
+
+@magasin_bp.route('/choisir', methods=['POST'])
+@login_required
+def choisir_magasin():
+    """Choisit le magasin des saisies et des listes (vide: tous les magasins)"""
+    magasin_id = request.form.get('magasin_id', type=int)
+    if magasin_id is None:
+        session.pop('magasin', None)
+    else:
+        with use_store(None):
+            magasin = MagasinService.get_magasin(magasin_id)
+        if not magasin or not magasin.actif:
+            flash("Magasin non trouvé.", "error")
+        else:
+            session['magasin'] = magasin.id
+            flash(f"Magasin courant: {magasin.nom}", "success")
+    return redirect(request.referrer or url_for('main.dashboard'))
@@ -0,0 +1,231 @@
+from models.magasin import Magasin, StockMagasin
+from models.produit import Produit
+from models.vente import Vente
+from models.achat import Achat
+from models.lot_stock import LotStock
+from app import db
+from db_routing import read_only, current_store, use_store, store_is_sharded
+from db_sqlite import serialized_write
+from cache import cached
+from flask import current_app
+from sqlalchemy import func, inspect, update
+
+class MagasinService:
+    """Service pour la gestion des magasins et de leurs stocks"""
+
+    @staticmethod
+    def default_store_id():
+        """Magasin des opérations sans magasin précisé (et des lignes antérieures aux magasins)"""
+        return current_app.config['DEFAULT_STORE_ID']
+
+    @staticmethod
+    @cached(tables=('magasins',))
+    @read_only
+    def get_all_magasins(actifs_seulement=True):
+        """Retourne les magasins"""
+        query = Magasin.query
+        if actifs_seulement:
+            query = query.filter_by(actif=True)
+        return query.order_by(Magasin.nom).all()
+
+    @staticmethod
+    def get_magasin(magasin_id):
+        """Retourne un magasin"""
+        return db.session.get(Magasin, magasin_id)
+
+    @staticmethod
+    @serialized_write
+    def create_magasin(nom, code, adresse=None):
+        """Crée un nouveau magasin"""
+        if Magasin.query.filter_by(code=code).first():
+            return None, "Un magasin avec ce code existe déjà"
+
+        magasin = Magasin()
+        magasin.nom = nom
+        magasin.code = code
+        magasin.adresse = adresse
+
+        try:
+            db.session.add(magasin)
+            db.session.commit()
+            return magasin, "Magasin créé avec succès"
+        except Exception as e:
+            db.session.rollback()
+            return None, f"Erreur lors de la création du magasin: {str(e)}"
+
+    @staticmethod
+    def ensure_default_store():
+        """Crée le magasin par défaut s'il n'existe pas (référencé par toutes les transactions)"""
+        defaut = MagasinService.default_store_id()
+        if db.session.get(Magasin, defaut) is not None:
+            return False
+        magasin = Magasin()
+        magasin.id = defaut
+        magasin.nom = 'Magasin principal'
+        magasin.code = 'PRINCIPAL'
+        try:
+            db.session.add(magasin)
+            db.session.commit()
+        except Exception:
+            db.session.rollback()
+            raise
+        return True
+
+    @staticmethod
+    def database_scopes():
+        """Portées à interroger pour couvrir tous les magasins
+
+        None (base primaire: tous les magasins sans base dédiée), puis
+        chaque magasin qui a sa propre base.
+        """
+        return [None] + sorted(current_app.config.get('STORE_DATABASES', {}))
+
+    @staticmethod
+    def across_databases(fonction):
+        """Exécute `fonction` dans chaque portée, l'une après l'autre; retourne {portée: résultat}
+
+        Sans flush automatique: un objet en attente ne doit pas être écrit
+        dans la base d'un autre magasin.
+        """
+        resultats = {}
+        with db.session.no_autoflush:
+            for portee in MagasinService.database_scopes():
+                with use_store(portee):
+                    resultats[portee] = fonction()
+        return resultats
+
+    @staticmethod
+    def stock_row(produit):
+        """Ligne de stock du produit dans le magasin courant, créée au besoin
+
+        Pour le magasin par défaut, la ligne créée reprend le stock du produit
+        que les autres magasins ne détiennent pas (stock d'avant les magasins).
+        """
+        magasin_id = current_store() or MagasinService.default_store_id()
+        ligne = StockMagasin.query.filter_by(produit_id=produit.id, magasin_id=magasin_id).first()
+        if ligne is None:
+            ligne = StockMagasin()
+            ligne.produit_id = produit.id
+            ligne.magasin_id = magasin_id
+            ligne.quantite = 0
+            if magasin_id == MagasinService.default_store_id():
+                ligne.quantite = max(produit.stock_actuel - MagasinService._stock_autres_magasins(produit.id, magasin_id), 0)
+            db.session.add(ligne)
+        return ligne
+
+    @staticmethod
+    def _stock_autres_magasins(produit_id, magasin_id):
+        """Stock d'un produit détenu par les magasins autres que `magasin_id`, toutes bases confondues"""
+        def somme():
+            return db.session.query(func.coalesce(func.sum(StockMagasin.quantite), 0)).filter(
+                StockMagasin.produit_id == produit_id,
+                StockMagasin.magasin_id != magasin_id
+            ).scalar()
+        with use_store(magasin_id):
+            return sum(MagasinService.across_databases(somme).values())
+
+    @staticmethod
+    def get_stock(produit, magasin_id=None):
+        """Stock disponible d'un produit dans un magasin (magasin courant par défaut)"""
+        magasin_id = magasin_id or current_store() or MagasinService.default_store_id()
+        with use_store(magasin_id):
+            ligne = StockMagasin.query.filter_by(produit_id=produit.id, magasin_id=magasin_id).first()
+            if ligne is not None:
+                return ligne.quantite
+            if magasin_id == MagasinService.default_store_id():
+                return max(produit.stock_actuel - MagasinService._stock_autres_magasins(produit.id, magasin_id), 0)
+            return 0
+
+    @staticmethod
+    def initialize_stores():
+        """Prépare une base existante pour les magasins
+
+        Ajoute la colonne magasin_id aux transactions (archives comprises),
+        crée les tables des bases dédiées, le magasin par défaut, ses lignes
+        de stock, et y rattache les transactions existantes. Retourne un
+        résumé des opérations.
+        """
+        from app import _add_missing_columns, _create_store_schemas
+        from cache import data_versions
+        import partitions
+
+        db.create_all()
+        resume = {'colonnes': {}, 'bases_dediees': _create_store_schemas(), 'stocks_crees': 0, 'lignes_rattachees': 0}
+
+        tables = [Vente.__table__, Achat.__table__, LotStock.__table__]
+        inspecteur = inspect(db.engine)
+        tables += [table for table in (partitions.archive_table(nom) for nom in partitions.TABLES)
+                   if inspecteur.has_table(table.name)]
+        for table in tables:
+            ajoutees = _add_missing_columns(table)
+            if ajoutees:
+                resume['colonnes'][table.name] = ajoutees
+            for index in table.indexes:
+                if any(colonne.name in ajoutees for colonne in index.columns):
+                    index.create(db.engine, checkfirst=True)
+
+        MagasinService.ensure_default_store()
+        defaut = MagasinService.default_store_id()
+        try:
+            resume['stocks_crees'] = MagasinService._materialiser_stocks_defaut()
+
+            # Transactions antérieures aux magasins: rattachées au magasin par défaut
+            if not store_is_sharded(defaut):
+                for table in tables:
+                    resultat = db.session.execute(
+                        update(table).where(table.c.magasin_id.is_(None)).values(magasin_id=defaut)
+                    )
+                    resume['lignes_rattachees'] += resultat.rowcount
+            db.session.commit()
+        except Exception:
+            db.session.rollback()
+            raise
+
+        data_versions.bump(['ventes', 'achats', 'lots_stock', 'stocks_magasin'])
+        return resume
+
+    @staticmethod
+    def _materialiser_stocks_defaut():
+        """Crée les lignes de stock manquantes du magasin par défaut; retourne leur nombre"""
+        defaut = MagasinService.default_store_id()
+        with use_store(defaut):
+            existants = {ligne.produit_id for ligne in StockMagasin.query.filter_by(magasin_id=defaut)}
+            manquants = [produit for produit in Produit.query.order_by(Produit.id) if produit.id not in existants]
+            for produit in manquants:
+                MagasinService.stock_row(produit)
+            db.session.flush()
+        return len(manquants)
+
+    @staticmethod
+    def reconcile_product_stock():
+        """Recalcule le stock global des produits comme somme des stocks des magasins
+
+        Réparation après un incident entre la base primaire et une base de
+        magasin (les deux écritures ne sont pas atomiques). Retourne le
+        nombre de produits corrigés.
+        """
+        try:
+            # Stock implicite du magasin par défaut matérialisé avant de sommer
+            MagasinService._materialiser_stocks_defaut()
+            db.session.flush()
+
+            stocks = {}
+            par_base = MagasinService.across_databases(lambda: db.session.query(
+                StockMagasin.produit_id, func.sum(StockMagasin.quantite)
+            ).group_by(StockMagasin.produit_id).all())
+            for lignes in par_base.values():
+                for produit_id, quantite in lignes:
+                    stocks[produit_id] = stocks.get(produit_id, 0) + quantite
+
+            corriges = [
+                {'id': produit_id, 'stock_actuel': stocks[produit_id]}
+                for produit_id, stock_actuel in db.session.query(Produit.id, Produit.stock_actuel)
+                if produit_id in stocks and stocks[produit_id] != stock_actuel
+            ]
+            if corriges:
+                db.session.execute(update(Produit), corriges)
+            db.session.commit()
+        except Exception:
+            db.session.rollback()
+            raise
+        return len(corriges)
@@ -1,8 +1,11 @@
 import logging
-from app import app
+from app import create_app, create_schema
 
-# Configure logging for debugging
-logging.basicConfig(level=logging.DEBUG)
+app = create_app()
 
 if __name__ == '__main__':
+    # Serveur de développement: journalisation détaillée et schéma créé au lancement
+    logging.getLogger().setLevel(logging.DEBUG)
+    with app.app_context():
+        create_schema()
     app.run(host='0.0.0.0', port=5000, debug=True)
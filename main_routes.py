@@ -1,8 +1,9 @@
-from flask import Blueprint, render_template, redirect, url_for, flash
+from flask import Blueprint, Response, render_template, redirect, url_for, flash, request, abort, current_app
 from flask_login import login_required, current_user
 from services.statistique_service import StatistiqueService
 from services.alerte_service import AlerteService
 from services.stock_service import StockService
+from services.dashboard_service import DashboardService
 
 main_bp = Blueprint('main', __name__)
 
@@ -23,21 +24,22 @@ def login():
 def dashboard():
     """Tableau de bord principal"""
     try:
-        # Récupérer les données du tableau de bord
-        dashboard_data = StatistiqueService.get_dashboard_data()
+        # Sections indépendantes chargées en parallèle
+        sections, sections_indisponibles = DashboardService.assemble({
+            'dashboard_data': (StatistiqueService.get_dashboard_data, {}),
+            'alertes': (AlerteService.get_all_alerts, []),
+            'stock_summary': (StockService.get_stock_summary, {})
+        })
         
-        # Récupérer les alertes
-        alertes = AlerteService.get_all_alerts()
-        summary_alertes = AlerteService.get_alerts_summary()
-        
-        # Récupérer le résumé du stock
-        stock_summary = StockService.get_stock_summary()
+        alertes = sections['alertes']
+        summary_alertes = AlerteService.summarize_alerts(alertes) if 'alertes' not in sections_indisponibles else {}
         
         return render_template('index.html',
-                               dashboard_data=dashboard_data,
+                               dashboard_data=sections['dashboard_data'],
                                alertes=alertes[:5],  # Afficher seulement les 5 premières
                                summary_alertes=summary_alertes,
-                               stock_summary=stock_summary)
+                               stock_summary=sections['stock_summary'],
+                               sections_indisponibles=sections_indisponibles)
     except Exception as e:
         flash(f"Erreur lors du chargement du tableau de bord: {str(e)}", "error")
         return render_template('index.html',
@@ -46,6 +48,27 @@ def dashboard():
                                summary_alertes={},
                                stock_summary={})
 
+@main_bp.route('/dashboard/flux')
+@login_required
+def flux_dashboard():
+    """Flux SSE des mises à jour des tableaux de bord (ventes, stock, alertes)"""
+    from flux import hub
+    if not current_app.config.get('FLUX_ENABLED'):
+        abort(404)
+    if hub.connexions >= current_app.config['FLUX_MAX_CONNECTIONS']:
+        # Le navigateur se reconnecte de lui-même plus tard
+        return Response('Trop de connexions au flux', 503, headers={'Retry-After': '30'})
+    
+    hub.start(current_app._get_current_object())
+    dernier_id = request.headers.get('Last-Event-ID', '')
+    response = Response(
+        hub.stream(int(dernier_id) if dernier_id.isdigit() else None),
+        mimetype='text/event-stream'
+    )
+    response.headers['Cache-Control'] = 'no-cache'
+    response.headers['X-Accel-Buffering'] = 'no'  # Pas de mise en tampon par nginx
+    return response
+
 @main_bp.route('/about')
 def about():
     """Page à propos"""
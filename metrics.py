@@ -0,0 +1,357 @@
+"""Métriques Prometheus: latence des routes, SQL, pool, cache et indicateurs métier
+
+Chaque worker accumule ses compteurs en mémoire (quelques opérations de
+dictionnaire par requête) et les ajoute toutes les METRICS_FLUSH_INTERVAL
+secondes aux compteurs du stockage de cache. /metrics lit ces compteurs:
+avec un stockage partagé ('partage' ou 'redis'), la réponse agrège tous
+les workers, quel que soit celui qui la sert.
+
+Les jauges (connexions du pool) sont publiées en écart par rapport à la
+dernière valeur envoyée par le worker, et retirées à sa sortie: leur
+valeur agrégée est la somme des workers vivants.
+"""
+import os
+import hmac
+import time
+import atexit
+import bisect
+import logging
+import threading
+from flask import current_app, request, g, abort, Response
+from sqlalchemy import event
+from sqlalchemy.orm import Session
+from sqlalchemy.pool import QueuePool
+from cache_backend import get_backend
+
+BUCKETS_HTTP = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10)
+BUCKETS_POOL = (0.0001, 0.001, 0.005, 0.01, 0.05, 0.1, 0.5, 1, 5)
+
+STATUTS = ('1xx', '2xx', '3xx', '4xx', '5xx')
+RESULTATS_CACHE = ('hit', 'miss')
+MOTIFS_REFUS = ('stock',)
+ETATS_POOL = ('utilisees', 'disponibles', 'debordement')
+
+# nom: (type, description, labels, buckets)
+METRIQUES = {
+    'http_request_duration_seconds': ('histogram', "Durée des requêtes HTTP", ('blueprint', 'endpoint'), BUCKETS_HTTP),
+    'http_requests_total': ('counter', "Requêtes HTTP par classe de statut", ('blueprint', 'endpoint', 'statut'), None),
+    'db_statements_total': ('counter', "Requêtes SQL exécutées", ('base',), None),
+    'db_statement_duration_seconds_total': ('counter', "Temps passé dans les requêtes SQL", ('base',), None),
+    'db_pool_checkout_wait_seconds': ('histogram', "Attente d'une connexion du pool", ('base',), BUCKETS_POOL),
+    'db_pool_connections': ('gauge', "Connexions du pool par état (somme des workers)", ('base', 'etat'), None),
+    'cache_requests_total': ('counter', "Appels des méthodes mémoïsées", ('resultat',), None),
+    'ventes_total': ('counter', "Ventes validées", (), None),
+    'ventes_montant_ariary_total': ('counter', "Montant des ventes validées (MGA)", (), None),
+    'ventes_annulees_total': ('counter', "Ventes annulées", (), None),
+    'ventes_refusees_total': ('counter', "Ventes refusées", ('motif',), None),
+    'achats_total': ('counter', "Achats validés", (), None),
+    'ruptures_stock_total': ('counter', "Produits passés à zéro en stock par une vente", (), None),
+    'evenements_publies_total': ('counter', "Événements métier distribués après commit", ('evenement',), None),
+    'evenements_rejetes_total': ('counter', "Appels d'abonnés abandonnés, file pleine", ('evenement',), None),
+    'evenements_echecs_total': ('counter', "Abonnés en échec après toutes les tentatives", ('evenement',), None),
+}
+
+# Durées stockées en microsecondes (les compteurs partagés sont entiers)
+MICROSECONDES = 1_000_000
+
+class MetricsRegistry:
+    """Compteurs du worker, envoyés par écarts au stockage partagé"""
+
+    def __init__(self):
+        self._verrou = threading.Lock()
+        self._ecarts = {}
+        self._jauges_publiees = {}
+        self._sources_jauges = []
+        self._dernier_envoi = time.monotonic()
+        # Application dont le stockage et l'intervalle d'envoi sont utilisés (init_metrics)
+        self.app = None
+
+    def count(self, nom, *labels, montant=1):
+        cle = _cle(nom, labels)
+        with self._verrou:
+            self._ecarts[cle] = self._ecarts.get(cle, 0) + montant
+
+    def observe(self, nom, valeur, *labels):
+        """Ajoute une observation (en secondes) à un histogramme"""
+        indice = bisect.bisect_left(METRIQUES[nom][3], valeur)
+        serie = '|'.join(labels)
+        cles = (f'metriques:{nom}_bucket:{serie}:{indice}', f'metriques:{nom}_count:{serie}', f'metriques:{nom}_sum:{serie}')
+        with self._verrou:
+            self._ecarts[cles[0]] = self._ecarts.get(cles[0], 0) + 1
+            self._ecarts[cles[1]] = self._ecarts.get(cles[1], 0) + 1
+            self._ecarts[cles[2]] = self._ecarts.get(cles[2], 0) + int(valeur * MICROSECONDES)
+
+    def add_gauge_source(self, source):
+        """Source de jauges: fonction retournant {(nom, labels): valeur}"""
+        self._sources_jauges.append(source)
+
+    def flush(self, forcer=False):
+        """Envoie les écarts accumulés (au plus une fois par intervalle, sauf si forcé)"""
+        app = self.app
+        if app is None:
+            return
+        maintenant = time.monotonic()
+        if not forcer and maintenant - self._dernier_envoi < app.config['METRICS_FLUSH_INTERVAL']:
+            return
+
+        jauges = {}
+        for source in self._sources_jauges:
+            for (nom, labels), valeur in source().items():
+                jauges[_cle(nom, labels)] = int(valeur)
+
+        with self._verrou:
+            ecarts, self._ecarts = self._ecarts, {}
+            self._dernier_envoi = maintenant
+            for cle, valeur in jauges.items():
+                ecart = valeur - self._jauges_publiees.get(cle, 0)
+                if ecart:
+                    ecarts[cle] = ecarts.get(cle, 0) + ecart
+                    self._jauges_publiees[cle] = valeur
+
+        if not ecarts:
+            return
+        try:
+            get_backend(app).incr_many(ecarts)
+        except Exception as e:
+            logging.warning(f"Envoi des métriques impossible: {str(e)}")
+
+    def withdraw_gauges(self):
+        """Retire la contribution du worker aux jauges (sortie du processus)"""
+        with self._verrou:
+            for cle, valeur in self._jauges_publiees.items():
+                self._ecarts[cle] = self._ecarts.get(cle, 0) - valeur
+            self._jauges_publiees.clear()
+            self._sources_jauges.clear()
+        self.flush(forcer=True)
+
+    def reset(self):
+        """Processus enfant d'un fork: rien de ce qui a été compté par le parent n'est renvoyé"""
+        self._verrou = threading.Lock()
+        self._ecarts = {}
+        self._jauges_publiees = {}
+        self._dernier_envoi = time.monotonic()
+
+registry = MetricsRegistry()
+
+if hasattr(os, 'register_at_fork'):
+    os.register_at_fork(after_in_child=registry.reset)
+atexit.register(registry.withdraw_gauges)
+
+def _cle(nom, labels):
+    return f"metriques:{nom}:{'|'.join(labels)}"
+
+def count(nom, *labels, montant=1):
+    """Incrémente un compteur"""
+    registry.count(nom, *labels, montant=montant)
+
+def count_on_commit(nom, *labels, montant=1):
+    """Incrémente un compteur quand la transaction en cours est validée
+
+    Annulé avec la transaction, ou avec le SAVEPOINT en cours (écritures
+    groupées de la file SQLite).
+    """
+    from app import db
+
+    session = db.session()
+    transaction = session.get_nested_transaction() or session.get_transaction()
+    session.info.setdefault('metriques', []).append((transaction, nom, labels, montant))
+
+@event.listens_for(Session, 'after_commit')
+def _compter_apres_commit(session):
+    # Également appelé à la libération d'un SAVEPOINT: seul le commit réel compte
+    if session.in_nested_transaction():
+        return
+    for transaction, nom, labels, montant in session.info.pop('metriques', ()):
+        registry.count(nom, *labels, montant=montant)
+
+@event.listens_for(Session, 'after_soft_rollback')
+def _oublier_apres_rollback(session, transaction_precedente):
+    en_attente = session.info.get('metriques')
+    if not en_attente:
+        return
+    if transaction_precedente.nested:
+        session.info['metriques'] = [m for m in en_attente if m[0] is not transaction_precedente]
+    else:
+        session.info.pop('metriques', None)
+
+def instrument_engine(engine, base):
+    """Compte les requêtes SQL, leur durée et l'attente du pool d'un moteur"""
+
+    @event.listens_for(engine, 'before_cursor_execute')
+    def _debut(connexion, curseur, instruction, parametres, contexte, executemany):
+        connexion.info['debut_metriques'] = time.perf_counter()
+
+    @event.listens_for(engine, 'after_cursor_execute')
+    def _fin(connexion, curseur, instruction, parametres, contexte, executemany):
+        debut = connexion.info.pop('debut_metriques', None)
+        if debut is not None:
+            registry.count('db_statements_total', base)
+            registry.count('db_statement_duration_seconds_total', base,
+                           montant=int((time.perf_counter() - debut) * MICROSECONDES))
+
+    @event.listens_for(engine, 'handle_error')
+    def _erreur(contexte):
+        if contexte.connection is not None:
+            contexte.connection.info.pop('debut_metriques', None)
+
+    # Le pool est recréé par dispose() (fork des workers): le mesurer à nouveau
+    @event.listens_for(engine, 'engine_disposed')
+    def _nouveau_pool(engine_dispose):
+        _mesurer_pool(engine_dispose.pool, base)
+
+    _mesurer_pool(engine.pool, base)
+
+    def _jauges_pool():
+        pool = engine.pool
+        if not isinstance(pool, QueuePool):
+            return {}
+        return {
+            ('db_pool_connections', (base, 'utilisees')): pool.checkedout(),
+            ('db_pool_connections', (base, 'disponibles')): pool.checkedin(),
+            ('db_pool_connections', (base, 'debordement')): max(pool.overflow(), 0),
+        }
+    registry.add_gauge_source(_jauges_pool)
+
+def _mesurer_pool(pool, base):
+    if not isinstance(pool, QueuePool):
+        return
+    obtenir = pool._do_get
+
+    def _do_get_mesure():
+        debut = time.perf_counter()
+        try:
+            return obtenir()
+        finally:
+            registry.observe('db_pool_checkout_wait_seconds', time.perf_counter() - debut, base)
+    pool._do_get = _do_get_mesure
+
+def _debut_requete():
+    g.debut_metriques = time.perf_counter()
+
+def _statut_requete(response):
+    g.statut_metriques = response.status_code
+    return response
+
+def _fin_requete(exception=None):
+    debut = g.pop('debut_metriques', None)
+    if debut is None:
+        return
+    blueprint = request.blueprint or 'app'
+    endpoint = request.endpoint or 'aucun'
+    statut = g.pop('statut_metriques', 500)
+    registry.observe('http_request_duration_seconds', time.perf_counter() - debut, blueprint, endpoint)
+    registry.count('http_requests_total', blueprint, endpoint, f'{statut // 100}xx')
+    registry.flush()
+
+def _series(nom, app):
+    """Valeurs possibles des labels d'une métrique"""
+    from app import db
+
+    labels = METRIQUES[nom][2]
+    if labels and labels[0] == 'blueprint':
+        endpoints = sorted({regle.endpoint for regle in app.url_map.iter_rules()} | {'aucun'})
+        couples = [(e.rpartition('.')[0] or 'app', e) for e in endpoints]
+        if len(labels) == 2:
+            return couples
+        return [couple + (statut,) for couple in couples for statut in STATUTS]
+    if labels and labels[0] == 'base':
+        bases = [_nom_base(cle) for cle in db.engines]
+        if len(labels) == 2:
+            return [(base, etat) for base in bases for etat in ETATS_POOL]
+        return [(base,) for base in bases]
+    if labels == ('resultat',):
+        return [(resultat,) for resultat in RESULTATS_CACHE]
+    if labels == ('motif',):
+        return [(motif,) for motif in MOTIFS_REFUS]
+    if labels == ('evenement',):
+        from events import EVENT_TYPES
+        return [(type_evenement.__name__,) for type_evenement in EVENT_TYPES]
+    return [()]
+
+def _nom_base(cle):
+    return 'primaire' if cle is None else cle
+
+def _labels(noms, valeurs, extra=''):
+    paires = [f'{n}="{v}"' for n, v in zip(noms, valeurs)]
+    if extra:
+        paires.append(extra)
+    return '{' + ','.join(paires) + '}' if paires else ''
+
+def _nombre(valeur):
+    return repr(float(valeur)) if isinstance(valeur, float) else str(valeur)
+
+def render(app):
+    """Exposition au format texte Prometheus des compteurs agrégés"""
+    cles = []
+    plan = []
+    for nom, (type_metrique, _, noms_labels, buckets) in METRIQUES.items():
+        for valeurs in _series(nom, app):
+            serie = '|'.join(valeurs)
+            if type_metrique == 'histogram':
+                suffixes = [f'{nom}_bucket:{serie}:{i}' for i in range(len(buckets) + 1)]
+                suffixes += [f'{nom}_count:{serie}', f'{nom}_sum:{serie}']
+            else:
+                suffixes = [f'{nom}:{serie}']
+            plan.append((nom, valeurs, len(cles), len(suffixes)))
+            cles.extend(f'metriques:{suffixe}' for suffixe in suffixes)
+
+    compteurs = get_backend(app).get_counters(cles)
+
+    lignes = []
+    nom_courant = None
+    for nom, valeurs, debut, taille in plan:
+        type_metrique, description, noms_labels, buckets = METRIQUES[nom]
+        valeurs_serie = compteurs[debut:debut + taille]
+        # Séries étiquetées jamais observées: omises
+        if noms_labels and not any(valeurs_serie):
+            continue
+        if nom != nom_courant:
+            lignes.append(f'# HELP {nom} {description}')
+            lignes.append(f'# TYPE {nom} {type_metrique}')
+            nom_courant = nom
+
+        if type_metrique == 'histogram':
+            cumul = 0
+            for borne, valeur in zip(buckets + ('+Inf',), valeurs_serie):
+                cumul += valeur
+                le = f'le="{borne}"'
+                lignes.append(f'{nom}_bucket{_labels(noms_labels, valeurs, le)} {cumul}')
+            lignes.append(f'{nom}_count{_labels(noms_labels, valeurs)} {valeurs_serie[-2]}')
+            lignes.append(f'{nom}_sum{_labels(noms_labels, valeurs)} {_nombre(valeurs_serie[-1] / MICROSECONDES)}')
+        else:
+            valeur = valeurs_serie[0]
+            if 'seconds' in nom:
+                valeur = valeur / MICROSECONDES
+            lignes.append(f'{nom}{_labels(noms_labels, valeurs)} {_nombre(valeur)}')
+
+    return '\n'.join(lignes) + '\n'
+
+def metrics_view():
+    """Point de collecte Prometheus"""
+    jeton = current_app.config.get('METRICS_TOKEN')
+    if jeton:
+        if not hmac.compare_digest(request.headers.get('Authorization', ''), f'Bearer {jeton}'):
+            abort(401)
+    elif request.remote_addr not in ('127.0.0.1', '::1') or request.headers.get('X-Forwarded-For'):
+        # Sans jeton, accès local direct uniquement
+        abort(403)
+
+    registry.flush(forcer=True)
+    return Response(render(current_app), mimetype='text/plain; version=0.0.4')
+
+def init_metrics(app):
+    """Instrumente l'application et ses moteurs, et expose /metrics"""
+    from app import db
+
+    if not app.config.get('METRICS_ENABLED'):
+        return
+
+    registry.app = app
+    app.before_request(_debut_requete)
+    app.after_request(_statut_requete)
+    app.teardown_request(_fin_requete)
+    app.add_url_rule('/metrics', 'metrics', metrics_view)
+
+    with app.app_context():
+        for cle, engine in db.engines.items():
+            instrument_engine(engine, _nom_base(cle))
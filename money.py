@@ -0,0 +1,152 @@
+"""Montants en Ariary entiers
+
+L'Ariary n'a pas de subdivision en usage: les prix et montants sont
+stockés en entiers (BIGINT), ce qui rend les sommes exactes quel que soit
+le nombre de lignes. Tout passage d'une valeur fractionnaire (remise,
+coût moyen pondéré, saisie) à un montant est arrondi au plus proche, les
+demis s'éloignant de zéro, de façon identique en Python et en SQL.
+"""
+import logging
+from decimal import Decimal, ROUND_HALF_UP
+from sqlalchemy import BigInteger, event, inspect, text
+from sqlalchemy.orm import Mapper
+from sqlalchemy.sql import ClauseElement
+from sqlalchemy.schema import CreateTable
+from sqlalchemy.types import TypeDecorator, Integer
+
+class Money(int):
+    """Montant en Ariary: un entier, arrondi de façon déterministe à la construction"""
+
+    __slots__ = ()
+
+    def __new__(cls, valeur=0):
+        if isinstance(valeur, int):
+            return super().__new__(cls, valeur)
+        if not isinstance(valeur, (Decimal, str)):
+            valeur = str(valeur)
+        return super().__new__(cls, Decimal(valeur).quantize(Decimal(1), rounding=ROUND_HALF_UP))
+
+    def __repr__(self):
+        return f'Money({int(self)})'
+
+    # Affichage, gabarits, CSV et formulaires: l'entier seul
+    def __str__(self):
+        return int.__repr__(self)
+
+    def __format__(self, spec):
+        return format(int(self), spec)
+
+    def __add__(self, autre):
+        return Money(int(self) + autre) if isinstance(autre, int) else int(self) + autre
+
+    __radd__ = __add__
+
+    def __sub__(self, autre):
+        return Money(int(self) - autre) if isinstance(autre, int) else int(self) - autre
+
+    def __rsub__(self, autre):
+        return Money(autre - int(self)) if isinstance(autre, int) else autre - int(self)
+
+    def __mul__(self, autre):
+        return Money(int(self) * autre) if isinstance(autre, int) else int(self) * autre
+
+    __rmul__ = __mul__
+
+    def __neg__(self):
+        return Money(-int(self))
+
+    def percentage(self, taux):
+        """Part `taux` % du montant (remise), arrondie"""
+        return Money(Decimal(int(self)) * Decimal(str(taux or 0)) / 100)
+
+    def divide(self, diviseur):
+        """Quotient arrondi (coût moyen pondéré par unité)"""
+        return Money(Decimal(int(self)) / Decimal(diviseur))
+
+class MoneyType(TypeDecorator):
+    """Colonne de montant: BIGINT en base, Money en Python"""
+
+    impl = BigInteger
+    cache_ok = True
+
+    def process_bind_param(self, valeur, dialect):
+        return None if valeur is None else int(Money(valeur))
+
+    def process_result_value(self, valeur, dialect):
+        return None if valeur is None else Money(valeur)
+
+def _en_montant(cible, valeur, ancienne_valeur, initiateur):
+    # Les expressions SQL (incréments atomiques) sont évaluées par la base
+    if valeur is None or isinstance(valeur, ClauseElement):
+        return valeur
+    return Money(valeur)
+
+@event.listens_for(Mapper, 'mapper_configured')
+def _arrondir_a_l_affectation(mapper, classe):
+    # Un montant affecté à un modèle est arrondi tout de suite, pas seulement à l'écriture
+    for attribut in mapper.column_attrs:
+        if any(isinstance(colonne.type, MoneyType) for colonne in attribut.columns):
+            event.listen(getattr(classe, attribut.key), 'set', _en_montant, retval=True)
+
+def money_columns(table):
+    """Noms des colonnes de montant d'une table"""
+    return [colonne.name for colonne in table.columns if isinstance(colonne.type, MoneyType)]
+
+def _a_migrer(inspecteur, table):
+    if not inspecteur.has_table(table.name):
+        return []
+    types = {colonne['name']: colonne['type'] for colonne in inspecteur.get_columns(table.name)}
+    return [nom for nom in money_columns(table) if nom in types and not isinstance(types[nom], Integer)]
+
+def _migrer_sqlite(connexion, table):
+    """Reconstruit la table (seule façon de changer l'affinité d'une colonne SQLite)"""
+    nouvelle = f'{table.name}_montants'
+    ddl = str(CreateTable(table).compile(dialect=connexion.dialect))
+    connexion.execute(text(ddl.replace(f'CREATE TABLE {table.name} ', f'CREATE TABLE {nouvelle} ', 1)))
+    montants = set(money_columns(table))
+    colonnes = [colonne.name for colonne in table.columns]
+    selection = ', '.join(f'CAST(ROUND({nom}) AS INTEGER)' if nom in montants else nom for nom in colonnes)
+    connexion.execute(text(
+        f"INSERT INTO {nouvelle} ({', '.join(colonnes)}) SELECT {selection} FROM {table.name}"
+    ))
+    connexion.execute(text(f"DROP TABLE {table.name}"))
+    connexion.execute(text(f"ALTER TABLE {nouvelle} RENAME TO {table.name}"))
+    for index in table.indexes:
+        index.create(connexion)
+
+def migrate_money_columns():
+    """Convertit les colonnes de montant flottantes existantes en entiers arrondis
+
+    PostgreSQL: ALTER COLUMN ... TYPE BIGINT (réécriture de la table sous
+    verrou). SQLite: reconstruction de la table dans une transaction.
+    À lancer pendant une fenêtre de maintenance. Retourne {table: colonnes}.
+    """
+    from app import db
+    from cache import data_versions
+    import partitions
+
+    tables = list(db.metadata.tables.values())
+    tables += [partitions.archive_table(nom) for nom in partitions.TABLES]
+
+    migrees = {}
+    with db.engine.connect().execution_options(sqlite_immediate=True) as connexion:
+        with connexion.begin():
+            inspecteur = inspect(connexion)
+            for table in tables:
+                colonnes = _a_migrer(inspecteur, table)
+                if not colonnes:
+                    continue
+                if connexion.dialect.name == 'postgresql':
+                    connexion.execute(text(f"ALTER TABLE {table.name} " + ', '.join(
+                        f"ALTER COLUMN {nom} TYPE BIGINT USING ROUND({nom}::numeric)::bigint" for nom in colonnes
+                    )))
+                elif connexion.dialect.name == 'sqlite':
+                    _migrer_sqlite(connexion, table)
+                else:
+                    raise RuntimeError(f"Migration des montants non prise en charge pour {connexion.dialect.name}")
+                migrees[table.name] = colonnes
+                logging.info(f"Montants de {table.name} convertis en entiers: {', '.join(colonnes)}")
+
+    if migrees:
+        data_versions.bump(list(migrees))
+    return migrees
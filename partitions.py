@@ -0,0 +1,276 @@
+"""Partitionnement des tables de transactions (ventes, achats)
+
+PostgreSQL: partitions mensuelles par plage de dates (`flask partitionner`
+convertit les tables existantes, `flask archiver` crée les mois à venir).
+Les requêtes filtrées sur la date ne lisent que les partitions concernées
+et les agrégats portent toujours sur la table mère.
+
+SQLite: les exercices clos sont déplacés dans des tables d'archive
+(ventes_archive, achats_archive) par petits lots, chacun dans sa propre
+transaction courte, pour ne pas bloquer les écritures. `source()` retourne
+l'entité à interroger pour une période: la table vive seule si la période
+est postérieure à la borne d'archivage, sinon l'union des deux tables.
+"""
+import time
+import logging
+from datetime import datetime, date
+from sqlalchemy import MetaData, Table, Column, String, DateTime, Index, select, insert, delete, union_all, inspect, text
+from sqlalchemy.orm import aliased
+from flask import current_app
+from cache import data_versions
+from db_routing import current_store, store_is_sharded
+
+# Table partitionnée -> colonne de date (clé de partition)
+TABLES = {'ventes': 'date_vente', 'achats': 'date_achat'}
+
+# Tables d'archive SQLite, hors des métadonnées du modèle (créées par `flask partitionner`)
+_metadonnees_archives = MetaData()
+
+bornes_archives = Table(
+    'bornes_archives', _metadonnees_archives,
+    Column('nom_table', String(50), primary_key=True),
+    Column('borne', DateTime, nullable=False),  # Lignes antérieures: dans l'archive
+)
+
+def _modele(table):
+    from models.vente import Vente
+    from models.achat import Achat
+    return {'ventes': Vente, 'achats': Achat}[table]
+
+def archive_table(table):
+    """Table d'archive SQLite de `table` (mêmes colonnes, index sur la date)"""
+    nom = f'{table}_archive'
+    if nom not in _metadonnees_archives.tables:
+        colonnes = [Column(c.name, c.type, primary_key=c.primary_key, nullable=c.nullable)
+                    for c in _modele(table).__table__.columns]
+        Table(nom, _metadonnees_archives, *colonnes,
+              Index(f'ix_{nom}_{TABLES[table]}', TABLES[table]))
+    return _metadonnees_archives.tables[nom]
+
+def _en_datetime(valeur):
+    if isinstance(valeur, date) and not isinstance(valeur, datetime):
+        return datetime.combine(valeur, datetime.min.time())
+    return valeur
+
+def month_start(valeur):
+    return datetime(valeur.year, valeur.month, 1)
+
+def next_month(valeur):
+    return datetime(valeur.year + valeur.month // 12, valeur.month % 12 + 1, 1)
+
+def fiscal_year_start(valeur):
+    """Début de l'exercice comptable contenant `valeur`"""
+    premier_mois = current_app.config['EXERCICE_DEBUT_MOIS']
+    annee = valeur.year if valeur.month >= premier_mois else valeur.year - 1
+    return datetime(annee, premier_mois, 1)
+
+def archive_bounds():
+    """{table: borne} des tables dont les lignes antérieures à la borne sont archivées
+
+    Lu à chaque appel, sans cache: `flask archiver` tourne dans un autre
+    processus, et une borne vue en retard masquerait les lignes archivées.
+    """
+    from app import db
+
+    connexion = db.session.connection()
+    if connexion.dialect.name != 'sqlite' or not inspect(connexion).has_table('bornes_archives'):
+        return {}
+    return {nom: borne for nom, borne in connexion.execute(select(bornes_archives.c.nom_table, bornes_archives.c.borne))}
+
+def source(modele, date_debut=None, date_fin=None):
+    """Entité à interroger pour la période [date_debut, date_fin]
+
+    Le modèle lui-même (table vive, ou table mère partitionnée) tant que la
+    période ne remonte pas avant la borne d'archivage; sinon une entité
+    aliasée sur l'union de la table vive et de l'archive, filtrée sur la
+    période dans chaque branche. Les instances obtenues sont en lecture seule.
+    """
+    table = modele.__tablename__
+    if store_is_sharded(current_store()):
+        # Base dédiée d'un magasin: ni partitions ni archives
+        return modele
+    borne = archive_bounds().get(table)
+    date_debut, date_fin = _en_datetime(date_debut), _en_datetime(date_fin)
+    if borne is None or (date_debut is not None and date_debut >= borne):
+        return modele
+
+    archive = archive_table(table)
+    branches = []
+    for source_table in (modele.__table__, archive):
+        colonne = source_table.c[TABLES[table]]
+        branche = select(*[source_table.c[c.name] for c in modele.__table__.columns])
+        if date_debut is not None:
+            branche = branche.where(colonne >= date_debut)
+        if date_fin is not None:
+            branche = branche.where(colonne <= date_fin)
+        branches.append(branche)
+    return aliased(modele, union_all(*branches).subquery(f'{table}_avec_archive'))
+
+def find(modele, identifiant):
+    """Instance par identifiant, dans la table vive puis dans l'archive"""
+    from app import db
+
+    instance = db.session.get(modele, identifiant)
+    if instance is None and modele.__tablename__ in archive_bounds():
+        entite = source(modele)
+        instance = db.session.query(entite).filter(entite.id == identifiant).first()
+    return instance
+
+# --- PostgreSQL: partitions mensuelles ---
+
+def _nom_partition(table, debut):
+    return f'{table}_{debut:%Y_%m}'
+
+def is_partitioned(connexion, table):
+    return connexion.execute(
+        text("SELECT 1 FROM pg_partitioned_table WHERE partrelid = to_regclass(:t)"), {'t': table}
+    ).scalar() is not None
+
+def _creer_partition(connexion, table, debut):
+    """Crée la partition du mois `debut`; les lignes déjà tombées dans la partition par défaut y sont déplacées"""
+    nom = _nom_partition(table, debut)
+    if connexion.execute(text("SELECT to_regclass(:t)"), {'t': nom}).scalar() is not None:
+        return False
+
+    colonne, fin = TABLES[table], next_month(debut)
+    bornes = f"FROM ('{debut:%Y-%m-%d}') TO ('{fin:%Y-%m-%d}')"
+    en_defaut = connexion.execute(text(
+        f"SELECT EXISTS (SELECT 1 FROM {table}_defaut WHERE {colonne} >= :debut AND {colonne} < :fin)"
+    ), {'debut': debut, 'fin': fin}).scalar()
+
+    if not en_defaut:
+        connexion.execute(text(f"CREATE TABLE {nom} PARTITION OF {table} FOR VALUES {bornes}"))
+    else:
+        connexion.execute(text(f"CREATE TABLE {nom} (LIKE {table} INCLUDING DEFAULTS INCLUDING CONSTRAINTS)"))
+        connexion.execute(text(
+            f"WITH deplacees AS (DELETE FROM {table}_defaut WHERE {colonne} >= :debut AND {colonne} < :fin RETURNING *) "
+            f"INSERT INTO {nom} SELECT * FROM deplacees"
+        ), {'debut': debut, 'fin': fin})
+        connexion.execute(text(f"ALTER TABLE {table} ATTACH PARTITION {nom} FOR VALUES {bornes}"))
+    return True
+
+def ensure_partitions(connexion, mois_avance=None):
+    """Crée les partitions du mois courant et des mois suivants; retourne le nombre créé"""
+    mois_avance = current_app.config['PARTITION_MONTHS_AHEAD'] if mois_avance is None else mois_avance
+    creees = 0
+    for table in TABLES:
+        if not is_partitioned(connexion, table):
+            continue
+        mois = month_start(datetime.utcnow())
+        for _ in range(mois_avance + 1):
+            creees += _creer_partition(connexion, table, mois)
+            mois = next_month(mois)
+    return creees
+
+def _partitionner_table(connexion, table):
+    """Remplace `table` par une table partitionnée par mois contenant les mêmes lignes"""
+    colonne, ancienne = TABLES[table], f'{table}_avant_partition'
+    connexion.execute(text(f"LOCK TABLE {table} IN ACCESS EXCLUSIVE MODE"))
+    premiere, sans_date = connexion.execute(text(
+        f"SELECT MIN({colonne}), COUNT(*) FILTER (WHERE {colonne} IS NULL) FROM {table}"
+    )).one()
+    if sans_date:
+        raise RuntimeError(f"{sans_date} lignes de {table} sans {colonne}: impossible de partitionner")
+
+    sequence = connexion.execute(text("SELECT pg_get_serial_sequence(:t, 'id')"), {'t': table}).scalar()
+    connexion.execute(text(f"ALTER TABLE {table} RENAME TO {ancienne}"))
+    connexion.execute(text(
+        f"CREATE TABLE {table} (LIKE {ancienne} INCLUDING DEFAULTS INCLUDING CONSTRAINTS) PARTITION BY RANGE ({colonne})"
+    ))
+    # La clé primaire d'une table partitionnée contient la clé de partition
+    connexion.execute(text(f"ALTER TABLE {table} ADD CONSTRAINT {table}_partition_pkey PRIMARY KEY (id, {colonne})"))
+    connexion.execute(text(f"CREATE INDEX ix_{table}_{colonne}_partition ON {table} ({colonne})"))
+    connexion.execute(text(f"CREATE INDEX ix_{table}_produit_id_partition ON {table} (produit_id)"))
+    if sequence:
+        connexion.execute(text(f"ALTER SEQUENCE {sequence} OWNED BY {table}.id"))
+
+    connexion.execute(text(f"CREATE TABLE {table}_defaut PARTITION OF {table} DEFAULT"))
+    mois = month_start(premiere or datetime.utcnow())
+    while mois <= month_start(datetime.utcnow()):
+        _creer_partition(connexion, table, mois)
+        mois = next_month(mois)
+    connexion.execute(text(f"INSERT INTO {table} SELECT * FROM {ancienne}"))
+
+    # Une clé étrangère ne peut viser une table partitionnée que via sa clé primaire complète
+    for table_fille, contrainte in connexion.execute(text(
+        "SELECT conrelid::regclass::text, conname FROM pg_constraint WHERE contype = 'f' AND confrelid = to_regclass(:t)"
+    ), {'t': ancienne}):
+        connexion.execute(text(f'ALTER TABLE {table_fille} DROP CONSTRAINT "{contrainte}"'))
+    connexion.execute(text(f"DROP TABLE {ancienne}"))
+
+def partition_tables():
+    """Conversion unique vers le schéma partitionné (PostgreSQL) ou création des archives (SQLite)
+
+    Sur PostgreSQL, chaque table est recopiée sous verrou exclusif: à faire
+    pendant une fenêtre de maintenance. Retourne les tables traitées.
+    """
+    from app import db
+
+    traitees = []
+    with db.engine.begin() as connexion:
+        if connexion.dialect.name == 'postgresql':
+            for table in TABLES:
+                if not is_partitioned(connexion, table):
+                    _partitionner_table(connexion, table)
+                    traitees.append(table)
+            ensure_partitions(connexion)
+        elif connexion.dialect.name == 'sqlite':
+            for table in TABLES:
+                archive_table(table)
+                connexion.execute(text(
+                    f"CREATE INDEX IF NOT EXISTS ix_{table}_{TABLES[table]} ON {table} ({TABLES[table]})"
+                ))
+                traitees.append(table)
+            _metadonnees_archives.create_all(connexion)
+    return traitees
+
+# --- SQLite: archivage des exercices clos ---
+
+def archive_closed_years(exercices_conserves=None, taille_lot=None, pause=None):
+    """Déplace les lignes des exercices clos vers les tables d'archive
+
+    La nouvelle borne est enregistrée avant le premier déplacement: les
+    lectures qui la voient interrogent déjà l'union. Chaque lot est une
+    transaction courte (BEGIN IMMEDIATE), suivie d'une pause qui laisse
+    passer les écritures de l'application. Retourne {table: lignes déplacées}.
+    """
+    from app import db
+
+    exercices_conserves = current_app.config['ARCHIVE_EXERCICES_CONSERVES'] if exercices_conserves is None else exercices_conserves
+    taille_lot = taille_lot or current_app.config['ARCHIVE_BATCH_SIZE']
+    pause = current_app.config['ARCHIVE_PAUSE'] if pause is None else pause
+
+    debut_exercice = fiscal_year_start(datetime.utcnow())
+    borne = debut_exercice.replace(year=debut_exercice.year - exercices_conserves)
+
+    with db.engine.begin() as connexion:
+        _metadonnees_archives.create_all(connexion)
+        bornes = dict(connexion.execute(select(bornes_archives.c.nom_table, bornes_archives.c.borne)).all())
+        for table in TABLES:
+            archive_table(table).create(connexion, checkfirst=True)
+            if bornes.get(table) is None:
+                connexion.execute(insert(bornes_archives).values(nom_table=table, borne=borne))
+            elif bornes[table] < borne:
+                connexion.execute(bornes_archives.update().where(bornes_archives.c.nom_table == table).values(borne=borne))
+
+    deplacees = {}
+    for table in TABLES:
+        vive, archive = _modele(table).__table__, archive_table(table)
+        colonne = vive.c[TABLES[table]]
+        deplacees[table] = 0
+        while True:
+            with db.engine.connect().execution_options(sqlite_immediate=True) as connexion:
+                with connexion.begin():
+                    ids = connexion.execute(select(vive.c.id).where(colonne < borne).limit(taille_lot)).scalars().all()
+                    if ids:
+                        connexion.execute(insert(archive).from_select(
+                            [c.name for c in vive.columns], select(vive).where(vive.c.id.in_(ids))
+                        ))
+                        connexion.execute(delete(vive).where(vive.c.id.in_(ids)))
+            if not ids:
+                break
+            deplacees[table] += len(ids)
+            data_versions.bump([table])
+            time.sleep(pause)
+        logging.info(f"{deplacees[table]} lignes de {table} archivées (avant le {borne:%d/%m/%Y})")
+    return deplacees
@@ -0,0 +1,154 @@
+from models.produit import Produit
+from models.vente import Vente
+from app import db
+from db_routing import read_only
+from flask import current_app
+from partitions import source
+from datetime import datetime, date, timedelta
+from statistics import NormalDist
+from sqlalchemy import func, update
+import numpy as np
+import math
+import logging
+
+class PrevisionService:
+    """Service de prévision de la demande et de calcul des points de commande"""
+    
+    @staticmethod
+    @read_only
+    def build_sales_matrix(days=None, date_fin=None):
+        """Construit la matrice produit x jour des quantités vendues
+        
+        Une seule requête groupée par (produit, jour) sur les ventes validées;
+        les produits sans vente ont une ligne de zéros.
+        """
+        days = days or current_app.config['FORECAST_HISTORY_DAYS']
+        date_fin = date_fin or datetime.utcnow().date()
+        date_debut = date_fin - timedelta(days=days - 1)
+        
+        produit_ids = [
+            row.id for row in db.session.query(Produit.id).filter(Produit.actif == True).order_by(Produit.id)
+        ]
+        matrice = np.zeros((len(produit_ids), days), dtype=np.float64)
+        if not produit_ids:
+            return produit_ids, matrice
+        
+        debut, fin = datetime.combine(date_debut, datetime.min.time()), datetime.combine(date_fin, datetime.max.time())
+        ventes = source(Vente, debut, fin)
+        resultats = db.session.query(
+            ventes.produit_id,
+            func.date(ventes.date_vente).label('jour'),
+            func.sum(ventes.quantite).label('quantite')
+        ).filter(
+            ventes.date_vente >= debut,
+            ventes.date_vente <= fin,
+            ventes.statut == 'completed'
+        ).group_by(ventes.produit_id, func.date(ventes.date_vente)).all()
+        
+        index_produits = {produit_id: i for i, produit_id in enumerate(produit_ids)}
+        for resultat in resultats:
+            ligne = index_produits.get(resultat.produit_id)
+            jour = resultat.jour
+            if not isinstance(jour, date):
+                jour = date.fromisoformat(str(jour)[:10])
+            colonne = (jour - date_debut).days
+            if ligne is not None and 0 <= colonne < days:
+                matrice[ligne, colonne] = resultat.quantite or 0
+        
+        return produit_ids, matrice
+    
+    @staticmethod
+    def forecast(matrice, methode=None, fenetre=28, alpha=0.3):
+        """Prévoit la demande journalière de chaque produit (vectorisé)
+        
+        Retourne (demande, ecart_type): la demande journalière prévue et
+        l'écart type des erreurs de prévision, un élément par produit.
+        """
+        methode = methode or current_app.config['FORECAST_METHOD']
+        nb_produits, nb_jours = matrice.shape
+        if nb_jours == 0:
+            zeros = np.zeros(nb_produits)
+            return zeros, zeros
+        
+        if methode == 'moyenne_mobile':
+            recent = matrice[:, -min(fenetre, nb_jours):]
+            demande = recent.mean(axis=1)
+            ecart_type = recent.std(axis=1)
+            return demande, ecart_type
+        
+        # Lissage exponentiel simple, une itération par jour pour tous les produits
+        niveau = matrice[:, :min(7, nb_jours)].mean(axis=1)
+        erreurs_carrees = np.zeros(nb_produits)
+        for jour in range(nb_jours):
+            erreur = matrice[:, jour] - niveau
+            erreurs_carrees += erreur ** 2
+            niveau = niveau + alpha * erreur
+        
+        return niveau, np.sqrt(erreurs_carrees / nb_jours)
+    
+    @staticmethod
+    def compute_reorder_points(demande, ecart_type, stock_actuel, delai=None, niveau_service=None, periode_revue=None):
+        """Calcule les points de commande et les quantités suggérées
+        
+        Point de commande = demande x délai + stock de sécurité, avec un stock
+        de sécurité z x sigma x racine(délai). La quantité suggérée remonte le
+        stock au niveau cible (délai + période de revue) quand le point de
+        commande est atteint.
+        """
+        delai = delai if delai is not None else current_app.config['LEAD_TIME_DAYS']
+        niveau_service = niveau_service if niveau_service is not None else current_app.config['SERVICE_LEVEL']
+        periode_revue = periode_revue if periode_revue is not None else current_app.config['REVIEW_PERIOD_DAYS']
+        
+        z = NormalDist().inv_cdf(min(max(niveau_service, 0.5), 0.9999))
+        stock_securite = z * ecart_type * math.sqrt(delai)
+        point_commande = np.ceil(demande * delai + stock_securite)
+        niveau_cible = np.ceil(demande * (delai + periode_revue) + stock_securite)
+        
+        quantite_suggeree = np.where(
+            stock_actuel <= point_commande,
+            np.maximum(niveau_cible - stock_actuel, 0),
+            0
+        )
+        
+        return point_commande.astype(np.int64), quantite_suggeree.astype(np.int64)
+    
+    @staticmethod
+    def recompute_all(days=None, methode=None, delai=None, niveau_service=None):
+        """Recalcule et enregistre les prévisions de tous les produits actifs
+        
+        Destiné au traitement nocturne: flask recalculer-previsions
+        """
+        produit_ids, matrice = PrevisionService.build_sales_matrix(days)
+        if not produit_ids:
+            return 0
+        
+        stocks = dict(db.session.query(Produit.id, Produit.stock_actuel).filter(Produit.id.in_(produit_ids)).all())
+        stock_actuel = np.array([stocks.get(produit_id) or 0 for produit_id in produit_ids], dtype=np.float64)
+        
+        demande, ecart_type = PrevisionService.forecast(matrice, methode)
+        point_commande, quantite_suggeree = PrevisionService.compute_reorder_points(
+            demande, ecart_type, stock_actuel, delai, niveau_service
+        )
+        
+        # Sans historique de vente, le stock minimum saisi reste le seuil d'alerte
+        historique = matrice.sum(axis=1) > 0
+        
+        maintenant = datetime.utcnow()
+        try:
+            db.session.execute(update(Produit), [
+                {
+                    'id': produit_id,
+                    'demande_journaliere': round(float(demande[i]), 4),
+                    'point_commande': int(point_commande[i]) if historique[i] else None,
+                    'quantite_commande_suggeree': int(quantite_suggeree[i]) if historique[i] else 0,
+                    'date_prevision': maintenant
+                }
+                for i, produit_id in enumerate(produit_ids)
+            ])
+            db.session.commit()
+        except Exception as e:
+            db.session.rollback()
+            logging.error(f"Erreur lors du recalcul des prévisions: {str(e)}")
+            raise
+        
+        return len(produit_ids)
@@ -1,6 +1,7 @@
 from app import db
 from datetime import datetime
 from sqlalchemy.orm import relationship
+from money import MoneyType
 
 class Produit(db.Model):
     __tablename__ = 'produits'
@@ -8,8 +9,8 @@ class Produit(db.Model):
     id = db.Column(db.Integer, primary_key=True)
     nom = db.Column(db.String(100), nullable=False)
     description = db.Column(db.Text)
-    prix_achat = db.Column(db.Float, nullable=False)  # Prix en Ariary (MGA)
-    prix_vente = db.Column(db.Float, nullable=False)  # Prix en Ariary (MGA)
+    prix_achat = db.Column(MoneyType, nullable=False)  # Prix en Ariary (MGA)
+    prix_vente = db.Column(MoneyType, nullable=False)  # Prix en Ariary (MGA)
     stock_initial = db.Column(db.Integer, default=0)
     stock_actuel = db.Column(db.Integer, default=0)
     stock_minimum = db.Column(db.Integer, default=5)  # Seuil d'alerte
@@ -17,6 +18,24 @@ class Produit(db.Model):
     date_creation = db.Column(db.DateTime, default=datetime.utcnow)
     actif = db.Column(db.Boolean, default=True)
     
+    # Prévision de la demande (recalculée chaque nuit par PrevisionService)
+    demande_journaliere = db.Column(db.Float)  # Unités par jour prévues
+    point_commande = db.Column(db.Integer)  # Seuil de réapprovisionnement dynamique
+    quantite_commande_suggeree = db.Column(db.Integer, default=0)
+    date_prevision = db.Column(db.DateTime)
+    
+    # Classement ABC (recalculé par StatistiqueService.compute_abc_classification)
+    classe_abc = db.Column(db.String(1), index=True)  # Selon le chiffre d'affaires
+    classe_abc_marge = db.Column(db.String(1))
+    classe_abc_quantite = db.Column(db.String(1))
+    date_classement = db.Column(db.DateTime)
+    
+    # Cumuls des ventes validées (hors annulées), tenus dans la transaction de chaque vente
+    quantite_vendue = db.Column(db.Integer, nullable=False, default=0, server_default='0')
+    montant_ventes = db.Column(MoneyType, nullable=False, default=0, server_default='0')
+    benefice_ventes = db.Column(MoneyType, nullable=False, default=0, server_default='0')
+    date_derniere_vente = db.Column(db.DateTime)
+    
     # Relations
     ventes = relationship('Vente', backref='produit_rel', lazy='dynamic')
     achats = relationship('Achat', backref='produit_rel', lazy='dynamic')
@@ -36,10 +55,17 @@ class Produit(db.Model):
             return ((self.prix_vente - self.prix_achat) / self.prix_achat) * 100
         return 0
     
+    @property
+    def seuil_alerte(self):
+        """Seuil d'alerte: point de commande prévu, sinon stock minimum saisi"""
+        if self.point_commande is not None:
+            return self.point_commande
+        return self.stock_minimum
+    
     @property
     def stock_alerte(self):
         """Vérifie si le stock est en alerte"""
-        return self.stock_actuel <= self.stock_minimum
+        return self.stock_actuel <= self.seuil_alerte
     
     @property
     def valeur_stock(self):
@@ -53,13 +79,25 @@ class Produit(db.Model):
     
     @property
     def total_vendu(self):
-        """Calcule la quantité totale vendue"""
-        return sum(vente.quantite for vente in self.ventes)
+        """Quantité totale vendue (ventes validées)"""
+        return self.quantite_vendue or 0
     
     @property
     def chiffre_affaires(self):
-        """Calcule le chiffre d'affaires généré par ce produit"""
-        return sum(vente.montant_total for vente in self.ventes)
+        """Chiffre d'affaires généré par ce produit (ventes validées)"""
+        return self.montant_ventes or 0
+    
+    def cumuler_vente(self, vente, sens=1):
+        """Ajoute (sens=1) ou retire (sens=-1) une vente validée des cumuls
+        
+        Incréments évalués par la base au flush: deux transactions
+        concurrentes sur le même produit ne perdent aucune mise à jour.
+        """
+        self.quantite_vendue = Produit.quantite_vendue + sens * vente.quantite
+        self.montant_ventes = Produit.montant_ventes + sens * vente.montant_total
+        self.benefice_ventes = Produit.benefice_ventes + sens * vente.benefice
+        if sens > 0 and (self.date_derniere_vente is None or vente.date_vente > self.date_derniere_vente):
+            self.date_derniere_vente = vente.date_vente
     
     def ajuster_stock(self, quantite, operation='vente'):
         """Ajuste le stock selon l'opération (vente ou achat)"""
@@ -84,6 +122,12 @@ class Produit(db.Model):
             'stock_initial': self.stock_initial,
             'stock_actuel': self.stock_actuel,
             'stock_minimum': self.stock_minimum,
+            'demande_journaliere': self.demande_journaliere,
+            'point_commande': self.point_commande,
+            'quantite_commande_suggeree': self.quantite_commande_suggeree,
+            'classe_abc': self.classe_abc,
+            'classe_abc_marge': self.classe_abc_marge,
+            'classe_abc_quantite': self.classe_abc_quantite,
             'taux_marge': self.taux_marge,
             'date_creation': self.date_creation.isoformat() if self.date_creation else None,
             'actif': self.actif,
@@ -92,5 +136,7 @@ class Produit(db.Model):
             'stock_alerte': self.stock_alerte,
             'valeur_stock': self.valeur_stock,
             'total_vendu': self.total_vendu,
-            'chiffre_affaires': self.chiffre_affaires
+            'chiffre_affaires': self.chiffre_affaires,
+            'benefice_ventes': self.benefice_ventes or 0,
+            'date_derniere_vente': self.date_derniere_vente.isoformat() if self.date_derniere_vente else None
         }
@@ -3,7 +3,9 @@ from flask_login import login_required
 from models.produit import Produit
 from services.stock_service import StockService
 from app import db
-from utils.helpers import format_currency, calculate_percentage
+from events import publish, ProductRepriced
+from datetime import datetime
+from utils.helpers import format_currency, calculate_percentage, round_currency
 
 produit_bp = Blueprint('produit', __name__, url_prefix='/produits')
 
@@ -14,12 +16,16 @@ def list_produits():
     try:
         page = request.args.get('page', 1, type=int)
         search = request.args.get('search', '', type=str)
+        classe = request.args.get('classe', '', type=str)
         
         query = Produit.query.filter_by(actif=True)
         
         if search:
             query = query.filter(Produit.nom.contains(search))
         
+        if classe:
+            query = query.filter_by(classe_abc=classe)
+        
         produits = query.order_by(Produit.nom).paginate(
             page=page, per_page=20, error_out=False
         )
@@ -30,10 +36,11 @@ def list_produits():
         return render_template('produits.html', 
                                produits=produits, 
                                search=search,
+                               classe=classe,
                                stock_summary=stock_summary)
     except Exception as e:
         flash(f"Erreur lors du chargement des produits: {str(e)}", "error")
-        return render_template('produits.html', produits=None, search="", stock_summary={})
+        return render_template('produits.html', produits=None, search="", classe="", stock_summary={})
 
 @produit_bp.route('/nouveau', methods=['GET', 'POST'])
 @login_required
@@ -43,8 +50,8 @@ def nouveau_produit():
         try:
             nom = request.form.get('nom', '').strip()
             description = request.form.get('description', '').strip()
-            prix_achat = float(request.form.get('prix_achat', 0))
-            prix_vente = float(request.form.get('prix_vente', 0))
+            prix_achat = round_currency(float(request.form.get('prix_achat', 0)))
+            prix_vente = round_currency(float(request.form.get('prix_vente', 0)))
             stock_initial = int(request.form.get('stock_initial', 0))
             stock_minimum = int(request.form.get('stock_minimum', 5))
             
@@ -109,8 +116,8 @@ def modifier_produit(id):
         try:
             nom = request.form.get('nom', '').strip()
             description = request.form.get('description', '').strip()
-            prix_achat = float(request.form.get('prix_achat', 0))
-            prix_vente = float(request.form.get('prix_vente', 0))
+            prix_achat = round_currency(float(request.form.get('prix_achat', 0)))
+            prix_vente = round_currency(float(request.form.get('prix_vente', 0)))
             stock_minimum = int(request.form.get('stock_minimum', 5))
             
             # Validations
@@ -141,6 +148,13 @@ def modifier_produit(id):
                 flash("Un autre produit avec ce nom existe déjà.", "error")
                 return redirect(url_for('produit.list_produits'))
             
+            if (prix_achat, prix_vente) != (produit.prix_achat, produit.prix_vente):
+                publish(ProductRepriced(
+                    date=datetime.utcnow(), produit_id=produit.id,
+                    ancien_prix_achat=int(produit.prix_achat), nouveau_prix_achat=int(prix_achat),
+                    ancien_prix_vente=int(produit.prix_vente), nouveau_prix_vente=int(prix_vente)
+                ))
+            
             # Mettre à jour le produit
             produit.nom = nom
             produit.description = description
@@ -213,9 +227,11 @@ def detail_produit(id):
 def produits_stock_faible():
     """Liste des produits avec stock faible"""
     try:
-        produits = StockService.get_products_with_low_stock()
+        classe = request.args.get('classe', '', type=str)
+        produits = StockService.get_products_with_low_stock(classe_abc=classe or None)
         return render_template('produits.html', 
                                produits_stock_faible=produits,
+                               classe=classe,
                                titre="Produits en stock faible")
     except Exception as e:
         flash(f"Erreur lors du chargement des produits en stock faible: {str(e)}", "error")
@@ -0,0 +1,38 @@
+from flask import Blueprint, render_template, abort, send_file, current_app
+from flask_login import login_required
+from utils.auth import AuthUtils
+import profiling
+
+profilage_bp = Blueprint('profilage', __name__, url_prefix='/profils')
+
+@profilage_bp.route('/')
+@login_required
+@AuthUtils.is_admin_required
+def list_profils():
+    """Liste les profils de requêtes enregistrés"""
+    return render_template('profils.html',
+                           profils=profiling.list_profiles(),
+                           actif=current_app.config['PROFILING_ENABLED'],
+                           echantillonnage=current_app.config['PROFILING_SAMPLE'])
+
+@profilage_bp.route('/<nom>')
+@login_required
+@AuthUtils.is_admin_required
+def detail_profil(nom):
+    """Affiche le résumé d'un profil"""
+    metadonnees, chemin = profiling.get_profile(nom)
+    if not metadonnees:
+        abort(404)
+    return render_template('profils.html',
+                           profil=metadonnees,
+                           resume=profiling.render_profile(metadonnees, chemin))
+
+@profilage_bp.route('/<nom>/telecharger')
+@login_required
+@AuthUtils.is_admin_required
+def telecharger_profil(nom):
+    """Télécharge le fichier brut d'un profil (pstats ou piles repliées)"""
+    metadonnees, chemin = profiling.get_profile(nom)
+    if not metadonnees:
+        abort(404)
+    return send_file(chemin, as_attachment=True, download_name=metadonnees['fichier'])
@@ -0,0 +1,276 @@
+"""Profilage à la demande des requêtes en production
+
+Désactivé par défaut (PROFILING_ENABLED): aucun hook n'est alors installé.
+Une requête est profilée si elle porte un en-tête X-Profil signé (généré
+par `flask jeton-profilage`), ou si elle est tirée au sort selon
+PROFILING_SAMPLE ('vente.list_ventes:5,main.dashboard:1': pourcentage des
+requêtes de chaque route, '*' pour toutes).
+
+Deux modes: 'cprofile' (profil déterministe du thread de la requête) ou
+'echantillonnage' (piles relevées à intervalle régulier, format « piles
+repliées » des flame graphs, surcoût plus faible). Chaque profil est écrit
+dans PROFILING_DIR avec ses métadonnées (route, durée, statut, requêtes SQL).
+"""
+import io
+import os
+import re
+import sys
+import hmac
+import json
+import time
+import uuid
+import random
+import pstats
+import cProfile
+import hashlib
+import logging
+import threading
+import contextvars
+from datetime import datetime
+from collections import Counter
+from flask import current_app, request, g
+from sqlalchemy import event
+
+MODES = ('cprofile', 'echantillonnage')
+EN_TETE = 'X-Profil'
+
+_profil_actif = contextvars.ContextVar('profil_actif', default=None)
+_NOM_VALIDE = re.compile(r'^[\w\-.]+$')
+
+class StackSampler(threading.Thread):
+    """Relève la pile d'un thread à intervalle régulier"""
+
+    def __init__(self, thread_id, intervalle):
+        super().__init__(name='profilage-echantillons', daemon=True)
+        self.thread_id = thread_id
+        self.intervalle = intervalle
+        self.piles = Counter()
+        self._arret = threading.Event()
+
+    def run(self):
+        while not self._arret.wait(self.intervalle):
+            frame = sys._current_frames().get(self.thread_id)
+            pile = []
+            while frame is not None:
+                code = frame.f_code
+                pile.append(f"{os.path.basename(code.co_filename)}:{code.co_name}")
+                frame = frame.f_back
+            if pile:
+                self.piles[';'.join(reversed(pile))] += 1
+
+    def stop(self):
+        self._arret.set()
+        self.join()
+
+class RequestProfile:
+    """Profil d'une requête en cours"""
+
+    def __init__(self, mode):
+        self.mode = mode
+        self.requetes = 0
+        self.duree_sql = 0.0
+        self.statut = None
+        self.nom = f"{datetime.utcnow():%Y%m%dT%H%M%S}_{request.endpoint or 'aucun'}_{uuid.uuid4().hex[:8]}"
+        self._profiler = None
+        self._echantillonneur = None
+
+    def start(self):
+        if self.mode == 'cprofile':
+            self._profiler = cProfile.Profile()
+            try:
+                self._profiler.enable()
+            except ValueError:
+                # Un autre profileur est déjà actif (Python 3.12+): repli sur l'échantillonnage
+                self._profiler = None
+                self.mode = 'echantillonnage'
+        if self.mode == 'echantillonnage':
+            intervalle = current_app.config['PROFILING_SAMPLE_INTERVAL']
+            self._echantillonneur = StackSampler(threading.get_ident(), intervalle)
+            self._echantillonneur.start()
+        self._jeton = _profil_actif.set(self)
+        self.debut = time.perf_counter()
+
+    def stop(self):
+        self.duree = time.perf_counter() - self.debut
+        if self._profiler is not None:
+            self._profiler.disable()
+        if self._echantillonneur is not None:
+            self._echantillonneur.stop()
+        _profil_actif.reset(self._jeton)
+
+    def save(self):
+        """Écrit le profil et ses métadonnées dans PROFILING_DIR"""
+        dossier = profiles_dir()
+        os.makedirs(dossier, exist_ok=True)
+
+        if self._profiler is not None:
+            fichier = f"{self.nom}.prof"
+            self._profiler.dump_stats(os.path.join(dossier, fichier))
+        else:
+            fichier = f"{self.nom}.txt"
+            with open(os.path.join(dossier, fichier), 'w', encoding='utf-8') as sortie:
+                for pile, nombre in self._echantillonneur.piles.most_common():
+                    sortie.write(f"{pile} {nombre}\n")
+
+        metadonnees = {
+            'nom': self.nom,
+            'fichier': fichier,
+            'mode': self.mode,
+            'date': datetime.utcnow().isoformat(timespec='seconds'),
+            'methode': request.method,
+            'chemin': request.full_path.rstrip('?'),
+            'endpoint': request.endpoint,
+            'statut': self.statut,
+            'duree_ms': self.duree * 1000,
+            'requetes_sql': self.requetes,
+            'duree_sql_ms': self.duree_sql * 1000,
+            'pid': os.getpid(),
+        }
+        with open(os.path.join(dossier, f"{self.nom}.json"), 'w', encoding='utf-8') as sortie:
+            json.dump(metadonnees, sortie, ensure_ascii=False)
+
+        prune_profiles(dossier)
+        return metadonnees
+
+def profiles_dir():
+    return os.path.abspath(current_app.config['PROFILING_DIR'])
+
+def prune_profiles(dossier):
+    """Ne garde que les PROFILING_MAX_FILES profils les plus récents"""
+    metadonnees = sorted(f for f in os.listdir(dossier) if f.endswith('.json'))
+    for ancien in metadonnees[:max(len(metadonnees) - current_app.config['PROFILING_MAX_FILES'], 0)]:
+        nom = ancien[:-len('.json')]
+        for extension in ('.json', '.prof', '.txt'):
+            try:
+                os.remove(os.path.join(dossier, nom + extension))
+            except FileNotFoundError:
+                pass
+
+def list_profiles():
+    """Métadonnées des profils enregistrés, du plus récent au plus ancien"""
+    dossier = profiles_dir()
+    if not os.path.isdir(dossier):
+        return []
+    profils = []
+    for fichier in sorted(os.listdir(dossier), reverse=True):
+        if fichier.endswith('.json'):
+            try:
+                with open(os.path.join(dossier, fichier), encoding='utf-8') as entree:
+                    profils.append(json.load(entree))
+            except (OSError, ValueError):
+                continue
+    return profils
+
+def get_profile(nom):
+    """Métadonnées et chemin du fichier d'un profil (None si inconnu)"""
+    if not _NOM_VALIDE.match(nom):
+        return None, None
+    dossier = profiles_dir()
+    try:
+        with open(os.path.join(dossier, f"{nom}.json"), encoding='utf-8') as entree:
+            metadonnees = json.load(entree)
+    except (OSError, ValueError):
+        return None, None
+    chemin = os.path.join(dossier, metadonnees['fichier'])
+    return (metadonnees, chemin) if os.path.exists(chemin) else (None, None)
+
+def render_profile(metadonnees, chemin, lignes=60):
+    """Résumé texte d'un profil: fonctions les plus coûteuses ou piles les plus fréquentes"""
+    if metadonnees['mode'] == 'cprofile':
+        sortie = io.StringIO()
+        pstats.Stats(chemin, stream=sortie).strip_dirs().sort_stats('cumulative').print_stats(lignes)
+        return sortie.getvalue()
+    with open(chemin, encoding='utf-8') as entree:
+        return ''.join(entree.readline() for _ in range(lignes))
+
+def _signature(contenu):
+    config = current_app.config
+    cle = (config['PROFILING_SECRET'] or config['SECRET_KEY']).encode('utf-8')
+    return hmac.new(cle, contenu.encode('utf-8'), hashlib.sha256).hexdigest()
+
+def generate_token(mode='cprofile', duree=None):
+    """Valeur de l'en-tête X-Profil, valable `duree` secondes"""
+    if mode not in MODES:
+        raise ValueError(f"Mode de profilage inconnu: {mode}")
+    expiration = int(time.time() + (duree or current_app.config['PROFILING_TOKEN_TTL']))
+    return f"{expiration}.{mode}.{_signature(f'{expiration}.{mode}')}"
+
+def _mode_demande():
+    """Mode de profilage demandé pour la requête courante, ou None"""
+    jeton = request.headers.get(EN_TETE)
+    if jeton:
+        try:
+            expiration, mode, signature = jeton.split('.')
+            if (hmac.compare_digest(signature, _signature(f'{expiration}.{mode}'))
+                    and int(expiration) >= time.time() and mode in MODES):
+                return mode
+        except ValueError:
+            pass
+        logging.warning(f"En-tête {EN_TETE} invalide ou expiré")
+
+    taux = current_app.extensions['profilage'].get(request.endpoint, current_app.extensions['profilage'].get('*'))
+    if taux and random.random() * 100 < taux:
+        return current_app.config['PROFILING_MODE']
+    return None
+
+def _debut_requete():
+    mode = _mode_demande()
+    if mode is not None:
+        g.profil = RequestProfile(mode)
+        g.profil.start()
+
+def _statut_requete(response):
+    profil = g.get('profil')
+    if profil is not None:
+        profil.statut = response.status_code
+        response.headers[EN_TETE] = profil.nom
+    return response
+
+def _fin_requete(exception=None):
+    profil = g.pop('profil', None)
+    if profil is None:
+        return
+    profil.stop()
+    try:
+        metadonnees = profil.save()
+        logging.info(f"Profil enregistré: {metadonnees['chemin']} {metadonnees['duree_ms']:.0f} ms, "
+                     f"{metadonnees['requetes_sql']} requêtes SQL ({metadonnees['fichier']})")
+    except OSError as e:
+        logging.warning(f"Enregistrement du profil impossible: {str(e)}")
+
+def parse_sampling(valeur):
+    """'endpoint:pourcentage,...' -> {endpoint: pourcentage}"""
+    taux = {}
+    for element in filter(None, (e.strip() for e in (valeur or '').split(','))):
+        endpoint, _, pourcentage = element.rpartition(':')
+        taux[endpoint] = float(pourcentage)
+    return taux
+
+def init_profiling(app):
+    """Installe les hooks de profilage (rien si PROFILING_ENABLED est faux)"""
+    from app import db
+
+    if not app.config.get('PROFILING_ENABLED'):
+        return
+
+    app.extensions['profilage'] = parse_sampling(app.config.get('PROFILING_SAMPLE'))
+    app.before_request(_debut_requete)
+    app.after_request(_statut_requete)
+    app.teardown_request(_fin_requete)
+
+    with app.app_context():
+        for engine in db.engines.values():
+            event.listen(engine, 'before_cursor_execute', _debut_sql)
+            event.listen(engine, 'after_cursor_execute', _fin_sql)
+
+def _debut_sql(connexion, curseur, instruction, parametres, contexte, executemany):
+    profil = _profil_actif.get()
+    if profil is not None:
+        profil.requetes += 1
+        connexion.info['debut_profil'] = time.perf_counter()
+
+def _fin_sql(connexion, curseur, instruction, parametres, contexte, executemany):
+    debut = connexion.info.pop('debut_profil', None)
+    profil = _profil_actif.get()
+    if debut is not None and profil is not None:
+        profil.duree_sql += time.perf_counter() - debut
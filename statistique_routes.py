@@ -4,9 +4,12 @@ from services.statistique_service import StatistiqueService
 from services.vente_service import VenteService
 from services.achat_service import AchatService
 from services.stock_service import StockService
+from services.tache_service import TacheService
+from services.dashboard_service import DashboardService
 from datetime import datetime
-from utils.helpers import format_currency, get_date_range, export_to_csv
-import json
+from utils.helpers import format_currency, get_date_range
+from db_routing import read_only, current_store
+from cache import conditional_get
 
 statistique_bp = Blueprint('statistique', __name__, url_prefix='/statistiques')
 
@@ -20,30 +23,34 @@ def dashboard_statistiques():
         # Récupérer les dates selon la période
         date_debut, date_fin = get_date_range(period)
         
-        # Balance commerciale
-        balance = StatistiqueService.get_balance_commerciale(
-            datetime.combine(date_debut, datetime.min.time()) if date_debut else None,
-            datetime.combine(date_fin, datetime.max.time()) if date_fin else None
-        )
-        
-        # Statistiques mensuelles
-        stats_mensuelles = StatistiqueService.get_monthly_statistics()
+        debut = datetime.combine(date_debut, datetime.min.time()) if date_debut else None
+        fin = datetime.combine(date_fin, datetime.max.time()) if date_fin else None
         
-        # Performance des produits
-        performance_produits = StatistiqueService.get_product_performance()
-        
-        # Statistiques clients
-        stats_clients = StatistiqueService.get_client_statistics()
-        
-        # Données pour le tableau de bord
-        dashboard_data = StatistiqueService.get_dashboard_data()
+        # Tous les magasins: balance et mois consolidés sur les bases de magasins
+        if current_store() is None:
+            balance = lambda: StatistiqueService.get_consolidated_balance(debut, fin)
+            stats_mensuelles = StatistiqueService.get_consolidated_monthly_statistics
+        else:
+            balance = lambda: StatistiqueService.get_balance_commerciale(debut, fin)
+            stats_mensuelles = StatistiqueService.get_monthly_statistics
+        
+        # Sections indépendantes chargées en parallèle
+        sections, sections_indisponibles = DashboardService.assemble({
+            'balance': (balance, {}),
+            'stats_mensuelles': (stats_mensuelles, {}),
+            'performance_produits': (StatistiqueService.get_product_performance, []),
+            'stats_clients': (StatistiqueService.get_client_statistics, []),
+            'dashboard_data': (StatistiqueService.get_dashboard_data, {})
+        })
+        sections_indisponibles += sections['balance'].get('magasins_indisponibles', [])
         
         return render_template('statistiques.html',
-                               balance=balance,
-                               stats_mensuelles=stats_mensuelles,
-                               performance_produits=performance_produits[:10],  # Top 10
-                               stats_clients=stats_clients[:10],  # Top 10
-                               dashboard_data=dashboard_data,
+                               balance=sections['balance'],
+                               stats_mensuelles=sections['stats_mensuelles'],
+                               performance_produits=sections['performance_produits'][:10],  # Top 10
+                               stats_clients=sections['stats_clients'][:10],  # Top 10
+                               dashboard_data=sections['dashboard_data'],
+                               sections_indisponibles=sections_indisponibles,
                                period=period)
         
     except Exception as e:
@@ -85,18 +92,44 @@ def balance_commerciale():
 def performance_produits():
     """Performance détaillée des produits"""
     try:
-        performance = StatistiqueService.get_product_performance()
+        classe = request.args.get('classe', '', type=str)
+        performance = StatistiqueService.get_product_performance(classe_abc=classe or None)
         
         return render_template('statistiques.html',
                                show_produits=True,
+                               classe=classe,
                                performance_produits=performance)
         
     except Exception as e:
         flash(f"Erreur lors du chargement des performances produits: {str(e)}", "error")
         return redirect(url_for('statistique.dashboard_statistiques'))
 
+@statistique_bp.route('/rotation')
+@login_required
+def rotation_stock():
+    """Rapport des produits à rotation lente"""
+    try:
+        days = request.args.get('days', 30, type=int)
+        sort_by = request.args.get('sort', 'rotation', type=str)
+        order = request.args.get('order', 'asc', type=str)
+        
+        days = max(1, min(days, 365))
+        rotations = StockService.get_slow_movers(days=days, sort_by=sort_by, order=order)
+        
+        return render_template('statistiques.html',
+                               show_rotation=True,
+                               rotations=rotations,
+                               days=days,
+                               sort_by=sort_by,
+                               order=order)
+        
+    except Exception as e:
+        flash(f"Erreur lors du chargement de la rotation des stocks: {str(e)}", "error")
+        return redirect(url_for('statistique.dashboard_statistiques'))
+
 @statistique_bp.route('/api/monthly-evolution')
 @login_required
+@conditional_get(tables=('ventes', 'achats', 'produits'))
 def api_monthly_evolution():
     """API pour l'évolution mensuelle"""
     try:
@@ -108,31 +141,15 @@ def api_monthly_evolution():
         
         labels = [f"{stat['mois']:02d}/{stat['annee']}" for stat in current_year]
         
+        # Séries en colonnes (le style des graphiques est dans les gabarits)
         return jsonify({
             'labels': labels,
-            'datasets': [
-                {
-                    'label': f'Ventes {annee}',
-                    'data': [stat['total_ventes'] for stat in current_year],
-                    'borderColor': 'rgb(75, 192, 192)',
-                    'backgroundColor': 'rgba(75, 192, 192, 0.2)',
-                    'tension': 0.1
-                },
-                {
-                    'label': f'Achats {annee}',
-                    'data': [stat['total_achats'] for stat in current_year],
-                    'borderColor': 'rgb(255, 99, 132)',
-                    'backgroundColor': 'rgba(255, 99, 132, 0.2)',
-                    'tension': 0.1
-                },
-                {
-                    'label': f'Bénéfice {annee}',
-                    'data': [stat['benefice'] for stat in current_year],
-                    'borderColor': 'rgb(54, 162, 235)',
-                    'backgroundColor': 'rgba(54, 162, 235, 0.2)',
-                    'tension': 0.1
-                }
-            ]
+            'annee': annee,
+            'series': {
+                'ventes': [stat['total_ventes'] for stat in current_year],
+                'achats': [stat['total_achats'] for stat in current_year],
+                'benefice': [stat['benefice'] for stat in current_year]
+            }
         })
         
     except Exception as e:
@@ -140,6 +157,7 @@ def api_monthly_evolution():
 
 @statistique_bp.route('/api/top-products')
 @login_required
+@conditional_get(tables=('ventes', 'produits'))
 def api_top_products():
     """API pour les produits les plus vendus"""
     try:
@@ -148,27 +166,12 @@ def api_top_products():
         
         top_products = VenteService.get_top_selling_products(limit=limit, days=days)
         
-        labels = [prod['produit'].nom for prod in top_products]
-        data = [prod['total_quantite'] for prod in top_products]
-        
+        # Séries en colonnes (le style des graphiques est dans les gabarits)
         return jsonify({
-            'labels': labels,
-            'datasets': [{
-                'label': 'Quantité vendue',
-                'data': data,
-                'backgroundColor': [
-                    'rgba(255, 99, 132, 0.6)',
-                    'rgba(54, 162, 235, 0.6)',
-                    'rgba(255, 205, 86, 0.6)',
-                    'rgba(75, 192, 192, 0.6)',
-                    'rgba(153, 102, 255, 0.6)',
-                    'rgba(255, 159, 64, 0.6)',
-                    'rgba(199, 199, 199, 0.6)',
-                    'rgba(83, 102, 255, 0.6)',
-                    'rgba(40, 159, 64, 0.6)',
-                    'rgba(210, 199, 199, 0.6)'
-                ]
-            }]
+            'labels': [prod['produit'].nom for prod in top_products],
+            'series': {
+                'quantite': [prod['total_quantite'] for prod in top_products]
+            }
         })
         
     except Exception as e:
@@ -176,69 +179,25 @@ def api_top_products():
 
 @statistique_bp.route('/export')
 @login_required
+@read_only
 def export_statistiques():
     """Exporte les statistiques"""
     try:
         format_export = request.args.get('format', 'csv', type=str)
         period = request.args.get('period', 'month', type=str)
         
-        date_debut, date_fin = get_date_range(period)
+        if format_export not in ('csv', 'json'):
+            flash("Format d'export non supporté.", "error")
+            return redirect(url_for('statistique.dashboard_statistiques'))
         
-        # Récupérer les données à exporter
-        export_data = StatistiqueService.export_statistics_data(
-            format_export='dict',
-            date_debut=datetime.combine(date_debut, datetime.min.time()) if date_debut else None,
-            date_fin=datetime.combine(date_fin, datetime.max.time()) if date_fin else None
+        contenu, nom_fichier, content_type = TacheService.generer(
+            'export_statistiques', {'format': format_export, 'period': period}
         )
         
-        if format_export == 'json':
-            response = make_response(json.dumps(export_data, indent=2, default=str))
-            response.headers["Content-Disposition"] = "attachment; filename=statistiques.json"
-            response.headers["Content-type"] = "application/json"
-            return response
-        
-        elif format_export == 'csv':
-            # Exporter la balance commerciale
-            data = []
-            balance = export_data['balance_commerciale']
-            data.append([
-                'Balance commerciale',
-                balance['total_ventes'],
-                balance['total_achats'],
-                balance['balance'],
-                f"{balance['marge_brute']:.2f}%"
-            ])
-            
-            # Ajouter les statistiques clients
-            data.append(['', '', '', '', ''])  # Ligne vide
-            data.append(['Top Clients', '', '', '', ''])
-            for client_stat in export_data['statistiques_clients'][:10]:
-                data.append([
-                    client_stat['nom_client'],
-                    client_stat['email'],
-                    client_stat['nombre_achats'],
-                    client_stat['montant_total'],
-                    client_stat['panier_moyen']
-                ])
-            
-            # Ajouter les performances produits
-            data.append(['', '', '', '', ''])  # Ligne vide
-            data.append(['Performance Produits', '', '', '', ''])
-            for prod_stat in export_data['performance_produits'][:10]:
-                data.append([
-                    prod_stat['nom_produit'],
-                    prod_stat['quantite_vendue'],
-                    prod_stat['ca_genere'],
-                    prod_stat['benefice_genere'],
-                    f"{prod_stat['marge_moyenne']:.2f}%"
-                ])
-            
-            headers = ['Élément', 'Valeur 1', 'Valeur 2', 'Valeur 3', 'Valeur 4']
-            return export_to_csv(data, f'statistiques_{period}.csv', headers)
-        
-        else:
-            flash("Format d'export non supporté.", "error")
-            return redirect(url_for('statistique.dashboard_statistiques'))
+        response = make_response(contenu)
+        response.headers["Content-Disposition"] = f"attachment; filename={nom_fichier}"
+        response.headers["Content-type"] = content_type
+        return response
             
     except Exception as e:
         flash(f"Erreur lors de l'export: {str(e)}", "error")
@@ -246,28 +205,14 @@ def export_statistiques():
 
 @statistique_bp.route('/rapport')
 @login_required
+@read_only
 def rapport_complet():
     """Génère un rapport complet"""
     try:
-        # Récupérer toutes les données nécessaires
-        balance = StatistiqueService.get_balance_commerciale()
-        dashboard_data = StatistiqueService.get_dashboard_data()
-        performance_produits = StatistiqueService.get_product_performance()
-        stats_clients = StatistiqueService.get_client_statistics()
-        stock_summary = StockService.get_stock_summary()
-        
-        # Top 5 dans chaque catégorie
-        top_produits = performance_produits[:5]
-        top_clients = stats_clients[:5]
-        
         return render_template('statistiques.html',
                                show_rapport=True,
-                               balance=balance,
-                               dashboard_data=dashboard_data,
-                               top_produits=top_produits,
-                               top_clients=top_clients,
-                               stock_summary=stock_summary,
-                               date_rapport=datetime.now())
+                               date_rapport=datetime.now(),
+                               **StatistiqueService.get_rapport_data())
         
     except Exception as e:
         flash(f"Erreur lors de la génération du rapport: {str(e)}", "error")
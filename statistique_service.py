@@ -3,30 +3,40 @@ from models.achat import Achat
 from models.produit import Produit
 from models.client import Client
 from app import db
+from db_routing import read_only, use_store
+from flask import current_app
+from services.magasin_service import MagasinService
+from cache import cached
+from partitions import source, next_month
 from datetime import datetime, timedelta
-from sqlalchemy import func, extract
+from sqlalchemy import func, update
+import numpy as np
 
 class StatistiqueService:
     """Service pour la génération de statistiques"""
     
     @staticmethod
+    @cached(tables=('ventes', 'achats'))
+    @read_only
     def get_balance_commerciale(date_debut=None, date_fin=None):
         """Calcule la balance commerciale (ventes - achats)"""
         # Calculer le total des ventes
-        ventes_query = db.session.query(func.sum(Vente.montant_total)).filter_by(statut='completed')
+        ventes = source(Vente, date_debut, date_fin)
+        ventes_query = db.session.query(func.sum(ventes.montant_total)).filter(ventes.statut == 'completed')
         if date_debut:
-            ventes_query = ventes_query.filter(Vente.date_vente >= date_debut)
+            ventes_query = ventes_query.filter(ventes.date_vente >= date_debut)
         if date_fin:
-            ventes_query = ventes_query.filter(Vente.date_vente <= date_fin)
+            ventes_query = ventes_query.filter(ventes.date_vente <= date_fin)
         
         total_ventes = ventes_query.scalar() or 0
         
         # Calculer le total des achats
-        achats_query = db.session.query(func.sum(Achat.montant_total)).filter_by(statut='completed')
+        achats = source(Achat, date_debut, date_fin)
+        achats_query = db.session.query(func.sum(achats.montant_total)).filter(achats.statut == 'completed')
         if date_debut:
-            achats_query = achats_query.filter(Achat.date_achat >= date_debut)
+            achats_query = achats_query.filter(achats.date_achat >= date_debut)
         if date_fin:
-            achats_query = achats_query.filter(Achat.date_achat <= date_fin)
+            achats_query = achats_query.filter(achats.date_achat <= date_fin)
         
         total_achats = achats_query.scalar() or 0
         
@@ -40,6 +50,8 @@ class StatistiqueService:
         }
     
     @staticmethod
+    @cached(tables=('ventes', 'achats', 'produits'))
+    @read_only
     def get_monthly_statistics(mois=None, annee=None):
         """Retourne les statistiques mensuelles"""
         if not mois:
@@ -47,18 +59,24 @@ class StatistiqueService:
         if not annee:
             annee = datetime.now().year
         
+        # Plage de dates du mois (limite la lecture aux partitions du mois)
+        debut = datetime(annee, mois, 1)
+        fin = next_month(debut)
+        
         # Ventes du mois
-        ventes = Vente.query.filter(
-            extract('month', Vente.date_vente) == mois,
-            extract('year', Vente.date_vente) == annee,
-            Vente.statut == 'completed'
+        source_ventes = source(Vente, debut, fin)
+        ventes = db.session.query(source_ventes).filter(
+            source_ventes.date_vente >= debut,
+            source_ventes.date_vente < fin,
+            source_ventes.statut == 'completed'
         ).all()
         
         # Achats du mois
-        achats = Achat.query.filter(
-            extract('month', Achat.date_achat) == mois,
-            extract('year', Achat.date_achat) == annee,
-            Achat.statut == 'completed'
+        source_achats = source(Achat, debut, fin)
+        achats = db.session.query(source_achats).filter(
+            source_achats.date_achat >= debut,
+            source_achats.date_achat < fin,
+            source_achats.statut == 'completed'
         ).all()
         
         total_ventes = sum(vente.montant_total for vente in ventes)
@@ -77,6 +95,155 @@ class StatistiqueService:
         }
     
     @staticmethod
+    @cached(tables=('ventes', 'achats'))
+    @read_only
+    def get_totals_by_store(date_debut=None, date_fin=None):
+        """Ventes et achats validés par magasin (lignes sans magasin: magasin par défaut)"""
+        defaut = MagasinService.default_store_id()
+        totaux = {}
+        
+        ventes = source(Vente, date_debut, date_fin)
+        magasin_vente = func.coalesce(ventes.magasin_id, defaut)
+        ventes_query = db.session.query(
+            magasin_vente.label('magasin_id'),
+            func.count(ventes.id).label('nombre'),
+            func.sum(ventes.montant_total).label('montant'),
+            func.sum(ventes.quantite).label('quantite')
+        ).filter(ventes.statut == 'completed')
+        if date_debut:
+            ventes_query = ventes_query.filter(ventes.date_vente >= date_debut)
+        if date_fin:
+            ventes_query = ventes_query.filter(ventes.date_vente <= date_fin)
+        for resultat in ventes_query.group_by(magasin_vente):
+            total = totaux.setdefault(resultat.magasin_id, StatistiqueService._totaux_magasin_vides())
+            total['nombre_ventes'] = resultat.nombre
+            total['total_ventes'] = resultat.montant or 0
+            total['quantite_vendue'] = resultat.quantite or 0
+        
+        achats = source(Achat, date_debut, date_fin)
+        magasin_achat = func.coalesce(achats.magasin_id, defaut)
+        achats_query = db.session.query(
+            magasin_achat.label('magasin_id'),
+            func.count(achats.id).label('nombre'),
+            func.sum(achats.montant_total).label('montant')
+        ).filter(achats.statut == 'completed')
+        if date_debut:
+            achats_query = achats_query.filter(achats.date_achat >= date_debut)
+        if date_fin:
+            achats_query = achats_query.filter(achats.date_achat <= date_fin)
+        for resultat in achats_query.group_by(magasin_achat):
+            total = totaux.setdefault(resultat.magasin_id, StatistiqueService._totaux_magasin_vides())
+            total['nombre_achats'] = resultat.nombre
+            total['total_achats'] = resultat.montant or 0
+        
+        return totaux
+    
+    @staticmethod
+    def _totaux_magasin_vides():
+        return {'nombre_ventes': 0, 'total_ventes': 0, 'quantite_vendue': 0, 'nombre_achats': 0, 'total_achats': 0}
+    
+    @staticmethod
+    def _scatter(fonction, *args):
+        """Exécute `fonction` dans chaque base de transactions (primaire, bases de magasins)
+        
+        Les bases sont interrogées en parallèle; une base en erreur ou qui
+        dépasse STORE_QUERY_TIMEOUT est écartée du résultat au lieu de faire
+        échouer le rapport. Retourne ({portée: résultat}, magasins_indisponibles).
+        """
+        from services.dashboard_service import DashboardService
+        
+        portees = MagasinService.database_scopes()
+        if len(portees) == 1:
+            with use_store(None):
+                return {None: fonction(*args)}, []
+        
+        def dans_la_portee(portee):
+            def executer():
+                with use_store(portee):
+                    return fonction(*args)
+            return executer
+        
+        noms = {('primaire' if portee is None else f'magasin {portee}'): portee for portee in portees}
+        resultats, indisponibles = DashboardService.assemble({
+            nom: (dans_la_portee(portee), None, current_app.config['STORE_QUERY_TIMEOUT']) for nom, portee in noms.items()
+        })
+        return (
+            {noms[nom]: resultat for nom, resultat in resultats.items() if nom not in indisponibles},
+            [noms[nom] for nom in indisponibles]
+        )
+    
+    @staticmethod
+    def get_consolidated_balance(date_debut=None, date_fin=None):
+        """Balance commerciale de tous les magasins, bases dédiées comprises"""
+        parties, indisponibles = StatistiqueService._scatter(
+            StatistiqueService.get_balance_commerciale, date_debut, date_fin
+        )
+        total_ventes = sum(partie['total_ventes'] for partie in parties.values())
+        total_achats = sum(partie['total_achats'] for partie in parties.values())
+        balance = total_ventes - total_achats
+        
+        return {
+            'total_ventes': total_ventes,
+            'total_achats': total_achats,
+            'balance': balance,
+            'marge_brute': (balance / total_ventes * 100) if total_ventes > 0 else 0,
+            'magasins_indisponibles': indisponibles
+        }
+    
+    @staticmethod
+    def get_consolidated_monthly_statistics(mois=None, annee=None):
+        """Statistiques mensuelles de tous les magasins, bases dédiées comprises"""
+        parties, indisponibles = StatistiqueService._scatter(StatistiqueService.get_monthly_statistics, mois, annee)
+        if not parties:
+            return {'magasins_indisponibles': indisponibles}
+        
+        resultat = dict(next(iter(parties.values())))
+        for cle in ('nombre_ventes', 'nombre_achats', 'total_ventes', 'total_achats', 'benefice'):
+            resultat[cle] = sum(partie[cle] for partie in parties.values())
+        resultat['balance'] = resultat['total_ventes'] - resultat['total_achats']
+        resultat['magasins_indisponibles'] = indisponibles
+        return resultat
+    
+    @staticmethod
+    def get_store_comparison(date_debut=None, date_fin=None):
+        """Compare les magasins sur la période (ventes, achats, balance, part du CA)"""
+        parties, indisponibles = StatistiqueService._scatter(
+            StatistiqueService.get_totals_by_store, date_debut, date_fin
+        )
+        par_magasin = {}
+        for totaux in parties.values():
+            for magasin_id, total in totaux.items():
+                cumul = par_magasin.setdefault(magasin_id, StatistiqueService._totaux_magasin_vides())
+                for cle, valeur in total.items():
+                    cumul[cle] += valeur
+        
+        magasins = {magasin.id: magasin for magasin in MagasinService.get_all_magasins(actifs_seulement=False)}
+        for magasin_id in magasins:
+            par_magasin.setdefault(magasin_id, StatistiqueService._totaux_magasin_vides())
+        total_ventes = sum(cumul['total_ventes'] for cumul in par_magasin.values())
+        
+        comparaison = [
+            {
+                'magasin': magasins.get(magasin_id),
+                'magasin_id': magasin_id,
+                **cumul,
+                'balance': cumul['total_ventes'] - cumul['total_achats'],
+                'panier_moyen': cumul['total_ventes'] / cumul['nombre_ventes'] if cumul['nombre_ventes'] else 0,
+                'part_ca': (cumul['total_ventes'] / total_ventes * 100) if total_ventes > 0 else 0
+            }
+            for magasin_id, cumul in par_magasin.items()
+        ]
+        comparaison.sort(key=lambda ligne: ligne['total_ventes'], reverse=True)
+        
+        return {
+            'magasins': comparaison,
+            'total_ventes': total_ventes,
+            'magasins_indisponibles': indisponibles
+        }
+    
+    @staticmethod
+    @cached(tables=('ventes', 'achats', 'produits'))
+    @read_only
     def get_yearly_comparison(annee=None):
         """Compare les performances année sur année"""
         if not annee:
@@ -125,20 +292,36 @@ class StatistiqueService:
         }
     
     @staticmethod
+    @cached(tables=('clients', 'ventes'))
+    @read_only
     def get_client_statistics():
         """Retourne les statistiques clients"""
         clients = Client.query.all()
         
+        # Une seule agrégation par client, archives comprises
+        ventes = source(Vente)
+        totaux = {
+            resultat.client_id: resultat
+            for resultat in db.session.query(
+                ventes.client_id,
+                func.count(ventes.id).label('nombre'),
+                func.sum(ventes.montant_total).label('montant'),
+                func.max(ventes.date_vente).label('derniere')
+            ).filter(ventes.statut == 'completed').group_by(ventes.client_id)
+        }
+        
         client_stats = []
         for client in clients:
-            ventes = client.ventes.filter_by(statut='completed').all()
+            total = totaux.get(client.id)
+            nombre = total.nombre if total else 0
+            montant = (total.montant or 0) if total else 0
             
             client_stats.append({
                 'client': client,
-                'nombre_achats': len(ventes),
-                'montant_total': sum(vente.montant_total for vente in ventes),
-                'derniere_vente': max([vente.date_vente for vente in ventes]) if ventes else None,
-                'panier_moyen': sum(vente.montant_total for vente in ventes) / len(ventes) if ventes else 0
+                'nombre_achats': nombre,
+                'montant_total': montant,
+                'derniere_vente': total.derniere if total else None,
+                'panier_moyen': montant / nombre if nombre else 0
             })
         
         # Trier par montant total décroissant
@@ -147,17 +330,21 @@ class StatistiqueService:
         return client_stats
     
     @staticmethod
-    def get_product_performance():
+    @cached(tables=('produits', 'ventes'))
+    @read_only
+    def get_product_performance(classe_abc=None):
         """Analyse la performance des produits"""
-        produits = Produit.query.filter_by(actif=True).all()
+        query = Produit.query.filter_by(actif=True)
+        if classe_abc:
+            query = query.filter_by(classe_abc=classe_abc)
+        produits = query.all()
         
         product_stats = []
         for produit in produits:
-            ventes = produit.ventes.filter_by(statut='completed').all()
-            
-            quantite_vendue = sum(vente.quantite for vente in ventes)
-            ca_genere = sum(vente.montant_total for vente in ventes)
-            benefice_genere = sum(vente.benefice for vente in ventes)
+            # Cumuls tenus sur le produit (ventes validées, archives comprises)
+            quantite_vendue = produit.total_vendu
+            ca_genere = produit.chiffre_affaires
+            benefice_genere = produit.benefice_ventes or 0
             
             # Calcul de la rotation du stock
             rotation = quantite_vendue / produit.stock_initial if produit.stock_initial > 0 else 0
@@ -177,15 +364,107 @@ class StatistiqueService:
         return product_stats
     
     @staticmethod
+    def compute_abc_classification(date_debut=None, date_fin=None):
+        """Classe tous les produits actifs en A/B/C (Pareto)
+        
+        Une seule requête agrège chiffre d'affaires, marge et quantité par
+        produit sur la période; les parts cumulées sont ensuite calculées de
+        façon vectorisée et les classes enregistrées en une mise à jour groupée.
+        """
+        ventes = source(Vente, date_debut, date_fin)
+        conditions = [ventes.produit_id == Produit.id, ventes.statut == 'completed']
+        if date_debut:
+            conditions.append(ventes.date_vente >= date_debut)
+        if date_fin:
+            conditions.append(ventes.date_vente <= date_fin)
+        
+        resultats = db.session.query(
+            Produit.id,
+            func.coalesce(func.sum(ventes.montant_total), 0).label('ca'),
+            func.coalesce(func.sum(
+                ventes.montant_total - func.coalesce(ventes.cout_achat, ventes.quantite * Produit.prix_achat)
+            ), 0).label('marge'),
+            func.coalesce(func.sum(ventes.quantite), 0).label('quantite')
+        ).outerjoin(ventes, db.and_(*conditions)).filter(
+            Produit.actif == True
+        ).group_by(Produit.id).all()
+        
+        if not resultats:
+            return {'total_produits': 0, 'classes': {}}
+        
+        produit_ids = [r.id for r in resultats]
+        ca = np.array([r.ca for r in resultats], dtype=np.float64)
+        marge = np.array([r.marge for r in resultats], dtype=np.float64)
+        quantite = np.array([r.quantite for r in resultats], dtype=np.float64)
+        
+        classes_ca = StatistiqueService._abc_classes(ca)
+        classes_marge = StatistiqueService._abc_classes(marge)
+        classes_quantite = StatistiqueService._abc_classes(quantite)
+        
+        maintenant = datetime.utcnow()
+        try:
+            db.session.execute(update(Produit), [
+                {
+                    'id': produit_id,
+                    'classe_abc': classes_ca[i],
+                    'classe_abc_marge': classes_marge[i],
+                    'classe_abc_quantite': classes_quantite[i],
+                    'date_classement': maintenant
+                }
+                for i, produit_id in enumerate(produit_ids)
+            ])
+            db.session.commit()
+        except Exception:
+            db.session.rollback()
+            raise
+        
+        ca_total = ca.sum()
+        return {
+            'total_produits': len(produit_ids),
+            'classes': {
+                classe: {
+                    'nombre_produits': int((classes_ca == classe).sum()),
+                    'part_produits': float((classes_ca == classe).mean() * 100),
+                    'part_ca': float(ca[classes_ca == classe].sum() / ca_total * 100) if ca_total > 0 else 0
+                }
+                for classe in ('A', 'B', 'C')
+            }
+        }
+    
+    @staticmethod
+    def _abc_classes(valeurs):
+        """Attribue A/B/C selon la part cumulée atteinte avant chaque produit"""
+        ordre = np.argsort(-valeurs, kind='stable')
+        tries = np.clip(valeurs[ordre], 0, None)
+        total = tries.sum()
+        
+        classes = np.full(len(valeurs), 'C', dtype='<U1')
+        if total <= 0:
+            return classes
+        
+        part_precedente = (np.cumsum(tries) - tries) / total
+        classes_triees = np.where(
+            part_precedente < current_app.config['ABC_SEUIL_A'], 'A',
+            np.where(part_precedente < current_app.config['ABC_SEUIL_B'], 'B', 'C')
+        )
+        classes_triees[tries <= 0] = 'C'
+        classes[ordre] = classes_triees
+        return classes
+    
+    @staticmethod
+    @cached(tables=('ventes', 'achats', 'produits'))
+    @read_only
     def get_dashboard_data():
         """Retourne les données pour le tableau de bord"""
         aujourd_hui = datetime.now().date()
+        debut_jour = datetime.combine(aujourd_hui, datetime.min.time())
         debut_semaine = aujourd_hui - timedelta(days=7)
         debut_mois = aujourd_hui.replace(day=1)
         
-        # Statistiques du jour
+        # Statistiques du jour (plage de dates: seule la partition du mois est lue)
         ventes_jour = Vente.query.filter(
-            func.date(Vente.date_vente) == aujourd_hui,
+            Vente.date_vente >= debut_jour,
+            Vente.date_vente < debut_jour + timedelta(days=1),
             Vente.statut == 'completed'
         ).all()
         
@@ -231,6 +510,31 @@ class StatistiqueService:
         }
     
     @staticmethod
+    def get_rapport_data():
+        """Retourne les données du rapport complet (sections chargées en parallèle)"""
+        from services.stock_service import StockService
+        from services.dashboard_service import DashboardService
+        
+        sections, sections_indisponibles = DashboardService.assemble({
+            'balance': (StatistiqueService.get_balance_commerciale, {}),
+            'dashboard_data': (StatistiqueService.get_dashboard_data, {}),
+            'performance_produits': (StatistiqueService.get_product_performance, []),
+            'stats_clients': (StatistiqueService.get_client_statistics, []),
+            'stock_summary': (StockService.get_stock_summary, {})
+        })
+        
+        return {
+            'balance': sections['balance'],
+            'dashboard_data': sections['dashboard_data'],
+            'top_produits': sections['performance_produits'][:5],
+            'top_clients': sections['stats_clients'][:5],
+            'stock_summary': sections['stock_summary'],
+            'sections_indisponibles': sections_indisponibles
+        }
+    
+    @staticmethod
+    @cached(tables=('ventes', 'achats', 'produits', 'clients'))
+    @read_only
     def export_statistics_data(format_export='dict', date_debut=None, date_fin=None):
         """Exporte les données statistiques"""
         # Récupérer toutes les données
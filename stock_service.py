@@ -2,20 +2,30 @@ from models.produit import Produit
 from models.vente import Vente
 from models.achat import Achat
 from app import db
-from datetime import datetime
+from db_routing import read_only
+from cache import cached
+from partitions import source
+from datetime import datetime, date, timedelta
+from sqlalchemy import func, union_all, select, literal
+import numpy as np
 
 class StockService:
     """Service pour la gestion des stocks"""
     
     @staticmethod
-    def get_products_with_low_stock():
+    def get_products_with_low_stock(classe_abc=None):
         """Retourne les produits avec un stock faible"""
-        return Produit.query.filter(
-            Produit.stock_actuel <= Produit.stock_minimum,
+        query = Produit.query.filter(
+            Produit.stock_actuel <= func.coalesce(Produit.point_commande, Produit.stock_minimum),
             Produit.actif == True
-        ).all()
+        )
+        if classe_abc:
+            query = query.filter(Produit.classe_abc == classe_abc)
+        return query.all()
     
     @staticmethod
+    @cached(tables=('produits',))
+    @read_only
     def get_stock_summary():
         """Retourne un résumé du stock global"""
         produits = Produit.query.filter_by(actif=True).all()
@@ -102,23 +112,136 @@ class StockService:
     @staticmethod
     def calculate_stock_turnover(produit_id, days=30):
         """Calcule la rotation du stock pour un produit"""
-        from datetime import timedelta
-        
-        produit = Produit.query.get(produit_id)
-        if not produit:
+        rotations = StockService.calculate_stock_turnover_batch(days=days, produit_ids=[produit_id])
+        if not rotations:
             return 0
+        return rotations[0]['rotation']
+    
+    @staticmethod
+    @cached(tables=('produits', 'ventes', 'achats'))
+    @read_only
+    def calculate_stock_turnover_batch(days=30, produit_ids=None):
+        """Calcule la rotation et la couverture du stock pour tous les produits
+        
+        Le stock moyen est intégré jour par jour sur la fenêtre à partir des
+        mouvements datés (ventes et achats validés), en remontant depuis le
+        stock actuel. Une seule requête groupée alimente une matrice
+        produit x jour traitée ensuite de façon vectorisée.
+        """
+        aujourd_hui = datetime.utcnow().date()
+        date_debut = aujourd_hui - timedelta(days=days - 1)
+        debut_fenetre = datetime.combine(date_debut, datetime.min.time())
+        
+        produits_query = db.session.query(
+            Produit.id, Produit.nom, Produit.stock_actuel, Produit.stock_minimum, Produit.prix_achat
+        ).filter(Produit.actif == True)
+        if produit_ids is not None:
+            produits_query = produits_query.filter(Produit.id.in_(produit_ids))
+        produits = produits_query.order_by(Produit.id).all()
+        
+        if not produits:
+            return []
+        
+        ids = [p.id for p in produits]
+        stock_actuel = np.array([p.stock_actuel or 0 for p in produits], dtype=np.float64)
+        
+        # Mouvements quotidiens nets par produit (sorties négatives, entrées positives)
+        ventes, achats = source(Vente, debut_fenetre), source(Achat, debut_fenetre)
+        ventes_select = select(
+            ventes.produit_id.label('produit_id'),
+            func.date(ventes.date_vente).label('jour'),
+            ventes.quantite.label('vendu'),
+            literal(0).label('achete')
+        ).where(ventes.date_vente >= debut_fenetre, ventes.statut == 'completed')
+        achats_select = select(
+            achats.produit_id.label('produit_id'),
+            func.date(achats.date_achat).label('jour'),
+            literal(0).label('vendu'),
+            achats.quantite.label('achete')
+        ).where(achats.date_achat >= debut_fenetre, achats.statut == 'completed')
+        mouvements = union_all(ventes_select, achats_select).subquery()
         
-        date_debut = datetime.utcnow() - timedelta(days=days)
+        mouvements_query = db.session.query(
+            mouvements.c.produit_id,
+            mouvements.c.jour,
+            func.sum(mouvements.c.vendu).label('vendu'),
+            func.sum(mouvements.c.achete).label('achete')
+        )
+        if produit_ids is not None:
+            mouvements_query = mouvements_query.filter(mouvements.c.produit_id.in_(produit_ids))
+        resultats = mouvements_query.group_by(mouvements.c.produit_id, mouvements.c.jour).all()
         
-        ventes = Vente.query.filter(
-            Vente.produit_id == produit_id,
-            Vente.date_vente >= date_debut,
-            Vente.statut == 'completed'
-        ).all()
+        vendu = np.zeros((len(ids), days), dtype=np.float64)
+        achete = np.zeros((len(ids), days), dtype=np.float64)
+        index_produits = {produit_id: i for i, produit_id in enumerate(ids)}
+        for resultat in resultats:
+            ligne = index_produits.get(resultat.produit_id)
+            colonne = (StockService._parse_jour(resultat.jour) - date_debut).days
+            if ligne is None or not 0 <= colonne < days:
+                continue
+            vendu[ligne, colonne] += resultat.vendu or 0
+            achete[ligne, colonne] += resultat.achete or 0
         
-        quantite_vendue = sum(vente.quantite for vente in ventes)
-        stock_moyen = (produit.stock_initial + produit.stock_actuel) / 2
+        # Stock de clôture de chaque jour = stock actuel - mouvements nets des jours suivants
+        net = achete - vendu
+        suffixe = np.cumsum(net[:, ::-1], axis=1)[:, ::-1]
+        stock_cloture = stock_actuel[:, None] - (suffixe - net)
+        stock_ouverture = stock_cloture - net
+        stock_moyen = ((stock_ouverture + stock_cloture) / 2).clip(min=0).mean(axis=1)
         
-        if stock_moyen > 0:
-            return quantite_vendue / stock_moyen
-        return 0
+        quantite_vendue = vendu.sum(axis=1)
+        rotation = np.divide(quantite_vendue, stock_moyen,
+                             out=np.zeros_like(quantite_vendue), where=stock_moyen > 0)
+        vente_journaliere = quantite_vendue / days
+        jours_couverture = np.divide(stock_actuel, vente_journaliere,
+                                     out=np.full_like(stock_actuel, np.inf), where=vente_journaliere > 0)
+        
+        return [
+            {
+                'produit_id': produit.id,
+                'produit_nom': produit.nom,
+                'stock_actuel': produit.stock_actuel,
+                'stock_minimum': produit.stock_minimum,
+                'valeur_stock': (produit.stock_actuel or 0) * produit.prix_achat,
+                'quantite_vendue': int(quantite_vendue[i]),
+                'stock_moyen': float(stock_moyen[i]),
+                'rotation': float(rotation[i]),
+                'jours_couverture': float(jours_couverture[i]) if np.isfinite(jours_couverture[i]) else None
+            }
+            for i, produit in enumerate(produits)
+        ]
+    
+    @staticmethod
+    @cached(tables=('produits', 'ventes', 'achats'))
+    @read_only
+    def get_slow_movers(days=30, sort_by='rotation', order='asc', limit=None):
+        """Retourne le rapport des produits à rotation lente, triable"""
+        rotations = [
+            r for r in StockService.calculate_stock_turnover_batch(days=days)
+            if r['stock_actuel'] > 0 or r['stock_moyen'] > 0
+        ]
+        
+        cles_tri = {
+            'rotation': lambda r: r['rotation'],
+            # Une couverture infinie (aucune vente) est la plus lente
+            'jours_couverture': lambda r: r['jours_couverture'] if r['jours_couverture'] is not None else float('inf'),
+            'stock_moyen': lambda r: r['stock_moyen'],
+            'quantite_vendue': lambda r: r['quantite_vendue'],
+            'valeur_stock': lambda r: r['valeur_stock'],
+            'nom': lambda r: r['produit_nom'].lower()
+        }
+        cle = cles_tri.get(sort_by, cles_tri['rotation'])
+        rotations.sort(key=cle, reverse=(order == 'desc'))
+        
+        if limit:
+            return rotations[:limit]
+        return rotations
+    
+    @staticmethod
+    def _parse_jour(jour):
+        """Normalise le résultat de func.date (chaîne sous SQLite, date sous PostgreSQL)"""
+        if isinstance(jour, datetime):
+            return jour.date()
+        if isinstance(jour, date):
+            return jour
+        return date.fromisoformat(str(jour)[:10])
@@ -0,0 +1,44 @@
+from app import db
+from datetime import datetime
+
+class Tache(db.Model):
+    """Tâche d'arrière-plan (rapport ou export) et son fichier résultat"""
+    __tablename__ = 'taches'
+    
+    id = db.Column(db.String(32), primary_key=True)
+    type_tache = db.Column(db.String(50), nullable=False)
+    parametres = db.Column(db.Text)  # JSON
+    cle = db.Column(db.String(64), nullable=False, index=True)  # Empreinte (type + paramètres) pour la déduplication
+    client_id = db.Column(db.Integer, db.ForeignKey('clients.id'))
+    proprietaire = db.Column(db.String(100))  # Processus qui exécute la tâche (hôte:pid)
+    statut = db.Column(db.String(20), default='pending')  # pending, running, completed, failed
+    nom_fichier = db.Column(db.String(200))
+    chemin_fichier = db.Column(db.String(500))
+    content_type = db.Column(db.String(100))
+    erreur = db.Column(db.Text)
+    date_creation = db.Column(db.DateTime, default=datetime.utcnow)
+    date_debut = db.Column(db.DateTime)
+    date_fin = db.Column(db.DateTime)
+    date_expiration = db.Column(db.DateTime, index=True)
+    
+    def __repr__(self):
+        return f'<Tache {self.id} - {self.type_tache} ({self.statut})>'
+    
+    @property
+    def expiree(self):
+        """Vérifie si le résultat de la tâche a expiré"""
+        return self.date_expiration is not None and self.date_expiration <= datetime.utcnow()
+    
+    def to_dict(self):
+        """Convertit l'objet en dictionnaire"""
+        return {
+            'id': self.id,
+            'type_tache': self.type_tache,
+            'statut': self.statut,
+            'nom_fichier': self.nom_fichier,
+            'erreur': self.erreur,
+            'date_creation': self.date_creation.isoformat() if self.date_creation else None,
+            'date_debut': self.date_debut.isoformat() if self.date_debut else None,
+            'date_fin': self.date_fin.isoformat() if self.date_fin else None,
+            'date_expiration': self.date_expiration.isoformat() if self.date_expiration else None
+        }
@@ -0,0 +1,63 @@
+from flask import Blueprint, request, jsonify, url_for, send_file
+from flask_login import login_required, current_user
+from services.tache_service import TacheService
+import os
+
+tache_bp = Blueprint('tache', __name__, url_prefix='/taches')
+
+@tache_bp.route('/', methods=['POST'])
+@login_required
+def soumettre_tache():
+    """Soumet un rapport ou un export en arrière-plan"""
+    try:
+        type_tache = request.form.get('type', '', type=str)
+        parametres = {
+            cle: valeur for cle, valeur in request.form.items()
+            if cle in ('format', 'period')
+        }
+        
+        tache, message = TacheService.submit(type_tache, parametres, client_id=current_user.id)
+        if not tache:
+            return jsonify({'error': message}), 400
+        
+        return jsonify({
+            'tache': tache.to_dict(),
+            'message': message,
+            'url_statut': url_for('tache.statut_tache', id=tache.id)
+        }), 202
+        
+    except Exception as e:
+        return jsonify({'error': str(e)}), 500
+
+@tache_bp.route('/<id>')
+@login_required
+def statut_tache(id):
+    """Retourne l'état d'une tâche"""
+    try:
+        tache = TacheService.get_tache(id, client_id=current_user.id)
+        if not tache:
+            return jsonify({'error': "Tâche non trouvée"}), 404
+        
+        data = {'tache': tache.to_dict()}
+        if tache.statut == 'completed' and not tache.expiree:
+            data['url_telechargement'] = url_for('tache.telecharger_tache', id=tache.id)
+        return jsonify(data)
+        
+    except Exception as e:
+        return jsonify({'error': str(e)}), 500
+
+@tache_bp.route('/<id>/telecharger')
+@login_required
+def telecharger_tache(id):
+    """Télécharge le fichier produit par une tâche terminée"""
+    tache = TacheService.get_tache(id, client_id=current_user.id)
+    if not tache or tache.statut != 'completed':
+        return jsonify({'error': "Résultat non disponible"}), 404
+    
+    if tache.expiree or not os.path.exists(tache.chemin_fichier or ''):
+        return jsonify({'error': "Résultat expiré"}), 410
+    
+    return send_file(tache.chemin_fichier,
+                     mimetype=tache.content_type,
+                     as_attachment=True,
+                     download_name=tache.nom_fichier)
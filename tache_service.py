@@ -0,0 +1,324 @@
+from models.tache import Tache
+from models.client import Client
+from services.statistique_service import StatistiqueService
+from services.dashboard_service import DashboardService
+from app import db
+from datetime import datetime, timedelta
+from concurrent.futures import ThreadPoolExecutor
+from flask import current_app, render_template
+from utils.helpers import build_csv, format_currency, get_date_range
+import threading
+import hashlib
+import socket
+import logging
+import json
+import uuid
+import os
+
+_verrou_executeur = threading.Lock()
+
+def _get_executeur():
+    """Retourne le pool de threads des tâches de l'application (créé à la demande, après le fork des workers)"""
+    app = current_app._get_current_object()
+    with _verrou_executeur:
+        executeur = app.extensions.get('taches')
+        if executeur is None:
+            executeur = ThreadPoolExecutor(max_workers=app.config['JOB_WORKERS'], thread_name_prefix='tache')
+            app.extensions['taches'] = executeur
+    return executeur
+
+def _proprietaire():
+    """Identifiant du processus courant (hôte:pid): celui qui exécute les tâches qu'il soumet"""
+    return f"{socket.gethostname()}:{os.getpid()}"
+
+def _proprietaire_actif(proprietaire):
+    """Faux si le processus propriétaire, sur cette machine, n'existe plus
+
+    Sur une autre machine (ou pour une tâche sans propriétaire), l'état du
+    processus est inconnu: seul JOB_TIMEOUT s'applique.
+    """
+    hote, _, pid = (proprietaire or '').rpartition(':')
+    if hote != socket.gethostname() or not pid.isdigit():
+        return True
+    try:
+        os.kill(int(pid), 0)
+    except ProcessLookupError:
+        return False
+    except PermissionError:
+        pass
+    return True
+
+def _periode(parametres):
+    """Convertit le paramètre 'period' en bornes datetime"""
+    date_debut, date_fin = get_date_range(parametres.get('period', 'month'))
+    return (
+        datetime.combine(date_debut, datetime.min.time()) if date_debut else None,
+        datetime.combine(date_fin, datetime.max.time()) if date_fin else None
+    )
+
+def _generer_export_statistiques(parametres):
+    """Export des statistiques en CSV ou JSON"""
+    format_export = parametres.get('format', 'csv')
+    period = parametres.get('period', 'month')
+    date_debut, date_fin = _periode(parametres)
+    
+    export_data = StatistiqueService.export_statistics_data(
+        format_export='dict',
+        date_debut=date_debut,
+        date_fin=date_fin
+    )
+    
+    if format_export == 'json':
+        return json.dumps(export_data, indent=2, default=str), 'statistiques.json', 'application/json'
+    
+    # Exporter la balance commerciale
+    data = []
+    balance = export_data['balance_commerciale']
+    data.append([
+        'Balance commerciale',
+        balance['total_ventes'],
+        balance['total_achats'],
+        balance['balance'],
+        f"{balance['marge_brute']:.2f}%"
+    ])
+    
+    # Ajouter les statistiques clients
+    data.append(['', '', '', '', ''])  # Ligne vide
+    data.append(['Top Clients', '', '', '', ''])
+    for client_stat in export_data['statistiques_clients'][:10]:
+        data.append([
+            client_stat['nom_client'],
+            client_stat['email'],
+            client_stat['nombre_achats'],
+            client_stat['montant_total'],
+            client_stat['panier_moyen']
+        ])
+    
+    # Ajouter les performances produits
+    data.append(['', '', '', '', ''])  # Ligne vide
+    data.append(['Performance Produits', '', '', '', ''])
+    for prod_stat in export_data['performance_produits'][:10]:
+        data.append([
+            prod_stat['nom_produit'],
+            prod_stat['quantite_vendue'],
+            prod_stat['ca_genere'],
+            prod_stat['benefice_genere'],
+            f"{prod_stat['marge_moyenne']:.2f}%"
+        ])
+    
+    headers = ['Élément', 'Valeur 1', 'Valeur 2', 'Valeur 3', 'Valeur 4']
+    return build_csv(data, headers), f'statistiques_{period}.csv', 'text/csv; charset=utf-8'
+
+def _generer_export_clients(parametres):
+    """Export de la liste des clients en CSV"""
+    clients = Client.query.order_by(Client.nom).all()
+    
+    # Préparer les données
+    data = []
+    for client in clients:
+        data.append([
+            client.nom,
+            client.email,
+            client.telephone or '',
+            client.adresse or '',
+            client.date_inscription.strftime('%d/%m/%Y') if client.date_inscription else '',
+            client.nombre_achats,
+            client.total_achats,
+            format_currency(client.total_achats / client.nombre_achats) if client.nombre_achats > 0 else '0 MGA'
+        ])
+    
+    headers = [
+        'Nom', 'Email', 'Téléphone', 'Adresse', 'Date inscription',
+        'Nombre d\'achats', 'Total achats (MGA)', 'Panier moyen'
+    ]
+    return build_csv(data, headers), 'clients.csv', 'text/csv; charset=utf-8'
+
+def _generer_rapport(parametres):
+    """Rapport complet en HTML autonome"""
+    # Rapport conservé JOB_RESULT_TTL: jamais enregistré avec des sections de repli
+    with DashboardService.complete_sections():
+        donnees = StatistiqueService.get_rapport_data()
+    html = render_template('statistiques.html',
+                           show_rapport=True,
+                           date_rapport=datetime.now(),
+                           **donnees)
+    return html, f"rapport_{datetime.now().strftime('%Y%m%d')}.html", 'text/html; charset=utf-8'
+
+GENERATEURS = {
+    'export_statistiques': _generer_export_statistiques,
+    'export_clients': _generer_export_clients,
+    'rapport': _generer_rapport
+}
+
+class TacheService:
+    """Service pour l'exécution des rapports et exports en arrière-plan"""
+    
+    @staticmethod
+    def generer(type_tache, parametres=None):
+        """Génère le contenu d'une tâche de façon synchrone: (contenu, nom_fichier, content_type)"""
+        return GENERATEURS[type_tache](parametres or {})
+    
+    @staticmethod
+    def submit(type_tache, parametres=None, client_id=None):
+        """Soumet une tâche, ou retourne une tâche identique encore valide"""
+        if type_tache not in GENERATEURS:
+            return None, "Type de tâche inconnu"
+        
+        parametres = parametres or {}
+        cle = TacheService._cle(type_tache, parametres)
+        
+        TacheService.purge_expired()
+        
+        existante = TacheService._find_reusable(cle, client_id)
+        if existante:
+            return existante, "Tâche identique déjà disponible"
+        
+        tache = Tache()
+        tache.id = uuid.uuid4().hex
+        tache.type_tache = type_tache
+        tache.parametres = json.dumps(parametres, sort_keys=True)
+        tache.cle = cle
+        tache.client_id = client_id
+        tache.proprietaire = _proprietaire()
+        tache.statut = 'pending'
+        
+        try:
+            db.session.add(tache)
+            db.session.commit()
+        except Exception as e:
+            db.session.rollback()
+            return None, f"Erreur lors de la soumission de la tâche: {str(e)}"
+        
+        _get_executeur().submit(TacheService._run, current_app._get_current_object(), tache.id)
+        return tache, "Tâche soumise"
+    
+    @staticmethod
+    def get_tache(tache_id, client_id=None):
+        """Retourne une tâche par son identifiant (None si elle appartient à un autre client)"""
+        tache = db.session.get(Tache, tache_id)
+        if tache is None or tache.client_id != client_id:
+            return None
+        return tache
+    
+    @staticmethod
+    def purge_expired():
+        """Supprime les tâches expirées et leurs fichiers"""
+        maintenant = datetime.utcnow()
+        duree_max = current_app.config['JOB_TIMEOUT'] + current_app.config['JOB_RESULT_TTL']
+        taches = Tache.query.filter(
+            db.or_(
+                Tache.date_expiration <= maintenant,
+                db.and_(
+                    Tache.statut.in_(['pending', 'running', 'failed']),
+                    Tache.date_creation <= maintenant - timedelta(seconds=duree_max)
+                )
+            )
+        ).all()
+        
+        for tache in taches:
+            if tache.chemin_fichier and os.path.exists(tache.chemin_fichier):
+                try:
+                    os.remove(tache.chemin_fichier)
+                except OSError as e:
+                    logging.warning(f"Impossible de supprimer {tache.chemin_fichier}: {str(e)}")
+            db.session.delete(tache)
+        
+        if taches:
+            db.session.commit()
+        return len(taches)
+    
+    @staticmethod
+    def _cle(type_tache, parametres):
+        """Empreinte d'une demande pour la déduplication"""
+        contenu = json.dumps({'type': type_tache, 'parametres': parametres}, sort_keys=True, default=str)
+        return hashlib.sha256(contenu.encode('utf-8')).hexdigest()
+    
+    @staticmethod
+    def _find_reusable(cle, client_id=None):
+        """Retourne une tâche identique du client, en cours ou terminée et encore valide
+        
+        Une tâche en attente ou en cours dont le processus s'est arrêté
+        (redémarrage d'un worker) n'aboutira jamais: elle est marquée en échec.
+        """
+        maintenant = datetime.utcnow()
+        taches = Tache.query.filter(
+            Tache.cle == cle,
+            Tache.client_id == client_id,
+            db.or_(
+                db.and_(
+                    Tache.statut.in_(['pending', 'running']),
+                    Tache.date_creation >= maintenant - timedelta(seconds=current_app.config['JOB_TIMEOUT'])
+                ),
+                db.and_(
+                    Tache.statut == 'completed',
+                    Tache.date_expiration > maintenant
+                )
+            )
+        ).order_by(db.desc(Tache.date_creation)).all()
+        
+        for tache in taches:
+            if tache.statut != 'completed':
+                if _proprietaire_actif(tache.proprietaire):
+                    return tache
+                TacheService._abandonner(tache)
+            elif os.path.exists(tache.chemin_fichier or ''):
+                return tache
+        return None
+    
+    @staticmethod
+    def _abandonner(tache):
+        """Marque en échec une tâche dont le processus s'est arrêté"""
+        tache.statut = 'failed'
+        tache.erreur = "Processus arrêté avant la fin de la tâche"
+        tache.date_fin = datetime.utcnow()
+        tache.date_expiration = tache.date_fin + timedelta(seconds=current_app.config['JOB_RESULT_TTL'])
+        try:
+            db.session.commit()
+        except Exception as e:
+            db.session.rollback()
+            logging.warning(f"Impossible de marquer la tâche {tache.id} en échec: {str(e)}")
+    
+    @staticmethod
+    def _run(app, tache_id):
+        """Exécute une tâche dans un thread du pool"""
+        with app.app_context():
+            tache = db.session.get(Tache, tache_id)
+            if not tache:
+                return
+            
+            tache.statut = 'running'
+            tache.date_debut = datetime.utcnow()
+            db.session.commit()
+            
+            try:
+                # Contexte de requête factice pour url_for dans les gabarits
+                with app.test_request_context():
+                    contenu, nom_fichier, content_type = TacheService.generer(
+                        tache.type_tache, json.loads(tache.parametres or '{}')
+                    )
+                
+                dossier = os.path.abspath(app.config['JOB_ARTIFACT_DIR'])
+                os.makedirs(dossier, exist_ok=True)
+                chemin = os.path.join(dossier, f"{tache.id}_{nom_fichier}")
+                if isinstance(contenu, str):
+                    contenu = contenu.encode('utf-8')
+                with open(chemin, 'wb') as fichier:
+                    fichier.write(contenu)
+                
+                tache.statut = 'completed'
+                tache.nom_fichier = nom_fichier
+                tache.chemin_fichier = chemin
+                tache.content_type = content_type
+                tache.date_fin = datetime.utcnow()
+                tache.date_expiration = tache.date_fin + timedelta(seconds=app.config['JOB_RESULT_TTL'])
+                db.session.commit()
+            
+            except Exception as e:
+                db.session.rollback()
+                logging.exception(f"Échec de la tâche {tache_id}")
+                tache = db.session.get(Tache, tache_id)
+                tache.statut = 'failed'
+                tache.erreur = str(e)
+                tache.date_fin = datetime.utcnow()
+                tache.date_expiration = tache.date_fin + timedelta(seconds=app.config['JOB_RESULT_TTL'])
+                db.session.commit()
@@ -1,5 +1,6 @@
 from app import db
 from datetime import datetime
+from money import MoneyType
 
 class Vente(db.Model):
     __tablename__ = 'ventes'
@@ -7,12 +8,14 @@ class Vente(db.Model):
     id = db.Column(db.Integer, primary_key=True)
     produit_id = db.Column(db.Integer, db.ForeignKey('produits.id'), nullable=False)
     client_id = db.Column(db.Integer, db.ForeignKey('clients.id'), nullable=False)
+    magasin_id = db.Column(db.Integer, db.ForeignKey('magasins.id'), index=True)  # None: magasin par défaut
     quantite = db.Column(db.Integer, nullable=False)
-    prix_unitaire = db.Column(db.Float, nullable=False)  # Prix en Ariary (MGA)
+    prix_unitaire = db.Column(MoneyType, nullable=False)  # Prix en Ariary (MGA)
     remise = db.Column(db.Float, default=0.0)  # Remise en pourcentage
-    montant_remise = db.Column(db.Float, default=0.0)  # Montant de la remise
-    montant_total = db.Column(db.Float, nullable=False)  # Montant total en Ariary
-    date_vente = db.Column(db.DateTime, default=datetime.utcnow)
+    montant_remise = db.Column(MoneyType, default=0)  # Montant de la remise
+    montant_total = db.Column(MoneyType, nullable=False)  # Montant total en Ariary
+    cout_achat = db.Column(MoneyType)  # Coût d'achat résolu à la vente (FIFO ou coût moyen)
+    date_vente = db.Column(db.DateTime, default=datetime.utcnow, index=True)  # Clé de partition
     statut = db.Column(db.String(20), default='completed')  # completed, cancelled, pending
     notes = db.Column(db.Text)
     
@@ -27,6 +30,9 @@ class Vente(db.Model):
     @property
     def benefice(self):
         """Calcule le bénéfice de cette vente"""
+        if self.cout_achat is not None:
+            return self.montant_total - self.cout_achat
+        
         from models.produit import Produit
         produit = Produit.query.get(self.produit_id)
         if produit:
@@ -35,9 +41,9 @@ class Vente(db.Model):
         return 0
     
     def calculer_montant_total(self):
-        """Calcule et met à jour le montant total avec remise"""
+        """Calcule et met à jour le montant total avec remise (remise arrondie à l'Ariary)"""
         montant_brut = self.quantite * self.prix_unitaire
-        self.montant_remise = montant_brut * (self.remise / 100)
+        self.montant_remise = montant_brut.percentage(self.remise)
         self.montant_total = montant_brut - self.montant_remise
         return self.montant_total
     
@@ -52,8 +58,10 @@ class Vente(db.Model):
             'remise': self.remise,
             'montant_remise': self.montant_remise,
             'montant_total': self.montant_total,
+            'cout_achat': self.cout_achat,
             'date_vente': self.date_vente.isoformat() if self.date_vente else None,
             'statut': self.statut,
+            'magasin_id': self.magasin_id,
             'notes': self.notes,
             'montant_brut': self.montant_brut,
             'benefice': self.benefice
@@ -1,4 +1,4 @@
-from flask import Blueprint, render_template, request, redirect, url_for, flash, jsonify
+from flask import Blueprint, render_template, request, redirect, url_for, flash, jsonify, abort
 from flask_login import login_required, current_user
 from models.vente import Vente
 from models.produit import Produit
@@ -7,6 +7,10 @@ from services.vente_service import VenteService
 from app import db
 from datetime import datetime
 from utils.helpers import format_currency, get_date_range
+from cache import conditional_get
+from partitions import source, find
+from db_routing import current_store
+from services.magasin_service import MagasinService
 
 vente_bp = Blueprint('vente', __name__, url_prefix='/ventes')
 
@@ -19,22 +23,23 @@ def list_ventes():
         period = request.args.get('period', 'month', type=str)
         client_id = request.args.get('client_id', type=int)
         
-        # Construire la requête
-        query = Vente.query
+        # Construire la requête (archives comprises si la période les couvre)
+        date_debut, date_fin = get_date_range(period)
+        source_ventes = source(Vente, date_debut, date_fin)
+        query = db.session.query(source_ventes)
         
         # Filtrer par période
-        date_debut, date_fin = get_date_range(period)
         if date_debut and date_fin:
             query = query.filter(
-                Vente.date_vente >= datetime.combine(date_debut, datetime.min.time()),
-                Vente.date_vente <= datetime.combine(date_fin, datetime.max.time())
+                source_ventes.date_vente >= datetime.combine(date_debut, datetime.min.time()),
+                source_ventes.date_vente <= datetime.combine(date_fin, datetime.max.time())
             )
         
         # Filtrer par client
         if client_id:
-            query = query.filter_by(client_id=client_id)
+            query = query.filter(source_ventes.client_id == client_id)
         
-        ventes = query.order_by(db.desc(Vente.date_vente)).paginate(
+        ventes = query.order_by(db.desc(source_ventes.date_vente)).paginate(
             page=page, per_page=20, error_out=False
         )
         
@@ -105,7 +110,8 @@ def nouvelle_vente():
             quantite=quantite,
             prix_unitaire=prix_unitaire_final,
             remise=remise,
-            notes=notes
+            notes=notes,
+            magasin_id=current_store()
         )
         
         if vente:
@@ -127,7 +133,7 @@ def annuler_vente(id):
     try:
         reason = request.form.get('reason', '').strip()
         
-        success, message = VenteService.cancel_vente(id, reason)
+        success, message = VenteService.cancel_vente(id, reason, magasin_id=current_store())
         
         if success:
             flash(message, "success")
@@ -144,7 +150,7 @@ def annuler_vente(id):
 def detail_vente(id):
     """Retourne les détails d'une vente en JSON"""
     try:
-        vente = Vente.query.get_or_404(id)
+        vente = find(Vente, id) or abort(404)
         
         return jsonify({
             'vente': vente.to_dict(),
@@ -190,36 +196,22 @@ def statistiques_ventes():
 
 @vente_bp.route('/api/daily-sales')
 @login_required
+@conditional_get(tables=('ventes',))
 def api_daily_sales():
     """API pour les ventes quotidiennes (pour les graphiques)"""
     try:
         days = request.args.get('days', 7, type=int)
         daily_sales = VenteService.calculate_daily_sales(days)
         
-        # Transformer pour Chart.js
+        # Séries en colonnes (le style des graphiques est dans les gabarits)
         labels = list(daily_sales.keys())
-        data_montant = [daily_sales[date]['montant'] for date in labels]
-        data_transactions = [daily_sales[date]['transactions'] for date in labels]
         
         return jsonify({
             'labels': labels,
-            'datasets': [
-                {
-                    'label': 'Montant (MGA)',
-                    'data': data_montant,
-                    'borderColor': 'rgb(75, 192, 192)',
-                    'backgroundColor': 'rgba(75, 192, 192, 0.2)',
-                    'tension': 0.1
-                },
-                {
-                    'label': 'Nombre de transactions',
-                    'data': data_transactions,
-                    'borderColor': 'rgb(255, 99, 132)',
-                    'backgroundColor': 'rgba(255, 99, 132, 0.2)',
-                    'tension': 0.1,
-                    'yAxisID': 'y1'
-                }
-            ]
+            'series': {
+                'montant': [daily_sales[date]['montant'] for date in labels],
+                'transactions': [daily_sales[date]['transactions'] for date in labels]
+            }
         })
         
     except Exception as e:
@@ -233,7 +225,7 @@ def get_prix_produit(produit_id):
         produit = Produit.query.get_or_404(produit_id)
         return jsonify({
             'prix_vente': produit.prix_vente,
-            'stock_disponible': produit.stock_actuel
+            'stock_disponible': MagasinService.get_stock(produit)
         })
     except Exception as e:
         return jsonify({'error': str(e)}), 500
@@ -2,23 +2,36 @@ from models.vente import Vente
 from models.produit import Produit
 from models.client import Client
 from services.stock_service import StockService
+from services.lot_service import LotService
+from services.magasin_service import MagasinService
 from app import db
+from db_routing import read_only, in_store, use_store, current_store
+from db_sqlite import serialized_write
+from cache import cached
+from partitions import source
+import metrics
+from events import publish, SaleCreated, SaleCancelled
 from datetime import datetime, timedelta
+from sqlalchemy import update
 
 class VenteService:
     """Service pour la gestion des ventes"""
     
     @staticmethod
+    @serialized_write
+    @in_store
     def create_vente(produit_id, client_id, quantite, prix_unitaire=None, remise=0.0, notes=None):
-        """Crée une nouvelle vente"""
+        """Crée une nouvelle vente dans le magasin `magasin_id` (magasin par défaut si absent)"""
         produit = Produit.query.get(produit_id)
         client = Client.query.get(client_id)
         
         if not produit or not client:
             return None, "Produit ou client non trouvé"
         
-        if produit.stock_actuel < quantite:
-            return None, f"Stock insuffisant. Stock disponible: {produit.stock_actuel}"
+        disponible = MagasinService.get_stock(produit)
+        if disponible < quantite:
+            metrics.count('ventes_refusees_total', 'stock')
+            return None, f"Stock insuffisant dans ce magasin. Stock disponible: {disponible}"
         
         # Utiliser le prix de vente du produit si pas spécifié
         if prix_unitaire is None:
@@ -28,10 +41,12 @@ class VenteService:
         vente = Vente()
         vente.produit_id = produit_id
         vente.client_id = client_id
+        vente.magasin_id = current_store()
         vente.quantite = quantite
         vente.prix_unitaire = prix_unitaire
         vente.remise = remise
         vente.notes = notes
+        vente.date_vente = datetime.utcnow()
         
         # Calculer le montant total
         vente.calculer_montant_total()
@@ -39,9 +54,31 @@ class VenteService:
         try:
             # Sauvegarder la vente
             db.session.add(vente)
+            stock = MagasinService.stock_row(produit)
             
-            # Mettre à jour le stock
+            # Figer le coût d'achat de la vente (lots du magasin)
+            if LotService.fifo_active():
+                db.session.flush()
+                vente.cout_achat = LotService.consume(vente, produit, stock.quantite)
+            else:
+                vente.cout_achat = quantite * produit.prix_achat
+            
+            # Mettre à jour le stock du magasin, le stock global et les cumuls du produit
+            stock.quantite -= quantite
             produit.stock_actuel -= quantite
+            produit.cumuler_vente(vente)
+            
+            metrics.count_on_commit('ventes_total')
+            metrics.count_on_commit('ventes_montant_ariary_total', montant=vente.montant_total)
+            if produit.stock_actuel <= 0:
+                metrics.count_on_commit('ruptures_stock_total')
+            
+            db.session.flush()
+            publish(SaleCreated(
+                date=vente.date_vente, vente_id=vente.id, produit_id=produit.id, client_id=client_id,
+                quantite=quantite, montant_total=int(vente.montant_total),
+                stock_restant=produit.stock_actuel, seuil_alerte=produit.seuil_alerte, magasin_id=vente.magasin_id
+            ))
             
             db.session.commit()
             return vente, "Vente créée avec succès"
@@ -53,33 +90,39 @@ class VenteService:
     @staticmethod
     def get_ventes_by_period(date_debut=None, date_fin=None):
         """Retourne les ventes pour une période donnée"""
-        query = Vente.query
+        ventes = source(Vente, date_debut, date_fin)
+        query = db.session.query(ventes)
         
         if date_debut:
-            query = query.filter(Vente.date_vente >= date_debut)
+            query = query.filter(ventes.date_vente >= date_debut)
         if date_fin:
-            query = query.filter(Vente.date_vente <= date_fin)
+            query = query.filter(ventes.date_vente <= date_fin)
         
-        return query.order_by(db.desc(Vente.date_vente)).all()
+        return query.order_by(db.desc(ventes.date_vente)).all()
     
     @staticmethod
     def get_ventes_by_client(client_id):
         """Retourne les ventes d'un client"""
-        return Vente.query.filter_by(client_id=client_id).order_by(db.desc(Vente.date_vente)).all()
+        ventes = source(Vente)
+        return db.session.query(ventes).filter(ventes.client_id == client_id).order_by(db.desc(ventes.date_vente)).all()
     
     @staticmethod
     def get_ventes_by_product(produit_id):
         """Retourne les ventes d'un produit"""
-        return Vente.query.filter_by(produit_id=produit_id).order_by(db.desc(Vente.date_vente)).all()
+        ventes = source(Vente)
+        return db.session.query(ventes).filter(ventes.produit_id == produit_id).order_by(db.desc(ventes.date_vente)).all()
     
     @staticmethod
+    @cached(tables=('ventes',))
+    @read_only
     def calculate_daily_sales(days=7):
         """Calcule les ventes quotidiennes sur les derniers jours"""
         date_debut = datetime.utcnow() - timedelta(days=days)
+        source_ventes = source(Vente, date_debut)
         
-        ventes = Vente.query.filter(
-            Vente.date_vente >= date_debut,
-            Vente.statut == 'completed'
+        ventes = db.session.query(source_ventes).filter(
+            source_ventes.date_vente >= date_debut,
+            source_ventes.statut == 'completed'
         ).all()
         
         sales_by_day = {}
@@ -97,20 +140,23 @@ class VenteService:
         return sales_by_day
     
     @staticmethod
+    @cached(tables=('ventes', 'produits'))
+    @read_only
     def get_top_selling_products(limit=10, days=30):
         """Retourne les produits les plus vendus"""
         date_debut = datetime.utcnow() - timedelta(days=days)
+        ventes = source(Vente, date_debut)
         
         # Agrégation des ventes par produit
         results = db.session.query(
-            Vente.produit_id,
-            db.func.sum(Vente.quantite).label('total_quantite'),
-            db.func.sum(Vente.montant_total).label('total_montant'),
-            db.func.count(Vente.id).label('nombre_ventes')
+            ventes.produit_id,
+            db.func.sum(ventes.quantite).label('total_quantite'),
+            db.func.sum(ventes.montant_total).label('total_montant'),
+            db.func.count(ventes.id).label('nombre_ventes')
         ).filter(
-            Vente.date_vente >= date_debut,
-            Vente.statut == 'completed'
-        ).group_by(Vente.produit_id).order_by(db.desc('total_quantite')).limit(limit).all()
+            ventes.date_vente >= date_debut,
+            ventes.statut == 'completed'
+        ).group_by(ventes.produit_id).order_by(db.desc('total_quantite')).limit(limit).all()
         
         top_products = []
         for result in results:
@@ -126,14 +172,17 @@ class VenteService:
         return top_products
     
     @staticmethod
+    @cached(tables=('ventes', 'produits'))
+    @read_only
     def get_sales_summary(date_debut=None, date_fin=None):
         """Retourne un résumé des ventes"""
-        query = Vente.query.filter_by(statut='completed')
+        source_ventes = source(Vente, date_debut, date_fin)
+        query = db.session.query(source_ventes).filter(source_ventes.statut == 'completed')
         
         if date_debut:
-            query = query.filter(Vente.date_vente >= date_debut)
+            query = query.filter(source_ventes.date_vente >= date_debut)
         if date_fin:
-            query = query.filter(Vente.date_vente <= date_fin)
+            query = query.filter(source_ventes.date_vente <= date_fin)
         
         ventes = query.all()
         
@@ -154,25 +203,121 @@ class VenteService:
         }
     
     @staticmethod
-    def cancel_vente(vente_id, reason=None):
-        """Annule une vente et remet le stock"""
-        vente = Vente.query.get(vente_id)
+    def _derniere_vente(produit_id):
+        """Date de la dernière vente validée d'un produit, archives et tous magasins compris"""
+        def derniere():
+            ventes = source(Vente)
+            return db.session.query(db.func.max(ventes.date_vente)).filter(
+                ventes.produit_id == produit_id,
+                ventes.statut == 'completed'
+            ).scalar()
+        dates = [date for date in MagasinService.across_databases(derniere).values() if date is not None]
+        return max(dates, default=None)
+    
+    @staticmethod
+    def recompute_product_totals():
+        """Recalcule les cumuls de ventes de tous les produits (reprise, contrôle)
+        
+        Une agrégation groupée sur les ventes validées, archives comprises,
+        dans chaque base (primaire et bases de magasins), fusionnée puis
+        appliquée par une mise à jour groupée; retourne le nombre de produits.
+        Sans jointure sur produits, absente des bases de magasins: le coût
+        des ventes sans coût figé est valorisé ici au prix d'achat courant.
+        """
+        def agreger():
+            ventes = source(Vente)
+            return db.session.query(
+                ventes.produit_id,
+                db.func.sum(ventes.quantite).label('quantite'),
+                db.func.sum(ventes.montant_total).label('montant'),
+                db.func.sum(ventes.montant_total - db.func.coalesce(ventes.cout_achat, 0)).label('marge'),
+                db.func.sum(db.case((ventes.cout_achat.is_(None), ventes.quantite), else_=0)).label('sans_cout'),
+                db.func.max(ventes.date_vente).label('derniere')
+            ).filter(ventes.statut == 'completed').group_by(ventes.produit_id).all()
+        
+        totaux = {}
+        for resultats in MagasinService.across_databases(agreger).values():
+            for resultat in resultats:
+                total = totaux.setdefault(resultat.produit_id, {
+                    'quantite_vendue': 0, 'montant_ventes': 0, 'marge': 0, 'sans_cout': 0, 'date_derniere_vente': None
+                })
+                total['quantite_vendue'] += resultat.quantite or 0
+                total['montant_ventes'] += resultat.montant or 0
+                total['marge'] += resultat.marge or 0
+                total['sans_cout'] += resultat.sans_cout or 0
+                total['date_derniere_vente'] = max(
+                    filter(None, (total['date_derniere_vente'], resultat.derniere)), default=None
+                )
+        
+        produits = db.session.query(Produit.id, Produit.prix_achat).all()
+        try:
+            db.session.execute(update(Produit), [
+                {
+                    'id': produit_id,
+                    'quantite_vendue': totaux[produit_id]['quantite_vendue'] if produit_id in totaux else 0,
+                    'montant_ventes': totaux[produit_id]['montant_ventes'] if produit_id in totaux else 0,
+                    'benefice_ventes': (
+                        totaux[produit_id]['marge'] - totaux[produit_id]['sans_cout'] * prix_achat
+                        if produit_id in totaux else 0
+                    ),
+                    'date_derniere_vente': totaux[produit_id]['date_derniere_vente'] if produit_id in totaux else None
+                }
+                for produit_id, prix_achat in produits
+            ])
+            db.session.commit()
+        except Exception:
+            db.session.rollback()
+            raise
+        return len(produits)
+    
+    @staticmethod
+    @serialized_write
+    def cancel_vente(vente_id, reason=None, magasin_id=None):
+        """Annule une vente et remet le stock de son magasin
+        
+        `magasin_id` n'est requis que pour la vente d'un magasin qui a sa propre base.
+        """
+        with use_store(magasin_id):
+            vente = Vente.query.get(vente_id)
         if not vente:
             return False, "Vente non trouvée"
         
         if vente.statut == 'cancelled':
             return False, "Vente déjà annulée"
         
+        with use_store(vente.magasin_id or MagasinService.default_store_id()):
+            return VenteService._annuler_vente(vente, reason)
+    
+    @staticmethod
+    def _annuler_vente(vente, reason):
+        """Annulation dans le contexte du magasin de la vente"""
         try:
-            # Remettre le stock
+            # Remettre le stock du magasin et le stock global
             produit = vente.produit_rel
+            MagasinService.stock_row(produit).quantite += vente.quantite
             produit.stock_actuel += vente.quantite
             
-            # Marquer comme annulée
+            # Remettre les quantités dans leurs lots FIFO d'origine
+            LotService.restore_vente(vente)
+            
+            # Retirer la vente des cumuls du produit puis la marquer comme annulée
+            validee = vente.statut == 'completed'
+            if validee:
+                produit.cumuler_vente(vente, sens=-1)
             vente.statut = 'cancelled'
             if reason:
                 vente.notes = f"Annulée: {reason}. {vente.notes or ''}"
+            if validee and produit.date_derniere_vente == vente.date_vente:
+                db.session.flush()
+                produit.date_derniere_vente = VenteService._derniere_vente(produit.id)
             
+            metrics.count_on_commit('ventes_annulees_total')
+            publish(SaleCancelled(
+                date=datetime.utcnow(), vente_id=vente.id, produit_id=produit.id,
+                quantite=vente.quantite, montant_total=int(vente.montant_total), date_vente=vente.date_vente,
+                stock_restant=produit.stock_actuel, seuil_alerte=produit.seuil_alerte, motif=reason,
+                magasin_id=vente.magasin_id
+            ))
             db.session.commit()
             return True, "Vente annulée avec succès"
             